@@ -1,3 +1,3 @@
-from alarms import AlarmMigrator
+from alarms import AlarmMigrator, MigratedAlarm
 
-__all__ = ["AlarmMigrator"]
+__all__ = ["AlarmMigrator", "MigratedAlarm"]
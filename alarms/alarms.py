@@ -1,9 +1,11 @@
 import pprint
 
 from translator import translate
+from preflight import payload_key
 
 import utils
 import logging
+log = logging.getLogger('maas_migration')
 
 from copy import copy
 
@@ -38,15 +40,28 @@ class MigratedAlarm(object):
                 continue
             return alarm
 
+    def test_key(self):
+        """
+        hash of what test_alarm runs - the criteria against the check's test
+        """
+        return payload_key({'check': self.migrated_check.test_key(), 'criteria': self._alarm_cache['criteria']})
+
     def test(self):
         valid, msg, results = self.migrated_check.test()
         if not valid:
             return False, 'Check test failed', results
 
-        print pprint.pformat(results)
+        test_cache = self.migrated_check.migrated_entity.migrator.test_cache
+        key = self.test_key()
+        alarm_result = test_cache.get(key)
+        if alarm_result is not None:
+            return True, 'Alarm test successful (cached)', alarm_result
+
+        log.debug(pprint.pformat(results))
 
         # BUG: check results need moniitoring_zone_id and status for the alarm test to work, agent
         #      checks do not provide this.
+        results = [copy(r) for r in results]
         for r in results:
             if not r.get('monitoring_zone_id'):
                 r['monitoring_zone_id'] = 'mzdfw'
@@ -58,6 +73,7 @@ class MigratedAlarm(object):
             if r['state'] != 'OK':
                 return False, 'Alarm test failed', alarm_result
 
+        test_cache.add(key, alarm_result)
         return True, 'Alarm test successful', alarm_result
 
     def save(self, commit=True):
@@ -106,7 +122,11 @@ class AlarmMigrator(object):
         self.rs_api = self.migrator.rs_api
 
         self.auto = self.migrator.options.auto
+        self.journal = self.migrator.journal
         self.no_test = self.migrator.options.no_test
+        self.concurrency = self.migrator.options.concurrency
+        self.test_concurrency = self.migrator.options.test_concurrency
+        self.review = utils.Review('alarms', auto=self.auto, batch=self.migrator.options.batch)
 
         self.consistency_level = self.migrator.config.get('alarm_consistency_level', 'QUORUM')
 
@@ -117,33 +137,93 @@ class AlarmMigrator(object):
         self.logger.info('Cloudkick monitor or alarms will not be created. (You can do this in Cloudkick')
         self.logger.info('and re-run the script)\n')
 
+        queue = utils.WorkQueue(self.concurrency)
+        pending = []
+        alarms = []
+
         for migrated_entity in self.migrator.migrated_entities:
             for migrated_check in migrated_entity.migrated_checks:
 
-                alarm = MigratedAlarm.create_from_migrated_check(migrated_check)
-
-                self.logger.info('Node: %s' % migrated_check.ck_node)
-                self.logger.info('Check: %s' % migrated_check.ck_check)
+                # migrated by a previous run
+                rs_alarm = self.journal.get('alarm', migrated_check.ck_check.id, self.rs_api)
+                if rs_alarm:
+                    pending.append((migrated_check, rs_alarm, 'Journaled', None))
+                    continue
 
+                alarm = MigratedAlarm.create_from_migrated_check(migrated_check)
                 if not alarm:
-                    self.logger.info('No alarm to create\n')
+                    pending.append((migrated_check, None, None, None))
                     continue
 
-                self.logger.info('Alarm: %s' % alarm)
-                self.logger.debug('Alarm Criteria:\n%s' % alarm._alarm_cache['criteria'])
                 action, result = alarm.save(commit=False)
-                if action in ['Created', 'Updated']:
-                    if not self.no_test:
-                        valid, msg, results = alarm.test()
-                        self.logger.info(msg)
-                        self.logger.debug('%s' % (pprint.pformat(results)))
-                        if not valid:
-                            if utils.get_input('Ignore this alarm?', options=['y', 'n'], default='y') == 'y':
-                                continue
-                    if self.auto or utils.get_input('Save this alarm?', options=['y', 'n'], default='y') == 'y':
-                        action, _ = alarm.save()
-                        self.logger.info('%s alarm %s' % (action, alarm.rs_alarm.id))
-                else:
-                    self.logger.info('No update needed for alarm %s' % alarm.rs_alarm.id)
+                pending.append((migrated_check, alarm, action, result))
+
+        # run the live tests together, the check tests mostly come from the check phase
+        tests = {}
+        if not self.no_test:
+            to_test = [alarm for _, alarm, action, _ in pending if action in ['Created', 'Updated']]
+            if to_test:
+                self.logger.info('Testing %s alarms...\n' % len(to_test))
+            test_queue = utils.WorkQueue(self.test_concurrency)
+            for alarm in to_test:
+                test_queue.add(alarm.test)
+            for alarm, (result, e) in zip(to_test, test_queue.results()):
+                tests[alarm] = result if not e else (False, 'Alarm test failed - Exception:\n%s' % e, None)
+
+        for migrated_check, alarm, action, result in pending:
+
+            self.logger.info('Node: %s' % migrated_check.ck_node)
+            self.logger.info('Check: %s' % migrated_check.ck_check)
+
+            if action == 'Journaled':
+                self.logger.info('Already migrated to alarm %s\n' % alarm.id)
+                continue
+
+            if not alarm:
+                self.logger.info('No alarm to create\n')
+                continue
 
-                self.logger.info('')
+            self.logger.info('Alarm: %s' % alarm)
+            self.logger.debug('Alarm Criteria:\n%s' % alarm._alarm_cache['criteria'])
+            if action in ['Created', 'Updated']:
+                if action == 'Created':
+                    group = 'create for %s checks' % migrated_check.type
+                else:
+                    group = 'update %s' % utils.diff_shape(result, alarm.rs_alarm)
+                default = 'y'
+
+                if not self.no_test:
+                    valid, msg, results = tests[alarm]
+                    self.logger.info(msg)
+                    self.logger.debug('%s' % (pprint.pformat(results)))
+                    if not valid:
+                        if self.review.batch and not self.auto:
+                            group, default = '%s (test failed)' % group, 'n'
+                        elif utils.get_input('Ignore this alarm?', options=['y', 'n'], default='y') == 'y':
+                            continue
+                if self.review.propose('Save this alarm?', group, alarm, alarm, default=default):
+                    queue.add(alarm.save)
+                    alarms.append(alarm)
+            else:
+                self.logger.info('No update needed for alarm %s' % alarm.rs_alarm.id)
+                self.journal.add('alarm', migrated_check.ck_check.id, alarm.rs_alarm, action)
+
+            self.logger.info('')
+
+        for alarm in self.review.decide():
+            queue.add(alarm.save)
+            alarms.append(alarm)
+
+        # every check exists by now, so the saves can go out together. results
+        # come back in the order they were queued. every save that went through
+        # is journaled before the first one that failed is raised
+        error = None
+        for alarm, (result, e) in zip(alarms, queue.results()):
+            if e:
+                error = error or e
+                continue
+            action, _ = result
+            self.journal.add('alarm', alarm.migrated_check.ck_check.id, alarm.rs_alarm, action)
+            self.logger.info('%s alarm %s' % (action, alarm.rs_alarm.id))
+        if error:
+            utils.reraise(error)
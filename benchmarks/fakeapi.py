@@ -0,0 +1,323 @@
+"""
+fakeapi.py - a local stand-in for the Cloudkick 2.0 and Rackspace Monitoring
+1.0 APIs, so a whole migration can run offline.
+
+One HTTP/1.1 server answers both:
+
+    POST /v2.0/tokens                    identity, hands out a token and a catalog
+    GET  /2.0/nodes, checks, monitors    the Cloudkick account (read only)
+    /v1.0/<tenant>/...                   entities, checks, alarms, notifications,
+                                         notification plans, views/overview,
+                                         test-check, test-alarm and limits
+
+The Cloudkick account is generated from its size (nodes, checks per node,
+monitors), the Rackspace account starts out empty and keeps whatever is
+written to it. Lists are paged with marker/limit like the real API, writes
+answer with a Location header. Every request sleeps `latency` seconds first,
+standing in for the round trip to the real API.
+
+Requests are counted per API ('auth', 'cloudkick', 'rackspace') in
+server.requests.
+"""
+import json
+import time
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from collections import OrderedDict
+
+TENANT_ID = '123456'
+
+# CK check type -> details, cycled through for every node's checks
+CK_CHECK_TYPES = [
+    ('PING', {}),
+    ('HTTP', {'url': 'http://example.com/', 'code': '200'}),
+    ('SSH', {'port': 22}),
+    ('TCP', {'port': 25, 'banner_match': 'ESMTP'}),
+    ('DISK', {'path': '/', 'fs_critical': 90, 'fs_warn': 80})
+]
+
+# collection name -> (id prefix, defaults the API fills in)
+_kinds = {
+    'entities': ('en', {'label': None, 'ip_addresses': {}, 'metadata': {}, 'agent_id': None,
+                        'managed': False, 'uri': None}),
+    'checks': ('ch', {'label': None, 'timeout': 30, 'period': 60, 'monitoring_zones_poll': [],
+                      'target_alias': None, 'target_hostname': None, 'target_resolver': None,
+                      'details': {}, 'disabled': False, 'metadata': {}}),
+    'alarms': ('al', {'label': None, 'check_id': None, 'criteria': None,
+                      'notification_plan_id': None, 'metadata': {}}),
+    'notifications': ('nt', {'label': None, 'details': {}}),
+    'notification_plans': ('np', {'label': None, 'critical_state': [], 'warning_state': [],
+                                  'ok_state': []})
+}
+
+
+class FakeAccount(object):
+    """
+    a Cloudkick account of a given size, generated up front
+    """
+
+    def __init__(self, nodes=100, checks_per_node=3, monitors=10):
+        self.monitors = []
+        for i in range(monitors):
+            self.monitors.append({
+                'id': 'm%05d' % i,
+                'name': 'monitor%s' % i,
+                'notification_receivers': [
+                    {'type': {'code': 1, 'description': 'email'}, 'name': 'ops',
+                     'details': {'email_address': 'ops%s@example.com' % (i % 3)}}
+                ]
+            })
+
+        self.nodes = []
+        self.checks = {}  # node id -> checks
+        for i in range(nodes):
+            node_id = 'n%06d' % i
+            ip = '10.%s.%s.%s' % (i >> 16 & 255, i >> 8 & 255, i & 255)
+            self.nodes.append({
+                'id': node_id,
+                'name': 'node%s' % i,
+                'ipaddress': ip,
+                'public_ips': [ip],
+                'private_ips': ['192.168.%s.%s' % (i >> 8 & 255, i & 255)],
+                'is_active': True
+            })
+
+            checks = []
+            for j in range(checks_per_node):
+                type, details = CK_CHECK_TYPES[j % len(CK_CHECK_TYPES)]
+                checks.append({
+                    'id': 'c%06d%02d' % (i, j),
+                    'node_id': node_id,
+                    'monitor_id': self.monitors[(i + j) % monitors]['id'],
+                    'type': {'code': j, 'description': type},
+                    'details': dict(details),
+                    'is_enabled': True
+                })
+            self.checks[node_id] = checks
+
+
+class FakeAPIServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, account=None, latency=0.0, page_size=100):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FakeAPIHandler)
+        self.account = account or FakeAccount()
+        self.latency = latency
+        self.page_size = page_size
+
+        self.requests = {'auth': 0, 'cloudkick': 0, 'rackspace': 0}
+        self.lock = threading.Lock()
+
+        # collection path (a tuple) -> id -> object
+        self.collections = {
+            ('entities',): OrderedDict(),
+            ('notifications',): OrderedDict(),
+            ('notification_plans',): OrderedDict()
+        }
+        self._next_id = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.01,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, api):
+        with self.lock:
+            self.requests[api] += 1
+
+    # rackspace store, callers hold self.lock
+
+    def create(self, path, data):
+        prefix, defaults = _kinds[path[-1]]
+        self._next_id += 1
+        obj_id = '%s%08d' % (prefix, self._next_id)
+
+        obj = dict(defaults)
+        obj.update(data)
+        obj['id'] = obj_id
+        self.collections[path][obj_id] = obj
+
+        if path == ('entities',):
+            self.collections[('entities', obj_id, 'checks')] = OrderedDict()
+            self.collections[('entities', obj_id, 'alarms')] = OrderedDict()
+        return obj_id
+
+    def delete(self, path, obj_id):
+        del self.collections[path][obj_id]
+        if path == ('entities',):
+            del self.collections[('entities', obj_id, 'checks')]
+            del self.collections[('entities', obj_id, 'alarms')]
+
+    def page(self, values, marker, limit):
+        """
+        (values from marker on, next marker)
+        """
+        start = 0
+        if marker:
+            ids = [v['id'] for v in values]
+            start = ids.index(marker) if marker in ids else len(ids)
+        next_marker = None
+        if start + limit < len(values):
+            next_marker = values[start + limit]['id']
+        return values[start:start + limit], next_marker
+
+
+class FakeAPIHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers are written one by one, don't let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        body = json.dumps(body) if body is not None else ''
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('content-length') or 0)
+        return self.rfile.read(length) if length else ''
+
+    def _dispatch(self, method):
+        url = urlparse.urlsplit(self.path)
+        self.query = dict(urlparse.parse_qsl(url.query))
+        body = self._read_body()
+        chunks = [c for c in url.path.split('/') if c]
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if chunks[:2] == ['v2.0', 'tokens']:
+            self.server.count('auth')
+            self._auth()
+        elif chunks[:1] == ['2.0']:
+            self.server.count('cloudkick')
+            self._cloudkick(chunks[1:])
+        elif chunks[:2] == ['v1.0', TENANT_ID]:
+            self.server.count('rackspace')
+            data = json.loads(body) if body and method in ['POST', 'PUT'] else {}
+            self._rackspace(method, tuple(chunks[2:]), data)
+        else:
+            self._send(404, {'type': 'notFoundError', 'message': 'no such endpoint: %s' % url.path})
+
+    def _auth(self):
+        expires = time.strftime('%Y-%m-%dT%H:%M:%S.000-00:00', time.gmtime(time.time() + 86400))
+        self._send(200, {'access': {
+            'token': {'id': 'faketoken', 'expires': expires},
+            'serviceCatalog': [{'type': 'compute', 'name': 'cloudServers',
+                                'endpoints': [{'tenantId': TENANT_ID,
+                                               'publicURL': '%s/v1.0/%s' % (self.server.url, TENANT_ID)}]}],
+            'user': {'id': 'fakeuser', 'name': 'user'}}})
+
+    def _cloudkick(self, chunks):
+        account = self.server.account
+        if chunks == ['nodes']:
+            items = account.nodes
+        elif chunks == ['monitors']:
+            items = account.monitors
+        elif chunks == ['checks']:
+            node_ids = self.query.get('node_ids')
+            node_ids = node_ids.split(',') if node_ids else [n['id'] for n in account.nodes]
+            items = []
+            for node_id in node_ids:
+                items.extend(account.checks.get(node_id, []))
+        else:
+            self._send(404, {'message': 'no such endpoint'})
+            return
+        self._send(200, {'items': items, 'offset': 0, 'count': len(items)})
+
+    def _location(self, path):
+        return '%s/v1.0/%s/%s' % (self.server.url, TENANT_ID, '/'.join(path))
+
+    def _list(self, values):
+        limit = int(self.query.get('limit', self.server.page_size))
+        values, next_marker = self.server.page(values, self.query.get('marker'), limit)
+        self._send(200, {'values': values,
+                         'metadata': {'count': len(values), 'limit': limit,
+                                      'marker': self.query.get('marker'), 'next_marker': next_marker}})
+
+    def _rackspace(self, method, path, data):
+        server = self.server
+        collections = server.collections
+
+        if path == ('limits',):
+            self._send(200, {'resource': {},
+                             'rate': {'global': {'limit': 1000000, 'used': 0, 'window': '24.0 hours'}}})
+        elif path == ('views', 'overview'):
+            with server.lock:
+                values = []
+                for entity_id, entity in collections[('entities',)].items():
+                    values.append({'entity': entity,
+                                   'checks': collections[('entities', entity_id, 'checks')].values(),
+                                   'alarms': collections[('entities', entity_id, 'alarms')].values(),
+                                   'latest_alarm_states': []})
+            self._list(values)
+        elif len(path) == 3 and path[2] == 'test-check':
+            zones = data.get('monitoring_zones_poll') or [None]
+            self._send(200, [{'timestamp': int(time.time() * 1000), 'monitoring_zone_id': zone,
+                              'available': True, 'status': 'okay', 'metrics': {}} for zone in zones])
+        elif len(path) == 3 and path[2] == 'test-alarm':
+            self._send(200, [{'timestamp': int(time.time() * 1000), 'state': 'OK',
+                              'status': 'Everything is fine'} for r in data.get('check_data') or [None]])
+        elif path in collections:
+            if method == 'GET':
+                with server.lock:
+                    values = collections[path].values()
+                self._list(values)
+            elif method == 'POST':
+                for k in ['who', 'why']:
+                    data.pop(k, None)
+                with server.lock:
+                    obj_id = server.create(path, data)
+                self._send(201, headers={'Location': self._location(path + (obj_id,))})
+            else:
+                self._send(405, {'message': 'method not allowed'})
+        elif path[:-1] in collections and path[-1] in collections[path[:-1]]:
+            collection = collections[path[:-1]]
+            if method == 'GET':
+                self._send(200, collection[path[-1]])
+            elif method == 'PUT':
+                with server.lock:
+                    collection[path[-1]].update(data)
+                self._send(204, headers={'Location': self._location(path)})
+            elif method == 'DELETE':
+                with server.lock:
+                    server.delete(path[:-1], path[-1])
+                self._send(204)
+            else:
+                self._send(405, {'message': 'method not allowed'})
+        else:
+            self._send(404, {'type': 'notFoundError', 'code': 404, 'message': 'Object does not exist',
+                             'details': '/%s' % '/'.join(path)})
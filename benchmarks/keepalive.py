@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+keepalive.py - compare new-connection-per-request against the pooled keep-alive
+transport in libcloud's Connection, against a local HTTP/1.1 server.
+
+Every accepted TCP connection stands in for a TCP+TLS handshake against the
+monitoring API.
+
+usage: python benchmarks/keepalive.py [-n REQUESTS] [-t THREADS] [-k MAX_KEEPALIVE]
+"""
+import os
+import sys
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path = [ROOT_DIR, os.path.join(ROOT_DIR, "extern")] + sys.path
+
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from optparse import OptionParser
+
+from libcloud.common.base import Connection, ConnectionPool
+
+import utils
+
+
+class CountingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, max_keepalive):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), CountingHandler)
+        self.max_keepalive = max_keepalive
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class CountingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers are written one by one, don't let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.served = 0
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        body = '{"values": [], "metadata": {"next_marker": null}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        with self.server.lock:
+            self.server.requests += 1
+
+        # drop the socket without a "Connection: close", like a server timing
+        # out an idle keep-alive connection
+        self.served += 1
+        if self.server.max_keepalive and self.served >= self.server.max_keepalive:
+            self.close_connection = 1
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDriver(object):
+    name = 'keepalive benchmark'
+
+
+def run(port, requests, threads, pool):
+    conn = Connection(secure=False, host='127.0.0.1', port=port)
+    conn.driver = FakeDriver()
+    conn.connection_pool = pool
+
+    start = time.time()
+    queue = utils.WorkQueue(threads)
+    for i in range(requests):
+        queue.add(conn.request, '/v1.0/entities')
+
+    for _, e in queue.results():
+        if e:
+            utils.reraise(e)
+    return time.time() - start
+
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options]')
+    parser.add_option('-n', '--requests', type='int', dest='requests', default=1000)
+    parser.add_option('-t', '--threads', type='int', dest='threads', default=4)
+    parser.add_option('-k', '--max-keepalive', type='int', dest='max_keepalive', default=100,
+                      help='requests the server answers per connection before dropping it (0: unlimited)')
+    (options, args) = parser.parse_args()
+
+    print '%-10s %10s %12s %10s' % ('transport', 'requests', 'connections', 'seconds')
+    for name, pool in [('new', None), ('pooled', ConnectionPool())]:
+        server = CountingServer(options.max_keepalive)
+        t = threading.Thread(target=server.serve_forever)
+        t.daemon = True
+        t.start()
+
+        elapsed = run(server.server_address[1], options.requests, options.threads, pool)
+        print '%-10s %10d %12d %10.2f' % (name, server.requests, server.connections, elapsed)
+
+        if pool:
+            pool.close()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
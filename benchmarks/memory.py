@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+memory.py - the memory a migration keeps alive per Cloudkick node and check
+
+Builds the objects Migrator.migrated_entities ends up holding for a fake
+account (see fakeapi.py): the wrapped Cloudkick nodes and checks, read the
+way CloudkickApi reads them, and the Rackspace entities, checks, alarms and
+notifications the driver hands back for them. The raw API responses are
+dropped first, like they are after a real read.
+
+Every object reachable from each kind is counted once (sys.getsizeof),
+kinds in the order below, so what a check shares with its node counts for
+the node. The driver, the APIs and classes aren't counted.
+
+usage: python benchmarks/memory.py [-n NODES] [-k CHECKS_PER_NODE] [-m MONITORS]
+"""
+import os
+import sys
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path = [ROOT_DIR, os.path.join(ROOT_DIR, "extern")] + sys.path
+
+import gc
+import json
+import types
+import resource
+
+from optparse import OptionParser
+
+from cloudkick_api.wrapper import CloudkickApi
+from cloudkick_snapshot import CloudkickSnapshot
+from rackspace_monitoring.providers import get_driver
+from rackspace_monitoring.types import Provider
+
+from fakeapi import FakeAccount, FakeAPIServer
+
+
+def fresh(obj):
+    """
+    obj as if it had been parsed from an API response, no shared strings
+    """
+    return json.loads(json.dumps(obj))
+
+
+def read_cloudkick(account):
+    """
+    the wrapped nodes and checks, and the CloudkickApi they came from
+    """
+    snapshot = CloudkickSnapshot()
+    snapshot.nodes = dict((n['id'], n) for n in fresh(account.nodes))
+    snapshot.checks = fresh(account.checks)
+    snapshot.monitors = dict((m['id'], m) for m in fresh(account.monitors))
+
+    ck = CloudkickApi('key', 'secret', api_server='127.0.0.1:1')
+    ck.use_snapshot(snapshot)
+    ck_nodes = ck.list_nodes()
+    ck.prefetch_checks(ck_nodes)
+    ck_checks = [ck.list_checks(ck_node) for ck_node in ck_nodes]
+
+    ck._snapshot = None
+    return ck, ck_nodes, ck_checks
+
+
+def build_rackspace(driver, ck_nodes, ck_checks):
+    """
+    what the driver returns for the entity, checks, alarms and notifications
+    of every node, built from API representations the way it lists them
+    """
+    entities, checks, alarms, notifications = [], [], [], {}
+    for ck_node, node_checks in zip(ck_nodes, ck_checks):
+        entity = driver._to_entity(fresh({
+            'id': 'en' + ck_node.id, 'label': ck_node.label, 'agent_id': ck_node.agent_id,
+            'ip_addresses': ck_node.ip_addresses, 'metadata': {'ck_node_id': ck_node.id}}), {})
+        entities.append(entity)
+
+        for ck_check in node_checks:
+            check = driver._to_check(fresh({
+                'id': 'ch' + ck_check.id, 'label': ck_check.label, 'type': 'remote.ping', 'timeout': 30,
+                'period': 60, 'details': ck_check.details, 'monitoring_zones_poll': ['mzord', 'mzdfw', 'mzlon'],
+                'target_alias': 'public0_v4', 'disabled': False, 'metadata': {'ck_check_id': ck_check.id}}),
+                {'entity_id': entity.id})
+            checks.append(check)
+
+            alarms.append(driver._to_alarm(fresh({
+                'id': 'al' + ck_check.id, 'label': ck_check.label, 'check_id': check.id,
+                'criteria': 'if (metric["available"] < 80) { return new AlarmStatus(CRITICAL); }',
+                'notification_plan_id': 'np' + ck_check.monitor.id, 'metadata': {'ck_check_id': ck_check.id}}),
+                {'entity_id': entity.id}))
+
+            for n in ck_check.monitor.get_notifications():
+                if n.address not in notifications:
+                    notifications[n.address] = driver._to_notification(fresh({
+                        'id': 'nt' + n.address, 'label': n.name, 'type': 'email',
+                        'details': {'address': n.address}}), {})
+
+    return entities, checks, alarms, notifications.values()
+
+
+def retained(roots, seen):
+    """
+    (objects, bytes) reachable from roots and not in seen, adds them to seen
+    """
+    count = size = 0
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        count += 1
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return count, size
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024.0 / 1024.0
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options]')
+    parser.add_option('-n', '--nodes', type='int', dest='nodes', default=10000)
+    parser.add_option('-k', '--checks-per-node', type='int', dest='checks_per_node', default=10)
+    parser.add_option('-m', '--monitors', type='int', dest='monitors', default=50)
+    (options, args) = parser.parse_args()
+
+    account = FakeAccount(options.nodes, options.checks_per_node, options.monitors)
+
+    # the driver authenticates when it's created, that's all the server is for
+    server = FakeAPIServer(account).start()
+    try:
+        driver = get_driver(Provider.RACKSPACE)('user', 'key', ex_force_base_url='%s/v1.0' % server.url,
+                                                ex_force_auth_url='%s/v2.0' % server.url, ex_refetch=False)
+    finally:
+        server.stop()
+
+    gc.collect()
+    start = rss_mb()
+    ck, ck_nodes, ck_checks = read_cloudkick(account)
+    entities, checks, alarms, notifications = build_rackspace(driver, ck_nodes, ck_checks)
+    gc.collect()
+    end = rss_mb()
+
+    # the driver, the API and the interpreter's own objects aren't part of the model
+    seen = set([id(driver), id(ck), id(ck.conn), id(None), id(True), id(False)])
+    print '%-24s %10s %10s %12s %10s' % ('', 'count', 'objects', 'MB', 'bytes/each')
+    total = 0
+    for name, roots in [('cloudkick nodes', ck_nodes),
+                        ('cloudkick checks', [c for node_checks in ck_checks for c in node_checks]),
+                        ('rackspace entities', entities),
+                        ('rackspace checks', checks),
+                        ('rackspace alarms', alarms),
+                        ('rackspace notifications', notifications)]:
+        count, size = retained(roots, seen)
+        total += size
+        print '%-24s %10d %10d %12.1f %10d' % (name, len(roots), count, size / 1024.0 / 1024.0,
+                                               size / max(len(roots), 1))
+    print '%-24s %10s %10s %12.1f' % ('total', '', '', total / 1024.0 / 1024.0)
+    print '%-24s %10s %10s %12.1f' % ('rss growth', '', '', end - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+migration.py - run Migrator.migrate() against the fake Cloudkick and Rackspace
+APIs (see fakeapi.py) for accounts of growing size, and report the requests
+each API served, the wall time and the peak RSS of the migration.
+
+Every size runs in a fresh process, so peak RSS is that size's alone. The
+fake server runs in this process and isn't part of it.
+
+usage: python benchmarks/migration.py [-n 100,1000,10000] [-l LATENCY] [--concurrency N] [--test] [--pipeline] [--stream]
+"""
+import os
+import sys
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path = [ROOT_DIR, os.path.join(ROOT_DIR, "extern")] + sys.path
+
+import json
+import time
+import resource
+import subprocess
+
+from optparse import OptionParser
+
+from fakeapi import FakeAccount, FakeAPIServer
+
+
+def run_migration(url, options):
+    """
+    the migration itself, run in a child process. returns its stats
+    """
+    from rackspace_monitoring.providers import get_driver
+    from rackspace_monitoring.types import Provider
+    from cloudkick_api.wrapper import CloudkickApi
+
+    import utils
+    from migrate import Migrator
+
+    utils.setup_logging('ERROR')
+
+    start = time.time()
+    # set up like utils.setup_rs and utils.setup_ck
+    rs = get_driver(Provider.RACKSPACE)('user', 'key', ex_force_base_url='%s/v1.0' % url,
+                                        ex_force_auth_url='%s/v2.0' % url,
+                                        ex_refetch=False, ex_rate_limit=True)
+    ck = CloudkickApi('key', 'secret', api_server=url.split('://')[1])
+
+    options.auto = True
+    options.batch = False
+    options.resume = False
+    options.pipeline = options.pipeline or options.stream
+    Migrator(ck, rs, {}, options).migrate()
+
+    return {'seconds': time.time() - start,
+            'max_rss_kb': peak_rss_kb()}
+
+
+def peak_rss_kb():
+    """
+    ru_maxrss survives exec on linux, so it would count the fake account this
+    process was forked from. VmHWM starts over with the new program
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(url, options):
+    args = [sys.executable, os.path.realpath(__file__), '--child', url,
+            '--concurrency', str(options.concurrency), '--test-concurrency', str(options.test_concurrency)]
+    if options.test:
+        args.append('--test')
+    if options.pipeline:
+        args.append('--pipeline')
+    if options.stream:
+        args.append('--stream')
+
+    # the migration talks a lot on stdout, its stats are the last line
+    p = subprocess.Popen(args, stdout=subprocess.PIPE)
+    out = p.communicate()[0]
+    if p.returncode:
+        raise Exception('migration of %s failed' % url)
+    return json.loads(out.strip().split('\n')[-1])
+
+
+def main():
+    parser = OptionParser(usage='usage: %prog [options]')
+    parser.add_option('-n', '--nodes', dest='nodes', default='100,1000,10000',
+                      help='comma separated account sizes to run (default: 100,1000,10000)')
+    parser.add_option('-k', '--checks-per-node', type='int', dest='checks_per_node', default=3)
+    parser.add_option('-m', '--monitors', type='int', dest='monitors', default=10)
+    parser.add_option('-l', '--latency', type='float', dest='latency', default=0.0,
+                      help='seconds the fake APIs wait before answering (default: 0)')
+    parser.add_option('--concurrency', type='int', dest='concurrency', default=1)
+    parser.add_option('--test-concurrency', type='int', dest='test_concurrency', default=4)
+    parser.add_option('--test', action='store_true', dest='test', default=False,
+                      help='test checks and alarms before creating them')
+    parser.add_option('--pipeline', action='store_true', dest='pipeline', default=False,
+                      help='migrate node by node instead of phase by phase')
+    parser.add_option('--stream', action='store_true', dest='stream', default=False,
+                      help='migrate node by node and forget every node once it is done (implies --pipeline)')
+    parser.add_option('--child', dest='child', metavar='URL', help='run one migration against URL')
+    (options, args) = parser.parse_args()
+
+    if options.child:
+        options.no_test = not options.test
+        stats = run_migration(options.child, options)
+        print json.dumps(stats)
+        return
+
+    print '%8s %8s %10s %10s %10s %12s' % ('nodes', 'auth', 'cloudkick', 'rackspace', 'seconds', 'peak rss MB')
+    for nodes in [int(n) for n in options.nodes.split(',')]:
+        account = FakeAccount(nodes, options.checks_per_node, options.monitors)
+        server = FakeAPIServer(account, latency=options.latency).start()
+        try:
+            stats = run_child(server.url, options)
+        finally:
+            server.stop()
+
+        print '%8d %8d %10d %10d %10.2f %12.1f' % (nodes, server.requests['auth'], server.requests['cloudkick'],
+                                                   server.requests['rackspace'], stats['seconds'],
+                                                   stats['max_rss_kb'] / 1024.0)
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
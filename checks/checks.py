@@ -4,6 +4,8 @@ import logging
 
 from copy import copy
 
+from preflight import payload_key
+
 DEFAULT_MONITORING_ZONES = ['mzord', 'mzdfw', 'mzlon']
 
 
@@ -53,7 +55,7 @@ class MigratedCheck(object):
 
     _check_cache = None
 
-    def __init__(self, migrated_entity, ck_check, monitoring_zones=None, rs_checks_cache=None):
+    def __init__(self, migrated_entity, ck_check, monitoring_zones=None, rs_checks_cache=None, rs_check=None):
 
         if ck_check.type not in self._check_type_map:
             raise UnsupportedCheckType('Check type %s is not supported' % (ck_check.type))
@@ -71,7 +73,7 @@ class MigratedCheck(object):
         self._check_cache = {}
         self._populate_check()
 
-        self.rs_check = self._find_check()
+        self.rs_check = rs_check or self._find_check()
 
         self.alarms = []
 
@@ -110,12 +112,28 @@ class MigratedCheck(object):
                 return c
         return None
 
+    def test_key(self):
+        """
+        hash of what test_check runs - the check itself and what it targets
+        """
+        check = copy(self._check_cache)
+        check.pop('metadata')
+        return payload_key({'check': check,
+                            'entity_id': self.rs_entity.id,
+                            'ip_addresses': sorted(dict(self.rs_entity.ip_addresses).items())})
+
     def test(self):
+        test_cache = self.migrated_entity.migrator.test_cache
         try:
             if self._test_responses_cache:
                 responses = self._test_responses_cache
             else:
-                responses = self.rs_api.test_check(self.rs_entity, **self._check_cache)
+                key = self.test_key()
+                responses = test_cache.get(key)
+                if responses is None:
+                    responses = self.rs_api.test_check(self.rs_entity, **self._check_cache)
+                    if False not in [r['available'] for r in responses]:
+                        test_cache.add(key, responses)
                 self._test_responses_cache = responses
         except Exception as e:
             msg = 'Check test failed - Exception:\n%s' % (e)
@@ -227,8 +245,16 @@ class CheckMigrator(object):
 
         self.no_test = self.migrator.options.no_test
         self.auto = self.migrator.options.auto
+        self.journal = self.migrator.journal
+        self.concurrency = self.migrator.options.concurrency
+        self.test_concurrency = self.migrator.options.test_concurrency
+        self.review = utils.Review('checks', auto=self.auto, batch=self.migrator.options.batch)
 
     def _test(self, check):
+        """
+        False if the check should be skipped, None if its test failed and that
+        is decided together with the rest of its review group
+        """
         if self.no_test:
             return True
 
@@ -237,46 +263,126 @@ class CheckMigrator(object):
         self.logger.info(msg)
         self.logger.debug('Check Test Result:\n%s' % pprint.pformat(responses))
         if not result:
+            if self.review.batch and not self.auto:
+                return None
             if utils.get_input('Ignore this check?', options=['y', 'n'], default='y') == 'y':
                 return False
         return True
 
+    def _test_all(self, checks):
+        """
+        run the live tests for checks together, each check keeps its responses
+        for _test()
+        """
+        if self.no_test or not checks:
+            return
+
+        self.logger.info('Testing %s checks...\n' % len(checks))
+        queue = utils.WorkQueue(self.test_concurrency)
+        for check in checks:
+            queue.add(check.test)
+        queue.results()
+
     def migrate(self):
         self.logger.info('\nChecks')
         self.logger.info('------\n')
 
-        for migrated_entity in self.migrator.migrated_entities:
+        queue = utils.WorkQueue(self.concurrency)
+        pending = []
+        checks = []
 
-            self.logger.info('Migrating checks for node %s\n' % migrated_entity.ck_node)
+        # read the cloudkick checks for every node in a few batched requests
+        self.ck_api.prefetch_checks([e.ck_node for e in self.migrator.migrated_entities])
 
-            rs_checks = self.rs_api.list_checks(migrated_entity.rs_entity)
+        for migrated_entity in self.migrator.migrated_entities:
             for ck_check in self.ck_api.list_checks(migrated_entity.ck_node):
 
-                self.logger.info('Migrating Check %s' % (ck_check))
+                # migrated by a previous run
+                rs_check = self.journal.get('check', ck_check.id, self.rs_api)
 
                 try:
-                    check = MigratedCheck(migrated_entity, ck_check, monitoring_zones=self.monitoring_zones, rs_checks_cache=rs_checks)
+                    check = MigratedCheck(migrated_entity, ck_check, monitoring_zones=self.monitoring_zones, rs_check=rs_check)
                 except UnsupportedCheckType as e:
-                    self.logger.info(e)
-                    self.logger.info('')
+                    pending.append((migrated_entity, ck_check, None, e, None))
+                    continue
+
+                if rs_check:
+                    pending.append((migrated_entity, ck_check, check, 'Journaled', None))
                     continue
 
                 action, result = check.save(commit=False)
+                pending.append((migrated_entity, ck_check, check, action, result))
+
+        # the live tests are slow, fire them all before going through the checks
+        self._test_all([check for _, _, check, action, _ in pending if action in ['Created', 'Updated']])
+
+        last_entity = None
+        for migrated_entity, ck_check, check, action, result in pending:
+
+            if migrated_entity is not last_entity:
+                if last_entity:
+                    self.logger.info('')
+                self.logger.info('Migrating checks for node %s\n' % migrated_entity.ck_node)
+                last_entity = migrated_entity
+
+            self.logger.info('Migrating Check %s' % (ck_check))
+
+            if not check:
+                # unsupported check type
+                self.logger.info(action)
+                self.logger.info('')
+                continue
+
+            if action == 'Journaled':
+                self.logger.info('Already migrated to check %s\n' % (check.rs_check.id))
+                checks.append((migrated_entity, check, action))
+                continue
+
+            if action in ['Created', 'Updated']:
+                tested = self._test(check)
+                if tested is False:
+                    self.logger.info('')
+                    continue
+
                 if action == 'Created':
-                    if self._test(check):
-                        self.logger.info('Creating new check:\n%s' % (pprint.pformat(result)))
-                        if self.auto or utils.get_input('Create this check?', options=['y', 'n'], default='y') == 'y':
-                            check.save()
-                            migrated_entity.migrated_checks.append(check)
-                elif action == 'Updated':
-                    if self._test(check):
-                        self.logger.info('Updating check %s - changes:\n%s' % (check.rs_check.id, pprint.pformat(result)))
-                        if self.auto or utils.get_input('Update this check?', options=['y', 'n'], default='y') == 'y':
-                            check.save()
-                            migrated_entity.migrated_checks.append(check)
+                    self.logger.info('Creating new check:\n%s' % (pprint.pformat(result)))
+                    question, group = 'Create this check?', 'create %s' % check.type
                 else:
-                    self.logger.info('No changes needed for check %s' % (check.rs_check.id))
-                    migrated_entity.migrated_checks.append(check)
+                    self.logger.info('Updating check %s - changes:\n%s' % (check.rs_check.id, pprint.pformat(result)))
+                    question, group = 'Update this check?', 'update %s' % utils.diff_shape(result, check.rs_check)
+
+                default = 'y'
+                if tested is None:
+                    group, default = '%s (test failed)' % group, 'n'
+
+                if self.review.propose(question, group, (migrated_entity, check, action), ck_check, default=default):
+                    queue.add(check.save)
+                    checks.append((migrated_entity, check, action))
+            else:
+                self.logger.info('No changes needed for check %s' % (check.rs_check.id))
+                checks.append((migrated_entity, check, action))
 
-                self.logger.info('')
             self.logger.info('')
+        self.logger.info('')
+
+        for migrated_entity, check, action in self.review.decide():
+            queue.add(check.save)
+            checks.append((migrated_entity, check, action))
+
+        # every entity exists by now, so the saves can go out together. results
+        # come back in the order they were queued. every save that went through
+        # is journaled before the first one that failed is raised
+        results = iter(queue.results())
+        error = None
+        for migrated_entity, check, action in checks:
+            if action in ['Created', 'Updated']:
+                _, e = results.next()
+                if e:
+                    error = error or e
+                    continue
+            if action != 'Journaled':
+                self.journal.add('check', check.ck_check.id, check.rs_check, action)
+            migrated_entity.migrated_checks.append(check)
+            self.migrator.monitor_checks[check.ck_check.monitor.id].append(check)
+        if error:
+            utils.reraise(error)
@@ -0,0 +1,253 @@
+"""
+cloudkick_snapshot.py - a local copy of the Cloudkick nodes, checks and monitors
+
+Reading a whole Cloudkick account costs a checks request per 100 nodes on top
+of the node and monitor lists, every run. A snapshot keeps the raw API
+objects on disk. The first sync reads everything. Later syncs read the change
+logs since the last one and re-read only the nodes, checks and monitors
+they name:
+
+    node     the node, and every check on it
+    check    the check
+    monitor  the monitor list, and every check of the monitor
+
+Objects that are gone from the API are dropped from the snapshot. A change
+log entry that doesn't say which object it's about (or a snapshot older than
+max_age, past what the change logs reach back to) makes the sync read the
+whole account again.
+
+CloudkickApi.use_snapshot() then serves list_nodes()/list_checks() from it.
+"""
+import os
+import json
+import time
+import tempfile
+
+from collections import OrderedDict
+
+import logging
+log = logging.getLogger('maas_migration')
+
+SNAPSHOT_VERSION = 1
+
+# change log object types the snapshot holds
+_kinds = {'node': 'node', 'nodes': 'node',
+          'check': 'check', 'checks': 'check',
+          'monitor': 'monitor', 'monitors': 'monitor'}
+
+# change log object types that don't touch anything the migration reads
+_ignored_kinds = ['tag', 'tags', 'user', 'users', 'address', 'addresses', 'alert', 'alerts',
+                  'provider', 'providers', 'status', 'maintenance']
+
+
+def _format_date(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+
+def _items(response):
+    if not response:
+        return []
+    if isinstance(response, dict):
+        return response.get('items', [])
+    return response
+
+
+def _changed_object(entry):
+    """
+    (kind, id) of what a change log entry is about, kind is None for entries
+    about objects the snapshot doesn't hold. raises ValueError if the entry
+    doesn't say
+    """
+    obj = entry.get('object') or {}
+    kind = entry.get('object_type') or entry.get('type') or obj.get('type')
+    if isinstance(kind, dict):
+        kind = kind.get('description')
+    kind = (kind or '').strip().lower()
+
+    if kind in _ignored_kinds:
+        return None, None
+    if kind not in _kinds:
+        raise ValueError('unknown change log entry: %s' % entry)
+
+    obj_id = entry.get('object_id') or obj.get('id')
+    if not obj_id:
+        raise ValueError('change log entry without an object id: %s' % entry)
+    return _kinds[kind], obj_id
+
+
+class CloudkickSnapshot(object):
+    """
+    nodes (id -> node) keep the order the API listed them in, checks are
+    kept per node id, monitors by id
+
+    a snapshot without a path only lives as long as the run
+    """
+
+    # read change logs from a bit before the last sync, so clock skew between
+    # us and Cloudkick can't hide a change
+    overlap = 3600
+    # change logs don't reach back forever, older snapshots are read in full
+    max_age = 7 * 86400
+    # node or check ids per request
+    batch_size = 100
+
+    def __init__(self, path=None):
+        self.path = path
+        self.synced_at = None
+        self.nodes = OrderedDict()
+        self.checks = {}
+        self.monitors = OrderedDict()
+
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _load(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            return
+
+        try:
+            data = json.load(f, object_pairs_hook=OrderedDict)
+        except ValueError:
+            log.info('Ignoring unreadable Cloudkick snapshot %s' % self.path)
+            return
+        finally:
+            f.close()
+
+        if data.get('version') != SNAPSHOT_VERSION:
+            log.info('Ignoring Cloudkick snapshot %s from another version' % self.path)
+            return
+
+        self.synced_at = data['synced_at']
+        self.nodes = OrderedDict((n['id'], n) for n in data['nodes'])
+        self.checks = dict(data['checks'])
+        self.monitors = OrderedDict((m['id'], m) for m in data['monitors'])
+
+    def save(self):
+        if not self.path:
+            return
+
+        data = {'version': SNAPSHOT_VERSION,
+                'synced_at': self.synced_at,
+                'nodes': self.nodes.values(),
+                'checks': self.checks,
+                'monitors': self.monitors.values()}
+
+        # write next to the old one and swap, a crash never leaves half a snapshot
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(data, f)
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+
+    def sync(self, conn, now=None):
+        """
+        bring the snapshot up to date through conn (a cloudkick_api Connection),
+        returns 'full' or 'incremental'
+        """
+        # changes made while we read are picked up by the next sync
+        now = now or time.time()
+
+        changes = None
+        if self.synced_at is not None and now - self.synced_at <= self.max_age:
+            try:
+                changes = self._read_changes(conn, self.synced_at - self.overlap)
+            except ValueError as e:
+                log.info('Reading the whole Cloudkick account again: %s' % e)
+
+        if changes is None:
+            self._read_all(conn)
+            how = 'full'
+        else:
+            self._apply_changes(conn, *changes)
+            how = 'incremental'
+
+        self.synced_at = now
+        log.info('Cloudkick snapshot (%s sync): %s nodes, %s checks, %s monitors' %
+                 (how, len(self.nodes), sum(len(c) for c in self.checks.values()), len(self.monitors)))
+        return how
+
+    def _read_all(self, conn):
+        self.nodes = OrderedDict((n['id'], n) for n in _items(conn.nodes.read()))
+        self.monitors = OrderedDict((m['id'], m) for m in _items(conn.monitors.read()))
+        self.checks = {}
+        self._read_node_checks(conn, self.nodes.keys())
+
+    def _read_changes(self, conn, since):
+        """
+        (node ids, check ids, monitor ids) changed since a timestamp
+        """
+        node_ids, check_ids, monitor_ids = set(), set(), set()
+        changed = {'node': node_ids, 'check': check_ids, 'monitor': monitor_ids}
+
+        for entry in _items(conn.changelogs.read(startdate=_format_date(since))):
+            kind, obj_id = _changed_object(entry)
+            if kind:
+                changed[kind].add(obj_id)
+
+        log.info('Cloudkick change logs since %s: %s nodes, %s checks, %s monitors changed' %
+                 (_format_date(since), len(node_ids), len(check_ids), len(monitor_ids)))
+        return node_ids, check_ids, monitor_ids
+
+    def _batches(self, ids):
+        ids = list(ids)
+        for i in range(0, len(ids), self.batch_size):
+            yield ids[i:i + self.batch_size]
+
+    def _read_node_checks(self, conn, node_ids):
+        """
+        replace every check of node_ids with what the API has
+        """
+        for batch in self._batches(node_ids):
+            for node_id in batch:
+                self.checks[node_id] = []
+            for ck_check in _items(conn.checks.read(node_ids=','.join(batch))):
+                if ck_check['node_id'] in self.nodes:
+                    self.checks[ck_check['node_id']].append(ck_check)
+
+    def _replace_checks(self, matches, ck_checks):
+        """
+        drop the checks matches() picks out, add ck_checks in their place
+        """
+        for node_id, checks in self.checks.items():
+            self.checks[node_id] = [c for c in checks if not matches(c)]
+        for ck_check in ck_checks:
+            if ck_check['node_id'] in self.nodes:
+                self.checks.setdefault(ck_check['node_id'], []).append(ck_check)
+
+    def _apply_changes(self, conn, node_ids, check_ids, monitor_ids):
+        for batch in self._batches(node_ids):
+            found = dict((n['id'], n) for n in _items(conn.nodes.read(node_ids=','.join(batch))))
+            for node_id in batch:
+                if node_id in found:
+                    # new nodes go to the end, like the API lists them
+                    self.nodes[node_id] = found[node_id]
+                else:
+                    self.nodes.pop(node_id, None)
+                    self.checks.pop(node_id, None)
+        self._read_node_checks(conn, [n for n in node_ids if n in self.nodes])
+
+        # checks of re-read nodes are up to date already
+        check_ids = check_ids - set(c['id'] for c in self._all_checks() if c['node_id'] in node_ids)
+        for batch in self._batches(check_ids):
+            batch = set(batch)
+            ck_checks = _items(conn.checks.read(check_ids=','.join(batch)))
+            self._replace_checks(lambda c: c['id'] in batch, ck_checks)
+
+        if monitor_ids:
+            self.monitors = OrderedDict((m['id'], m) for m in _items(conn.monitors.read()))
+            # a monitor applies to nodes by query, its checks may have moved anywhere
+            for monitor_id in monitor_ids:
+                ck_checks = _items(conn.checks.read(monitor_id=monitor_id))
+                self._replace_checks(lambda c: c['monitor_id'] == monitor_id, ck_checks)
+
+    def _all_checks(self):
+        for checks in self.checks.values():
+            for ck_check in checks:
+                yield ck_check
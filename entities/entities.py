@@ -21,7 +21,7 @@ class MigratedEntity(object):
     _entity_cache = None  # dict - JSON serializable and suitable for using with the RSC entity API
     _rs_entities_cache = None  # list - a rs_api.list_entities() call, you can pass in the results as a cache
 
-    def __init__(self, migrator, ck_node):
+    def __init__(self, migrator, ck_node, rs_entity=None):
         self.migrator = migrator
 
         self.ck_api = migrator.ck_api
@@ -33,8 +33,8 @@ class MigratedEntity(object):
         self._rs_alarms_cache = None
         self._rs_checks_cache = None
 
-        # find suitable existing entity
-        self.rs_entity = self._find_entity()
+        # find suitable existing entity, unless we already know it
+        self.rs_entity = rs_entity or self._find_entity()
 
         # JSON-serializable dict suitable for using with rs_api
         self._entity_cache = {}
@@ -47,13 +47,13 @@ class MigratedEntity(object):
         return pprint.pformat(self._cache)
 
     def get_rs_alarms(self):
-        if not self._rs_alarms_cache:
-            self._rs_alarms_cache = self.rs_api.list_alarms(self.rs_entity)
+        if self._rs_alarms_cache is None:
+            self._rs_alarms_cache = self.migrator.get_rs_alarms(self.rs_entity)
         return self._rs_alarms_cache
 
     def get_rs_checks(self):
-        if not self._rs_checks_cache:
-            self._rs_checks_cache = self.rs_api.list_checks(self.rs_entity)
+        if self._rs_checks_cache is None:
+            self._rs_checks_cache = self.migrator.get_rs_checks(self.rs_entity)
         return self._rs_checks_cache
 
     def _populate_entity(self):
@@ -69,18 +69,21 @@ class MigratedEntity(object):
         """
         finds a matching rs node for this entity (if one exists)
         """
-        for e in self.migrator.get_rs_entities():
-            # check in the entity metadata for ck_node_id
-            if self.ck_node.id == e.extra.get('ck_node_id'):
-                return e
-
-            # find any matching *public* ips
-            public_entity_ips = [ip for label, ip in e.ip_addresses if 'public' in label]
-            public_node_ips = [ip for label, ip in self.ck_node.ip_addresses.items() if 'public' in label]
-            for ip in public_node_ips:
-                if ip in public_entity_ips and not e.extra.get('ck_node_id'):
-                    return e
-        return None
+        by_ck_node_id, by_public_ip = self.migrator.get_rs_entity_index()
+
+        # check in the entity metadata for ck_node_id
+        matches = [by_ck_node_id.get(self.ck_node.id)]
+
+        # find any matching *public* ips
+        for label, ip in self.ck_node.ip_addresses.items():
+            if 'public' in label:
+                matches.append(by_public_ip.get(ip))
+
+        # the first entity in list order wins, same as a linear scan would
+        matches = [m for m in matches if m]
+        if not matches:
+            return None
+        return min(matches)[1]
 
     def save(self, commit=True):
         """
@@ -96,6 +99,9 @@ class MigratedEntity(object):
                 e = copy(self._entity_cache)
                 e['extra'] = e.pop('metadata')
                 self.rs_entity = self.rs_api.create_entity(**e)
+                # nothing to look up on an entity we just made
+                self._rs_checks_cache = []
+                self._rs_alarms_cache = []
             return 'Created', self._entity_cache
 
 
@@ -147,17 +153,34 @@ class EntityMigrator(object):
         self.rs_api = self.migrator.rs_api
 
         self.auto = self.migrator.options.auto
+        self.journal = self.migrator.journal
+        self.concurrency = self.migrator.options.concurrency
+        self.review = utils.Review('entities', auto=self.auto, batch=self.migrator.options.batch)
 
     def migrate(self):
         """
         adds or updates entities in rs from nodes in ck
+
+        diffing and prompting happens node by node (or group by group when
+        reviewing in batches), the approved creates/updates are then saved
+        through a WorkQueue so they can run concurrently
         """
         self.logger.info('\nEntities')
         self.logger.info('------\n')
 
+        queue = utils.WorkQueue(self.concurrency)
+        entities = []
+
         for ck_node in self.ck_api.list_nodes():
             self.logger.info('Migrating Cloudkick Node - %s' % ck_node)
 
+            # migrated by a previous run
+            rs_entity = self.journal.get('entity', ck_node.id, self.rs_api)
+            if rs_entity:
+                self.logger.info('Already migrated to entity %s\n' % (rs_entity.id))
+                entities.append((MigratedEntity(self.migrator, ck_node, rs_entity=rs_entity), 'Journaled'))
+                continue
+
             # set up obj and see if there are any changes necessary
             entity = MigratedEntity(self.migrator, ck_node)
             action, result = entity.save(commit=False)
@@ -165,24 +188,33 @@ class EntityMigrator(object):
             # print action and prompt for commit
             if action == 'Created':
                 self.logger.info('Creating new entity:\n%s' % (pprint.pformat(result)))
-                if self.auto or utils.get_input('Create this entity?', options=['y', 'n'], default='y') == 'y':
-                    try:
-                        entity.save()
-                    except Exception as e:
-                        self.logger.error('Exception creating entity:\n%s' % e)
-                    else:
-                        self.migrator.migrated_entities.append(entity)
+                if self.review.propose('Create this entity?', 'create', (entity, action), ck_node):
+                    queue.add(entity.save)
+                    entities.append((entity, action))
             elif action == 'Updated':
                 self.logger.info('Updating entity %s - changes:\n%s' % (entity.rs_entity.id, pprint.pformat(result)))
-                if self.auto or utils.get_input('Update this entity?', options=['y', 'n'], default='y') == 'y':
-                    try:
-                        entity.save()
-                    except Exception as e:
-                        self.logger.error('Exception updating entity:\n%s' % e)
-                    else:
-                        self.migrator.migrated_entities.append(entity)
+                if self.review.propose('Update this entity?', 'update %s' % utils.diff_shape(result, entity.rs_entity),
+                                       (entity, action), ck_node):
+                    queue.add(entity.save)
+                    entities.append((entity, action))
             else:
                 self.logger.info('No changes needed for entity %s' % (entity.rs_entity.id))
-                self.migrator.migrated_entities.append(entity)
+                entities.append((entity, action))
 
             self.logger.info('')
+
+        for entity, action in self.review.decide():
+            queue.add(entity.save)
+            entities.append((entity, action))
+
+        # results come back in the order the saves were queued
+        results = iter(queue.results())
+        for entity, action in entities:
+            if action in ['Created', 'Updated']:
+                _, e = results.next()
+                if e:
+                    self.logger.error('Exception %s entity:\n%s' % ('creating' if action == 'Created' else 'updating', e))
+                    continue
+            if action != 'Journaled':
+                self.journal.add('entity', entity.ck_node.id, entity.rs_entity, action)
+            self.migrator.migrated_entities.append(entity)
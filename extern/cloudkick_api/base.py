@@ -17,7 +17,14 @@
 __all__ = ["Connection"]
 
 import os
-import urllib
+import sys
+import time
+import errno
+import zlib
+import socket
+import httplib
+import urlparse
+import threading
 from oauth import oauth
 
 try:
@@ -28,6 +35,96 @@ except ImportError:
 import endpoints
 
 
+# methods the API can be sent twice without doing anything twice
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'DELETE')
+
+
+def _is_stale_connection_error(e):
+    """
+    whether getresponse() failed because the server had already closed the
+    idle connection, before it read the request
+    """
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    return isinstance(e, socket.error) and getattr(e, 'errno', None) == errno.ECONNRESET
+
+
+class KeepAliveTransport(object):
+    """
+    One persistent HTTP(S) connection per thread to a single host, asking for
+    gzipped responses.
+    """
+
+    def __init__(self, host, secure=True, timeout=None):
+        self.host = host
+        self.secure = secure
+        self.timeout = timeout
+
+        # TCP (and TLS) connections opened, for instrumentation
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_connection(self):
+        """
+        returns (connection, reused)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn, True
+
+        if self.secure:
+            conn = httplib.HTTPSConnection(self.host, timeout=self.timeout)
+        else:
+            conn = httplib.HTTPConnection(self.host, timeout=self.timeout)
+        self._local.conn = conn
+        self._lock.acquire()
+        self.connections += 1
+        self._lock.release()
+        return conn, False
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        returns (status, body), the body decompressed
+        """
+        headers = dict(headers or {})
+        headers['Accept-Encoding'] = 'gzip'
+
+        while True:
+            conn, reused = self._get_connection()
+            sent = False
+            try:
+                conn.request(method, path, body, headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except (socket.error, httplib.HTTPException):
+                e = sys.exc_info()[1]
+                self._drop_connection()
+                # the server closed a connection that sat idle, try a new one -
+                # unless the request may have got through and isn't safe to repeat
+                if reused and (not sent or _is_stale_connection_error(e) or
+                               method.upper() in IDEMPOTENT_METHODS):
+                    continue
+                raise
+
+            if response.will_close:
+                self._drop_connection()
+
+            if response.getheader('content-encoding', '').lower() == 'gzip':
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            return response.status, data
+
+    def close(self):
+        self._drop_connection()
+
+
 class Connection(object):
     """
     Cloudkick API Connection Object
@@ -39,6 +136,10 @@ class Connection(object):
     API_SERVER = "api.cloudkick.com"
     API_VERSION = "2.0"
 
+    # called with (method, path, status, bytes, seconds) after every request,
+    # status is None when no response came back
+    request_hook = None
+
     def __init__(self, config_path=None, oauth_key=None, oauth_secret=None,
                  api_server=API_SERVER, api_version=API_VERSION, prefer_params=False):
         self.__oauth_key = oauth_key or None
@@ -46,6 +147,8 @@ class Connection(object):
         self.__prefer_params = prefer_params
         self.__api_server = api_server
         self.__api_version = api_version
+        self.__oauth = None
+        self.__transport = None
         if config_path is None:
             config_path = [os.path.join(os.path.expanduser('~'),
                                              ".cloudkick.conf"),
@@ -105,6 +208,25 @@ class Connection(object):
     def api_server(self):
         return self.__api_server
 
+    @property
+    def secure(self):
+        return self.api_server[:3] != "127"
+
+    @property
+    def transport(self):
+        if self.__transport is None:
+            self.__transport = KeepAliveTransport(self.api_server, secure=self.secure)
+        return self.__transport
+
+    def _get_oauth(self):
+        """
+        (consumer, signature method), set up once per connection
+        """
+        if self.__oauth is None:
+            self.__oauth = (oauth.OAuthConsumer(self.oauth_key, self.oauth_secret),
+                            oauth.OAuthSignatureMethod_HMAC_SHA1())
+        return self.__oauth
+
     def _filter_params(self, params):
         """Filter out any null parameters"""
         return dict((k, v) for k, v in params.iteritems() if v is not None)
@@ -115,12 +237,11 @@ class Connection(object):
         else:
             parameters = self._filter_params(parameters)
 
-        signature_method = oauth.OAuthSignatureMethod_HMAC_SHA1()
-        consumer = oauth.OAuthConsumer(self.oauth_key, self.oauth_secret)
-        if self.api_server[:3] == "127":
-            protocol = "http://"
-        else:
+        consumer, signature_method = self._get_oauth()
+        if self.secure:
             protocol = "https://"
+        else:
+            protocol = "http://"
         if force_api_version:
             api_version = force_api_version
         else:
@@ -131,13 +252,22 @@ class Connection(object):
                                                                    http_method=method,
                                                                    parameters=parameters)
         oauth_request.sign_request(signature_method, consumer, None)
-        if method == "GET":
-            url = oauth_request.to_url()
-            f = urllib.urlopen(url)
-        else:
-            url = oauth_request.get_normalized_http_url()
-            f = urllib.urlopen(url, oauth_request.to_postdata())
-        s = f.read()
+
+        start = time.time()
+        status, s = None, None
+        try:
+            if method == "GET":
+                path = urlparse.urlsplit(oauth_request.to_url())
+                path = '%s?%s' % (path.path, path.query)
+                status, s = self.transport.request('GET', path)
+            else:
+                path = urlparse.urlsplit(oauth_request.get_normalized_http_url()).path
+                status, s = self.transport.request('POST', path, oauth_request.to_postdata(),
+                                                   {'Content-Type': 'application/x-www-form-urlencoded'})
+        finally:
+            if self.request_hook is not None:
+                self.request_hook(method, urlparse.urlsplit(url).path, status, len(s or ''),
+                                  time.time() - start)
         return s
 
     def _request_json(self, *args, **kwargs):
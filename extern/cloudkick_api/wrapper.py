@@ -4,14 +4,21 @@ as the Rackspace Cloud Monitoring libcloud driver
 """
 
 import sys
+import threading
 
 from base import Connection
 
 
+# one copy of the strings every check repeats (check types)
+_strings = {}
+
+
+def _intern(s):
+    return _strings.setdefault(s, s)
+
+
 class Notification(object):
-    name = None
-    address = None
-    type = None
+    __slots__ = ('name', 'address', 'type')
 
     def __init__(self, type, name, address):
         self.name = name
@@ -27,66 +34,97 @@ class Notification(object):
         return not self.__eq__(other)
 
     def __hash__(self):
-        return self.address
+        return hash(self.address)
 
 
 class Monitor(object):
-    monitor = None
-    check = None
-    address = None
+    __slots__ = ('id', 'name', 'notification_receivers', '_registry', '_notifications')
 
     _type_map = {
         'webhook': 4,
         'email': 1
     }
 
-    def __init__(self, ck_monitor):
+    def __init__(self, ck_monitor, registry=None):
         self.id = ck_monitor['id']
         self.name = ck_monitor['name']
         self.notification_receivers = ck_monitor['notification_receivers']
+        self._registry = registry
+        self._notifications = None
 
     def get_notifications(self):
         """
-        Email only
+        Email only. The receivers are parsed once
         """
-        notifications = []
-        for n in self.notification_receivers:
-            if n['type']['code'] == 1:
-                notifications.append(Notification('email', n['name'], n['details']['email_address']))
-        return notifications
+        if self._notifications is None:
+            notifications = []
+            for n in self.notification_receivers:
+                if n['type']['code'] == 1:
+                    args = ('email', n['name'], n['details']['email_address'])
+                    if self._registry:
+                        notifications.append(self._registry.notification(*args))
+                    else:
+                        notifications.append(Notification(*args))
+            self._notifications = tuple(notifications)
+        return list(self._notifications)
+
+
+class Registry(object):
+    """
+    One Monitor per monitor id and one Notification per (type, address), so
+    every check of a monitor and every monitor sending to an address share
+    them
+    """
+
+    def __init__(self):
+        self._monitors = {}
+        self._notifications = {}
+        self._lock = threading.Lock()
+
+    def monitor(self, ck_monitor):
+        with self._lock:
+            monitor = self._monitors.get(ck_monitor['id'])
+            if monitor is None:
+                monitor = self._monitors[ck_monitor['id']] = Monitor(ck_monitor, registry=self)
+        return monitor
+
+    def notification(self, type, name, address):
+        with self._lock:
+            notification = self._notifications.get((type, address))
+            if notification is None:
+                notification = self._notifications[(type, address)] = Notification(type, name, address)
+        return notification
 
 
 class Check(object):
-    id = None
-    monitor = None
-    label = None
-    type = None
-    details = None
-    node_id = None
-    disabled = None
+    """
+    ck_monitor is the raw monitor, or a Monitor shared by all of its checks
+    """
+    __slots__ = ('id', 'monitor', 'type', 'details', 'node', 'disabled')
 
     def __init__(self, node, ck_check, ck_monitor):
 
         self.id = ck_check['id']
-        self.monitor = Monitor(ck_monitor)
-        self.type = ck_check['type']['description']
-        self.label = '%s:%s' % (self.monitor.name, self.type)
+        self.monitor = ck_monitor if isinstance(ck_monitor, Monitor) else Monitor(ck_monitor)
+        self.type = _intern(ck_check['type']['description'])
         self.details = ck_check['details']
         self.node = node
         self.disabled = not ck_check['is_enabled']
-        self.target_hostname = self.node.primary_ip
+
+    @property
+    def label(self):
+        return '%s:%s' % (self.monitor.name, self.type)
+
+    @property
+    def target_hostname(self):
+        return self.node.primary_ip
 
     def __str__(self):
         return "<Check: id=%s label=%s ip=%s>" % (self.id, self.label, self.node.primary_ip)
 
 
 class Node(object):
-
-    id = None
-    label = None
-    ip_addresses = None
-    agent_id = None
-    extra = None
+    __slots__ = ('id', 'label', 'ip_addresses', 'agent_id', 'extra')
 
     def __init__(self, ck_node):
         self.id = ck_node['id']
@@ -127,46 +165,115 @@ class Node(object):
 class CloudkickApi(object):
     conn = None
 
-    def __init__(self, oauth_key, oauth_secret):
+    # when set, list_nodes()/iter_nodes() only return the nodes it's true for
+    node_filter = None
+
+    # node ids per checks.read() call when prefetching
+    check_batch_size = 100
+
+    def __init__(self, oauth_key, oauth_secret, api_server=Connection.API_SERVER):
 
         try:
-            self.conn = Connection(oauth_key=str(oauth_key), oauth_secret=str(oauth_secret))
+            self.conn = Connection(oauth_key=str(oauth_key), oauth_secret=str(oauth_secret),
+                                   api_server=api_server)
         except Exception as e:
             sys.stderr.write('Failed to initialize Cloudkick API.\n')
             sys.stderr.write('Exception: %s' % (e))
             sys.exit(1)
 
-    def list_checks(self, node, use_cache=False):
+        self.registry = Registry()
+        self._monitors_cache = None
+        self._monitors_lock = threading.Lock()
+        self._checks_cache = {}
+        self._snapshot = None
 
-        checks = []
-
-        ck_monitors = self.conn.monitors.read()
-        if ck_monitors:
-            ck_monitors = ck_monitors['items']
-        else:
-            ck_monitors = []
+    def use_snapshot(self, snapshot):
+        """
+        Serve nodes, checks and monitors from a synced CloudkickSnapshot
+        (cloudkick_snapshot.py) instead of reading them from the API.
+        """
+        self._snapshot = snapshot
+        with self._monitors_lock:
+            self._monitors_cache = dict((m['id'], self.registry.monitor(m)) for m in snapshot.monitors.values())
+        self._checks_cache = {}
 
-        ck_checks = self.conn.checks.read(node_ids=node.id)
+    def _get_monitors(self):
+        """
+        all monitors on the account keyed by id, read once and interned in
+        self.registry
+        """
+        with self._monitors_lock:
+            if self._monitors_cache is None:
+                ck_monitors = self.conn.monitors.read()
+                if ck_monitors:
+                    ck_monitors = ck_monitors['items']
+                else:
+                    ck_monitors = []
+                self._monitors_cache = dict((m['id'], self.registry.monitor(m)) for m in ck_monitors)
+        return self._monitors_cache
+
+    def _read_checks(self, node_ids):
+        if self._snapshot is not None:
+            return [ck_check for node_id in node_ids for ck_check in self._snapshot.checks.get(node_id, [])]
+
+        ck_checks = self.conn.checks.read(node_ids=','.join(node_ids))
         if ck_checks:
-            ck_checks = ck_checks['items']
-        else:
-            ck_checks = []
+            return ck_checks['items']
+        return []
 
-        for ck_check in ck_checks:
+    def prefetch_checks(self, nodes):
+        """
+        Read the checks for all nodes with one checks.read() call per
+        check_batch_size nodes. list_checks() is then served from memory for
+        these nodes.
+        """
+        node_ids = [node.id for node in nodes if node.id not in self._checks_cache]
 
-            # look up this check's monitor
-            monitor = None
-            for ck_monitor in ck_monitors:
-                if ck_monitor['id'] == ck_check['monitor_id']:
-                    monitor = ck_monitor
-                    break
+        for i in range(0, len(node_ids), self.check_batch_size):
+            batch = node_ids[i:i + self.check_batch_size]
+            for node_id in batch:
+                self._checks_cache[node_id] = []
+            for ck_check in self._read_checks(batch):
+                self._checks_cache.setdefault(ck_check['node_id'], []).append(ck_check)
 
-            checks.append(Check(node, ck_check, monitor))
+    def list_checks(self, node, use_cache=False):
 
-        return checks
+        monitors = self._get_monitors()
+
+        if node.id in self._checks_cache:
+            ck_checks = self._checks_cache.pop(node.id)
+        else:
+            ck_checks = self._read_checks([node.id])
+
+        return [Check(node, ck_check, monitors.get(ck_check['monitor_id'])) for ck_check in ck_checks]
+
+    def iter_nodes(self):
+        """
+        like list_nodes(), but each Node is only built when it's asked for
+        """
+        if self._snapshot is not None:
+            for ck_node in self._snapshot.nodes.values():
+                node = Node(ck_node)
+                if self.node_filter is None or self.node_filter(node):
+                    yield node
+            return
+
+        # the raw nodes are let go as they're handed out
+        ck_nodes = self.conn.nodes.read()['items']
+        ck_nodes.reverse()
+        while ck_nodes:
+            node = Node(ck_nodes.pop())
+            if self.node_filter is None or self.node_filter(node):
+                yield node
 
     def list_nodes(self, use_cache=False):
-        nodes = []
-        for node in self.conn.nodes.read()['items']:
-            nodes.append(Node(node))
+        if self._snapshot is not None:
+            nodes = [Node(node) for node in self._snapshot.nodes.values()]
+        else:
+            nodes = []
+            for node in self.conn.nodes.read()['items']:
+                nodes.append(Node(node))
+
+        if self.node_filter is not None:
+            nodes = [node for node in nodes if self.node_filter(node)]
         return nodes
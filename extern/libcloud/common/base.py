@@ -13,9 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# Backward compatibility for Python 2.5
+from __future__ import with_statement
+
 import sys
 import ssl
+import errno
 import time
+import socket
+import threading
 
 from xml.etree import ElementTree as ET
 from pipes import quote as pquote
@@ -348,6 +354,78 @@ class LoggingHTTPConnection(LoggingConnection, LibcloudHTTPConnection):
                                                body, headers)
 
 
+# methods a server can be sent twice without doing anything twice
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'DELETE')
+
+
+def _is_stale_connection_error(e):
+    """
+    Whether getresponse() failed because the server had already closed an
+    idle keep-alive connection, i.e. before it read the request.
+    """
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    return isinstance(e, socket.error) and \
+        getattr(e, 'errno', None) == errno.ECONNRESET
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of idle keep-alive HTTP(S) connections.
+
+    Connections are keyed by (host, port, secure). A connection is only handed
+    back to the pool once its response has been read completely and the
+    server did not ask to close it.
+    """
+
+    def __init__(self, maxsize=10):
+        self.maxsize = maxsize
+        self.created = 0
+        self.reused = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, factory):
+        """
+        Return an idle connection for key, or a new one built by factory().
+
+        @return: C{tuple} of (connection, reused)
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop(), True
+            self.created += 1
+
+        return factory(), False
+
+    def release(self, key, connection, response):
+        """
+        Put a connection back once response has been consumed, close it
+        otherwise.
+        """
+        if response is None or not response.isclosed() or response.will_close:
+            connection.close()
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append(connection)
+                return
+
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
 class Connection(object):
     """
     A Base Connection class to derive from.
@@ -357,7 +435,11 @@ class Connection(object):
 
     responseCls = Response
     rawResponseCls = RawResponse
-    connection = None
+    # Set to a ConnectionPool to reuse keep-alive connections between requests
+    connection_pool = None
+    # Set to a callable (method, path, status, bytes, seconds) to have every
+    # request reported to it. status is None when no response came back
+    request_hook = None
     host = '127.0.0.1'
     port = 443
     timeout = None
@@ -370,6 +452,7 @@ class Connection(object):
         self.secure = secure and 1 or 0
         self.ua = []
         self.context = {}
+        self._local = threading.local()
 
         self.request_path = ''
 
@@ -391,6 +474,19 @@ class Connection(object):
         if timeout:
             self.timeout = timeout
 
+    def _get_connection(self):
+        local = getattr(self, '_local', None)
+        return getattr(local, 'connection', None)
+
+    def _set_connection(self, connection):
+        if getattr(self, '_local', None) is None:
+            self._local = threading.local()
+        self._local.connection = connection
+
+    # The underlying HTTP(S) connection is kept per thread, so a single
+    # Connection (and driver) can be shared by several worker threads.
+    connection = property(_get_connection, _set_connection)
+
     def set_context(self, context):
         self.context = context
 
@@ -420,20 +516,13 @@ class Connection(object):
 
         return (host, port, secure, request_path)
 
-    def connect(self, host=None, port=None, base_url=None):
+    def _connection_args(self, host=None, port=None, base_url=None):
         """
-        Establish a connection with the API server.
+        Work out which server a connection should be made to.
 
-        @type host: C{str}
-        @param host: Optional host to override our default
-
-        @type port: C{int}
-        @param port: Optional port to override our default
-
-        @returns: A connection
+        @return: C{tuple} of (secure, kwargs for the connection class)
         """
         # prefer the attribute base_url if its set or sent
-        connection = None
         secure = self.secure
 
         if getattr(self, 'base_url', None) and base_url == None:
@@ -453,6 +542,23 @@ class Connection(object):
         if self.timeout and not PY25:
             kwargs.update({'timeout': self.timeout})
 
+        return secure, kwargs
+
+    def connect(self, host=None, port=None, base_url=None):
+        """
+        Establish a connection with the API server.
+
+        @type host: C{str}
+        @param host: Optional host to override our default
+
+        @type port: C{int}
+        @param port: Optional port to override our default
+
+        @returns: A connection
+        """
+        secure, kwargs = self._connection_args(host=host, port=port,
+                                               base_url=base_url)
+
         connection = self.conn_classes[secure](**kwargs)
         # You can uncoment this line, if you setup a reverse proxy server
         # which proxies to your endpoint, and lets you easily capture
@@ -462,6 +568,50 @@ class Connection(object):
 
         self.connection = connection
 
+    def _pooled_request(self, method, url, body, headers):
+        """
+        Send a request over a keep-alive connection from connection_pool.
+
+        A reused connection may have been closed by the server while it sat
+        in the pool, in which case the request is retried on the next one
+        (eventually a fresh connection). Only requests that provably never
+        reached the server (or idempotent ones) are sent again, a POST that
+        times out waiting for its response is not.
+        """
+        pool = self.connection_pool
+        secure, kwargs = self._connection_args()
+        key = (kwargs['host'], kwargs['port'], secure)
+        factory = lambda: self.conn_classes[secure](**kwargs)
+
+        while True:
+            connection, reused = pool.acquire(key, factory)
+            self.connection = connection
+            sent = False
+            try:
+                connection.request(method=method, url=url, body=body,
+                                   headers=headers)
+                sent = True
+                http_response = connection.getresponse()
+                self._local.http_response = http_response
+            except (socket.error, httplib.HTTPException):
+                e = sys.exc_info()[1]
+                connection.close()
+                if reused and (not sent or _is_stale_connection_error(e) or
+                               method.upper() in IDEMPOTENT_METHODS):
+                    continue
+                if isinstance(e, ssl.SSLError):
+                    raise ssl.SSLError(str(e))
+                raise
+            break
+
+        try:
+            response = self.responseCls(response=http_response,
+                                        connection=self)
+        finally:
+            pool.release(key, connection, http_response)
+
+        return response
+
     def _user_agent(self):
         return 'libcloud/%s (%s)%s' % (
                   libcloud.__version__,
@@ -556,6 +706,40 @@ class Connection(object):
         else:
             url = action
 
+        if self.request_hook is None or raw:
+            return self._send_request(method, url, data, headers, raw)
+
+        start = time.time()
+        response = None
+        self._local.http_response = None
+        try:
+            response = self._send_request(method, url, data, headers, raw)
+            return response
+        finally:
+            self._report_request(method, action, response, start)
+
+    def _report_request(self, method, action, response, start):
+        """
+        Hand a finished request to request_hook. Without a response (the
+        Response class raised on an error status) the status and size come
+        from the HTTP response.
+        """
+        status, size = None, 0
+        if response is not None:
+            status, size = response.status, len(response.body or '')
+        else:
+            http_response = getattr(self._local, 'http_response', None)
+            if http_response is not None:
+                status = http_response.status
+                size = int(http_response.getheader('content-length') or 0)
+
+        self.request_hook(method, action, status, size, time.time() - start)
+
+    def _send_request(self, method, url, data, headers, raw):
+        if self.connection_pool is not None and not raw:
+            return self._pooled_request(method=method, url=url, body=data,
+                                        headers=headers)
+
         # Removed terrible hack...this a less-bad hack that doesn't execute a
         # request twice, but it's still a hack.
         self.connect()
@@ -579,7 +763,9 @@ class Connection(object):
         if raw:
             response = self.rawResponseCls(connection=self)
         else:
-            response = self.responseCls(response=self.connection.getresponse(),
+            http_response = self.connection.getresponse()
+            self._local.http_response = http_response
+            response = self.responseCls(response=http_response,
                                         connection=self)
 
         return response
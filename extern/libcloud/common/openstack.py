@@ -16,9 +16,15 @@
 """
 Common utilities for OpenStack
 """
+from __future__ import with_statement
+
+import re
 import sys
+import time
+import calendar
 import binascii
 import os
+import threading
 
 from libcloud.utils.py3 import httplib
 
@@ -36,8 +42,99 @@ AUTH_API_VERSION = '1.1'
 __all__ = [
     "OpenStackBaseConnection",
     "OpenStackAuthConnection",
+    "OpenStackAuthCache",
     ]
 
+# 2012-11-13T15:14:51.000-06:00, 2012-11-13T21:14:51Z
+EXPIRES_RE = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?'
+                        r'(Z|([+-])(\d\d):?(\d\d))?$')
+
+
+def parse_auth_token_expires(expires):
+    """
+    auth_token_expires as a unix timestamp, None if it can't be parsed
+    """
+    match = EXPIRES_RE.match(expires or '')
+    if not match:
+        return None
+
+    groups = match.groups()
+    timestamp = calendar.timegm([int(g) for g in groups[:6]])
+    if groups[7]:
+        offset = int(groups[8]) * 3600 + int(groups[9]) * 60
+        timestamp -= offset if groups[7] == '+' else -offset
+    return timestamp
+
+
+class OpenStackAuthCache(object):
+    """
+    Auth tokens and service catalogs on disk, so other drivers (in this or
+    other processes) can skip authenticating while a token is valid.
+
+    Entries are keyed by auth url, auth version and user. The file holds
+    live tokens and is only readable by its owner.
+    """
+
+    # don't hand out tokens about to expire
+    expiry_margin = 300
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            return {}
+
+        try:
+            try:
+                return json.load(f)
+            except ValueError:
+                return {}
+        finally:
+            f.close()
+
+    def _write(self, entries):
+        # write a new file and move it in place, readers never see half of it
+        tmp = '%s.%s.tmp' % (self.path, os.getpid())
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, int('600', 8))
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(entries, f)
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._read().get(key)
+
+        if not entry:
+            return None
+
+        expires = parse_auth_token_expires(entry.get('auth_token_expires'))
+        if not expires or expires - self.expiry_margin < time.time():
+            return None
+        return entry
+
+    def put(self, key, entry):
+        # a token we can't tell the expiry of is not cached
+        if not parse_auth_token_expires(entry.get('auth_token_expires')):
+            return
+
+        with self._lock:
+            entries = self._read()
+            entries[key] = entry
+            self._write(entries)
+
+    def remove(self, key):
+        with self._lock:
+            entries = self._read()
+            if entries.pop(key, None):
+                self._write(entries)
+
 
 # @TODO: Refactor for re-use by other openstack drivers
 class OpenStackAuthResponse(Response):
@@ -86,6 +183,8 @@ class OpenStackAuthConnection(ConnectionUserAndKey):
         self.parent_conn = parent_conn
         # enable tests to use the same mock connection classes.
         self.conn_classes = parent_conn.conn_classes
+        # auth requests are reported like the parent's
+        self.request_hook = parent_conn.request_hook
 
         if timeout:
             self.timeout = timeout
@@ -398,7 +497,8 @@ class OpenStackBaseConnection(ConnectionUserAndKey):
                  ex_tenant_name=None,
                  ex_force_service_type=None,
                  ex_force_service_name=None,
-                 ex_force_service_region=None):
+                 ex_force_service_region=None,
+                 ex_auth_cache=None):
 
         self._ex_force_base_url = ex_force_base_url
         self._ex_force_auth_url = ex_force_auth_url
@@ -407,9 +507,15 @@ class OpenStackBaseConnection(ConnectionUserAndKey):
         self._ex_force_service_type = ex_force_service_type
         self._ex_force_service_name = ex_force_service_name
         self._ex_force_service_region = ex_force_service_region
+        self._ex_force_auth_token = ex_force_auth_token
         if ex_force_auth_token:
             self.auth_token = ex_force_auth_token
 
+        if isinstance(ex_auth_cache, basestring):
+            ex_auth_cache = OpenStackAuthCache(ex_auth_cache)
+        self.auth_cache = ex_auth_cache
+        self._auth_lock = threading.RLock()
+
         if ex_force_auth_token and not ex_force_base_url:
             raise LibcloudError(
                 'Must also provide ex_force_base_url when specifying '
@@ -456,25 +562,50 @@ class OpenStackBaseConnection(ConnectionUserAndKey):
         return super(OpenStackBaseConnection, self).morph_action_hook(action)
 
     def request(self, **kwargs):
-        return super(OpenStackBaseConnection, self).request(**kwargs)
-
-    def _populate_hosts_and_request_paths(self):
-        """
-        OpenStack uses a separate host for API calls which is only provided
-        after an initial authentication request.
-        """
-
-        if not self.auth_token:
-            aurl = self.auth_url
-
-            if self._ex_force_auth_url != None:
-                aurl = self._ex_force_auth_url
-
-            if aurl == None:
-                raise LibcloudError('OpenStack instance must ' +
-                                    'have auth_url set')
-
-            osa = OpenStackAuthConnection(self, aurl, self._auth_version,
+        token = self.auth_token
+        try:
+            return super(OpenStackBaseConnection, self).request(**kwargs)
+        except InvalidCredsError:
+            # the token expired or was revoked (e.g. a cached one), get a new
+            # one and try once more. a token passed in can't be renewed
+            if self._ex_force_auth_token or not token:
+                raise
+            with self._auth_lock:
+                if self.auth_token == token:
+                    self._reset_auth()
+            return super(OpenStackBaseConnection, self).request(**kwargs)
+
+    def _auth_url(self):
+        aurl = self.auth_url
+
+        if self._ex_force_auth_url != None:
+            aurl = self._ex_force_auth_url
+
+        if aurl == None:
+            raise LibcloudError('OpenStack instance must ' +
+                                'have auth_url set')
+        return aurl
+
+    def _auth_cache_key(self):
+        return '%s %s %s' % (self._auth_url(), self._auth_version,
+                             self.user_id)
+
+    def _reset_auth(self):
+        if self.auth_cache:
+            self.auth_cache.remove(self._auth_cache_key())
+        self.auth_token = None
+
+    def _authenticate(self):
+        cached = self.auth_cache and \
+                 self.auth_cache.get(self._auth_cache_key())
+        if cached:
+            self.auth_token = cached['auth_token']
+            self.auth_token_expires = cached['auth_token_expires']
+            self.auth_user_info = cached['auth_user_info']
+            urls = cached['urls']
+        else:
+            osa = OpenStackAuthConnection(self, self._auth_url(),
+                                          self._auth_version,
                                           self.user_id, self.key,
                                           tenant_name=self._ex_tenant_name,
                                           timeout=self.timeout)
@@ -485,10 +616,30 @@ class OpenStackBaseConnection(ConnectionUserAndKey):
             self.auth_token = osa.auth_token
             self.auth_token_expires = osa.auth_token_expires
             self.auth_user_info = osa.auth_user_info
+            urls = osa.urls
+
+            if self.auth_cache:
+                self.auth_cache.put(self._auth_cache_key(),
+                                    {'auth_token': self.auth_token,
+                                     'auth_token_expires':
+                                     self.auth_token_expires,
+                                     'auth_user_info': self.auth_user_info,
+                                     'urls': urls})
 
-            # pull out and parse the service catalog
-            self.service_catalog = OpenStackServiceCatalog(osa.urls,
-                    ex_force_auth_version=self._auth_version)
+        # pull out and parse the service catalog
+        self.service_catalog = OpenStackServiceCatalog(urls,
+                ex_force_auth_version=self._auth_version)
+
+    def _populate_hosts_and_request_paths(self):
+        """
+        OpenStack uses a separate host for API calls which is only provided
+        after an initial authentication request.
+        """
+
+        if not self.auth_token:
+            with self._auth_lock:
+                if not self.auth_token:
+                    self._authenticate()
 
         # Set up connection info
         url = self._ex_force_base_url or self.get_endpoint()
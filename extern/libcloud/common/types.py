@@ -13,6 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+# Backward compatibility for Python 2.5
+from __future__ import with_statement
+
+import sys
+import threading
+
 __all__ = [
     "LibcloudError",
     "MalformedResponseError",
@@ -80,44 +86,148 @@ class InvalidCredsError(LibcloudError):
 InvalidCredsException = InvalidCredsError
 
 
+class _PageFetch(threading.Thread):
+    """
+    Fetches one page of a L{LazyList} in the background.
+    """
+
+    def __init__(self, get_more, last_key, value_dict):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._get_more = get_more
+        self._last_key = last_key
+        self._value_dict = value_dict
+        self._result = None
+        self._error = None
+        self.start()
+
+    def run(self):
+        try:
+            self._result = self._get_more(last_key=self._last_key,
+                                          value_dict=self._value_dict)
+        except Exception:
+            self._error = sys.exc_info()[1]
+
+    def result(self):
+        self.join()
+        if self._error:
+            raise self._error
+        return self._result
+
+
 class LazyList(object):
+    """
+    A list whose items are fetched from a paginated API as they are needed.
+
+    Iterating yields items page by page as they arrive.
+
+    @type prefetch: C{bool}
+    @param prefetch: Fetch the next page on a background thread while the
+                     current one is consumed.
+
+    @type retain: C{bool}
+    @param retain: Keep loaded pages around. Without it the list can only be
+                   iterated once and pages are dropped as they are consumed.
+    """
 
-    def __init__(self, get_more, value_dict=None):
+    def __init__(self, get_more, value_dict=None, prefetch=False,
+                 retain=True):
         self._data = []
         self._last_key = None
         self._exhausted = False
         self._all_loaded = False
         self._get_more = get_more
         self._value_dict = value_dict or {}
+        self._prefetch = prefetch
+        self._retain = retain
+        self._iterated = False
+        self._next_page = None
+        self._lock = threading.Lock()
 
     def __iter__(self):
-        if not self._all_loaded:
-            self._load_all()
-
-        data = self._data
-        for i in data:
-            yield i
+        if not self._retain:
+            return self._iter_once()
+        return self._iter_retained()
+
+    def _iter_retained(self):
+        i = 0
+        while True:
+            while i < len(self._data):
+                yield self._data[i]
+                i += 1
+
+            if self._exhausted:
+                return
+            self._load_page()
+
+    def _iter_once(self):
+        if self._iterated:
+            raise LibcloudError('LazyList without retain can only be '
+                                'iterated once')
+        self._iterated = True
+
+        while True:
+            data, self._data = self._data, []
+            for item in data:
+                yield item
+
+            if self._exhausted:
+                return
+            self._load_page()
+
+    def _check_retained(self):
+        # like any other unsized iterable, so list() and friends still work
+        if not self._retain:
+            raise TypeError('LazyList without retain only supports '
+                            'iteration')
 
     def __getitem__(self, index):
-        if index >= len(self._data) and not self._all_loaded:
+        self._check_retained()
+
+        if isinstance(index, slice) or index < 0:
             self._load_all()
 
+        while not isinstance(index, slice) and index >= len(self._data) \
+                and not self._exhausted:
+            self._load_page()
+
         return self._data[index]
 
     def __len__(self):
+        self._check_retained()
         self._load_all()
         return len(self._data)
 
     def __repr__(self):
+        if not self._retain:
+            return '<LazyList (not retained)>'
+
         self._load_all()
         repr_string = ', ' .join([repr(item) for item in self._data])
         repr_string = '[%s]' % (repr_string)
         return repr_string
 
+    def _load_page(self):
+        with self._lock:
+            if self._exhausted:
+                return
+
+            if self._next_page:
+                page, self._next_page = self._next_page, None
+                newdata, self._last_key, self._exhausted = page.result()
+            else:
+                newdata, self._last_key, self._exhausted = \
+                         self._get_more(last_key=self._last_key,
+                                        value_dict=self._value_dict)
+            self._data.extend(newdata)
+
+            if self._exhausted:
+                self._all_loaded = True
+            elif self._prefetch:
+                self._next_page = _PageFetch(self._get_more, self._last_key,
+                                             self._value_dict)
+
     def _load_all(self):
         while not self._exhausted:
-            newdata, self._last_key, self._exhausted = \
-                     self._get_more(last_key=self._last_key,
-                                    value_dict=self._value_dict)
-            self._data.extend(newdata)
+            self._load_page()
         self._all_loaded = True
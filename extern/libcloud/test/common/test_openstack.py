@@ -1,9 +1,16 @@
+import os
 import sys
+import time
+import shutil
+import tempfile
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 
 from libcloud.common.openstack import OpenStackBaseConnection
+from libcloud.common.openstack import OpenStackAuthCache
+from libcloud.common.openstack import parse_auth_token_expires
+from libcloud.common.types import InvalidCredsError
 from libcloud.utils.py3 import PY25
 
 
@@ -30,5 +37,74 @@ class OpenStackBaseConnectionTest(unittest.TestCase):
                                                                timeout=10)
 
 
+class OpenStackAuthCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'auth.json')
+        OpenStackBaseConnection.conn_classes = (None, Mock())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _connection(self):
+        return OpenStackBaseConnection('foo', 'bar',
+                                       ex_force_auth_url='https://127.0.0.1',
+                                       ex_force_base_url='https://127.0.0.2/v1.0',
+                                       ex_auth_cache=self.path)
+
+    def _expires(self, offset):
+        return time.strftime('%Y-%m-%dT%H:%M:%S.000+00:00',
+                             time.gmtime(time.time() + offset))
+
+    def test_parse_expires(self):
+        self.assertEqual(parse_auth_token_expires('2012-11-13T15:14:51.000-06:00'),
+                         parse_auth_token_expires('2012-11-13T21:14:51Z'))
+        self.assertEqual(parse_auth_token_expires('2012-11-13T21:14:51Z'),
+                         1352841291)
+        self.assertEqual(parse_auth_token_expires('tomorrow'), None)
+
+    @patch('libcloud.common.openstack.OpenStackAuthConnection')
+    def test_cached_auth(self, osa):
+        osa.return_value = Mock(auth_token='token', urls={},
+                                auth_token_expires=self._expires(3600),
+                                auth_user_info={})
+
+        self._connection()._populate_hosts_and_request_paths()
+        self.assertEqual(oct(os.stat(self.path).st_mode & int('777', 8)), '0600')
+
+        connection = self._connection()
+        connection._populate_hosts_and_request_paths()
+        self.assertEqual(connection.auth_token, 'token')
+        self.assertEqual(connection.host, '127.0.0.2')
+        self.assertEqual(osa.call_count, 1)
+
+        # about to expire
+        osa.return_value.auth_token_expires = self._expires(60)
+        OpenStackAuthCache(self.path).remove(connection._auth_cache_key())
+        self._connection()._populate_hosts_and_request_paths()
+        self._connection()._populate_hosts_and_request_paths()
+        self.assertEqual(osa.call_count, 3)
+
+    @patch('libcloud.common.base.Connection.request')
+    def test_reauth_on_401(self, request):
+        connection = self._connection()
+        connection.auth_token = 'revoked'
+        connection.auth_cache.put(connection._auth_cache_key(),
+                                  {'auth_token': 'revoked',
+                                   'auth_token_expires': self._expires(3600)})
+
+        request.side_effect = [InvalidCredsError('401'), 'ok']
+        self.assertEqual(connection.request(action='/'), 'ok')
+        self.assertEqual(connection.auth_token, None)
+        self.assertEqual(connection.auth_cache.get(connection._auth_cache_key()),
+                         None)
+
+        request.side_effect = InvalidCredsError('401')
+        connection.auth_token = 'token'
+        self.assertRaises(InvalidCredsError, connection.request, action='/')
+        self.assertEqual(request.call_count, 4)
+
+
 if __name__ == '__main__':
     sys.exit(unittest.main())
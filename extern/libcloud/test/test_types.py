@@ -16,7 +16,7 @@
 import sys
 import unittest
 
-from libcloud.common.types import LazyList
+from libcloud.common.types import LazyList, LibcloudError
 
 
 class TestLazyList(unittest.TestCase):
@@ -92,6 +92,35 @@ class TestLazyList(unittest.TestCase):
         self.assertEqual(repr(ll2), '[1, 2, 3, 4, 5]')
         self.assertEqual(repr(ll3), '[1, 2, 3, 4, 5, 6, 7, 8, 9, 10]')
 
+    def test_streaming(self):
+        ll = LazyList(get_more=self._get_more_not_exhausted)
+
+        it = iter(ll)
+        self.assertEqual(next(it), 1)
+        self.assertEqual(self._get_more_counter, 1)
+        self.assertEqual(list(it), [2, 3, 4, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(self._get_more_counter, 2)
+
+        # pages are retained by default
+        self.assertEqual(list(ll), [1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(self._get_more_counter, 2)
+
+    def test_prefetch(self):
+        ll = LazyList(get_more=self._get_more_not_exhausted, prefetch=True)
+
+        self.assertEqual(list(ll), [1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(len(ll), 10)
+        self.assertEqual(self._get_more_counter, 2)
+
+    def test_not_retained(self):
+        ll = LazyList(get_more=self._get_more_not_exhausted, prefetch=True,
+                      retain=False)
+
+        self.assertEqual(list(ll), [1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(ll._data, [])
+        self.assertRaises(LibcloudError, list, ll)
+        self.assertRaises(TypeError, len, ll)
+
     def _get_more_empty(self, last_key, value_dict):
         return [], None, True
 
@@ -42,6 +42,7 @@ class Entity(object):
     """
     Represents an entity to be monitored.
     """
+    __slots__ = ('id', 'label', 'extra', 'ip_addresses', 'agent_id', 'driver', 'uri')
 
     def __init__(self, id, label, ip_addresses, agent_id, driver, uri=None, extra=None):
         """
@@ -77,6 +78,8 @@ class Entity(object):
 
 
 class Notification(object):
+    __slots__ = ('id', 'label', 'type', 'details', 'driver')
+
     def __init__(self, id, label, type, details, driver=None):
         self.id = id
         self.label = label
@@ -138,6 +141,9 @@ class NotificationType(object):
 
 
 class Alarm(object):
+    __slots__ = ('id', 'label', 'check_type', 'check_id', 'criteria', 'driver',
+                 'notification_plan_id', 'entity_id', 'extra')
+
     def __init__(self, id, label, criteria, driver, entity_id, extra,
                  check_type=None, check_id=None, notification_plan_id=None):
         self.id = id
@@ -161,6 +167,10 @@ class Alarm(object):
 
 
 class Check(object):
+    __slots__ = ('id', 'label', 'timeout', 'period', 'monitoring_zones',
+                 'target_alias', 'target_hostname', 'target_resolver', 'type',
+                 'details', 'entity_id', 'disabled', 'driver', 'extra')
+
     def __init__(self, id, label, timeout, period, monitoring_zones,
                  target_alias, target_hostname, target_resolver, type, details,
                  entity_id, disabled, extra, driver):
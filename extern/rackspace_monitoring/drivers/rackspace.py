@@ -13,7 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from __future__ import with_statement
+
+import re
 import sys
+import time
+import threading
 
 try:
     import simplejson as json
@@ -22,12 +27,14 @@ except:
 
 from libcloud.utils.py3 import httplib, urlparse
 from libcloud.common.types import MalformedResponseError, LibcloudError
+from libcloud.common.types import InvalidCredsError
 from libcloud.common.types import LazyList
-from libcloud.common.base import Response
+from libcloud.common.base import Response, ConnectionPool
 
 from rackspace_monitoring.providers import Provider
 from rackspace_monitoring.utils import to_underscore_separated
 from rackspace_monitoring.utils import value_to_bool
+from rackspace_monitoring.utils import intern_value
 
 from rackspace_monitoring.base import (MonitoringDriver, Entity,
                                       NotificationPlan, MonitoringZone,
@@ -61,6 +68,23 @@ class RackspaceMonitoringValidationError(LibcloudError):
         return string.encode('utf-8')
 
 
+class RackspaceMonitoringRateLimitError(LibcloudError):
+    """
+    The API answered 413 (over limit) or 429 (too many requests).
+    retry_after is the number of seconds the server asked us to wait, if any.
+    """
+
+    def __init__(self, status, message, retry_after, driver):
+        self.status = status
+        self.retry_after = retry_after
+        super(RackspaceMonitoringRateLimitError, self).__init__(value=message,
+                                                                driver=driver)
+
+    def __repr__(self):
+        return '<RateLimitError status=%s, retry_after=%s, message="%s">' % (
+            self.status, self.retry_after, self.value)
+
+
 class RackspaceMonitoringResponse(Response):
 
     valid_response_codes = [httplib.CONFLICT]
@@ -108,9 +132,168 @@ class RackspaceMonitoringResponse(Response):
                                                driver=self.connection.driver)
             raise error
 
+        if self.status == httplib.UNAUTHORIZED:
+            # lets the connection re-authenticate
+            raise InvalidCredsError(body)
+
+        if self.status in RATE_LIMIT_CODES:
+            if isinstance(body, dict):
+                message = body.get('message', body)
+            else:
+                message = body
+            raise RackspaceMonitoringRateLimitError(status=self.status,
+                                message=message,
+                                retry_after=_parse_retry_after(self.headers),
+                                driver=self.connection.driver)
+
         return body
 
 
+RATE_LIMIT_CODES = [httplib.REQUEST_ENTITY_TOO_LARGE, 429]
+
+WINDOW_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# rate limits other than 'global' and the (POST) requests they count
+RATE_BUCKETS = [('test_check', re.compile(r'(/test-check|/checks/[^/]+/test)$')),
+                ('test_alarm', re.compile(r'/test-alarm$')),
+                ('test_notification',
+                 re.compile(r'(/test-notification|/notifications/[^/]+/test)$')),
+                ('traceroute', re.compile(r'/traceroute$'))]
+
+
+def _parse_retry_after(headers):
+    value = headers.get('retry-after', headers.get('Retry-After'))
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        # missing, or an HTTP date, fall back to our own backoff
+        return None
+
+
+def _parse_window(window):
+    """
+    '24.0 hours' -> 86400.0
+    """
+    try:
+        amount, unit = window.split()
+        return float(amount) * WINDOW_UNITS[unit.rstrip('s')]
+    except (AttributeError, ValueError, KeyError):
+        return float(WINDOW_UNITS['day'])
+
+
+def _rate_bucket(action, method):
+    if method != 'POST':
+        return None
+    for name, pattern in RATE_BUCKETS:
+        if pattern.search(action):
+            return name
+    return None
+
+
+class RateLimiter(object):
+    """
+    Spends the request budget reported by /limits.
+
+    Calls go through as fast as they are made while a window has budget
+    left. Once a limit is used up, callers wait for the window to roll over,
+    re-reading /limits (through refresh) every poll_interval seconds in
+    case the server's window started before ours did. A 413/429 pauses
+    every caller for the time the server asked for.
+
+    We don't know when the server's window started, so a window is assumed
+    to start when its limits were read.
+    """
+
+    def __init__(self, limits, refresh=None, poll_interval=60):
+        self.refresh = refresh
+        self.poll_interval = poll_interval
+        self.waited = 0.0
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._pause_until = 0
+        self._refreshed_at = 0
+        self.update(limits)
+
+    def update(self, limits):
+        now = time.time()
+        with self._lock:
+            self._refreshed_at = now
+            for name, rate in (limits or {}).get('rate', {}).items():
+                window = _parse_window(rate.get('window'))
+                self._buckets[name] = {'limit': rate['limit'],
+                                       'used': rate.get('used', 0),
+                                       'window': window,
+                                       'reset': now + window}
+
+    def remaining(self, name='global'):
+        bucket = self._buckets.get(name)
+        if not bucket:
+            return None
+        return max(0, bucket['limit'] - bucket['used'])
+
+    def _reserve(self, names):
+        """
+        take one request from every bucket in names, or return how long to
+        wait before trying again
+        """
+        now = time.time()
+        if self._pause_until > now:
+            return self._pause_until - now
+
+        buckets = [self._buckets[name] for name in names
+                   if name in self._buckets]
+        for bucket in buckets:
+            if now >= bucket['reset']:
+                bucket['used'] = 0
+                bucket['reset'] = now + bucket['window']
+
+        full = [b for b in buckets if b['used'] >= b['limit']]
+        if full:
+            return max(0.0, min(b['reset'] for b in full) - now)
+
+        for bucket in buckets:
+            bucket['used'] += 1
+        return 0
+
+    def acquire(self, action, method):
+        names = ['global']
+        name = _rate_bucket(action, method)
+        if name:
+            names.append(name)
+
+        while True:
+            with self._lock:
+                wait = self._reserve(names)
+            if not wait:
+                return
+
+            wait = min(wait, self.poll_interval)
+            self.waited += wait
+            time.sleep(wait)
+            self._refresh()
+
+    def _refresh(self):
+        with self._lock:
+            if not self.refresh or \
+               time.time() - self._refreshed_at < self.poll_interval:
+                return
+            # claim it so the other waiting callers don't refresh too
+            self._refreshed_at = time.time()
+
+        try:
+            self.update(self.refresh())
+        except RackspaceMonitoringRateLimitError:
+            pass
+
+    def backoff(self, delay):
+        """
+        the server pushed back, hold every caller for delay seconds
+        """
+        with self._lock:
+            self._pause_until = max(self._pause_until, time.time() + delay)
+
+
 class RackspaceMonitoringConnection(OpenStackBaseConnection):
     """
     Base connection class for the Rackspace Monitoring driver.
@@ -121,16 +304,27 @@ class RackspaceMonitoringConnection(OpenStackBaseConnection):
     auth_url = AUTH_URL_US
     _url_key = "monitoring_url"
 
+    # retries of a call the server answered with 413/429, and the longest
+    # we back off between them when the server doesn't say
+    rate_limit_retries = 5
+    max_backoff = 60
+
     def __init__(self, user_id, key, secure=False, ex_force_base_url=API_URL,
-                 ex_force_auth_url=None, ex_force_auth_version='2.0'):
+                 ex_force_auth_url=None, ex_force_auth_version='2.0',
+                 ex_auth_cache=None):
         self.api_version = API_VERSION
+        self.rate_limiter = None
         self.monitoring_url = ex_force_base_url
         self.accept_format = 'application/json'
+        # every monitoring API call goes to the same host, keep the sockets
+        # (and TLS sessions) around between requests
+        self.connection_pool = ConnectionPool()
         super(RackspaceMonitoringConnection, self).__init__(user_id, key,
                                 secure=secure,
                                 ex_force_base_url=ex_force_base_url,
                                 ex_force_auth_url=ex_force_auth_url,
-                                ex_force_auth_version=ex_force_auth_version)
+                                ex_force_auth_version=ex_force_auth_version,
+                                ex_auth_cache=ex_auth_cache)
 
     def request(self, action, params=None, data='', headers=None, method='GET',
                 raw=False):
@@ -145,26 +339,73 @@ class RackspaceMonitoringConnection(OpenStackBaseConnection):
             headers['Content-Type'] = 'application/json; charset=UTF-8'
             data = json.dumps(data)
 
-        return super(RackspaceMonitoringConnection, self).request(
-            action=action,
-            params=params, data=data,
-            method=method, headers=headers,
-            raw=raw
-        )
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire(action, method)
+
+            try:
+                return super(RackspaceMonitoringConnection, self).request(
+                    action=action,
+                    params=params, data=data,
+                    method=method, headers=headers,
+                    raw=raw
+                )
+            except RackspaceMonitoringRateLimitError:
+                e = sys.exc_info()[1]
+                attempt += 1
+                if attempt > self.rate_limit_retries:
+                    raise
+
+                delay = e.retry_after
+                if delay is None:
+                    delay = min(2 ** attempt, self.max_backoff)
+
+                if self.rate_limiter:
+                    self.rate_limiter.backoff(delay)
+                else:
+                    time.sleep(delay)
+
+    def enable_rate_limiter(self, poll_interval=60):
+        """
+        read /limits and pace every following request against it
+        """
+        def refresh():
+            return super(RackspaceMonitoringConnection, self).request(
+                action='/limits', headers={'Accept': 'application/json'}).object
+
+        self.rate_limiter = RateLimiter(refresh(), refresh=refresh,
+                                        poll_interval=poll_interval)
+        return self.rate_limiter
 
 
 class RackspaceMonitoringDriver(MonitoringDriver):
     """
     Base Rackspace Monitoring driver.
 
+    By default create_* and update_* fetch the object they wrote from the API
+    once more. With ex_refetch=False (on the driver or per call) the returned
+    object is built from the submitted data and the ids in the location
+    header instead. Fields the server fills in with defaults (e.g. check
+    period and timeout) are then None unless they were submitted.
+
+    With ex_rate_limit=True the driver reads /limits once and paces its
+    requests to stay within them (see RateLimiter).
+
+    ex_auth_cache (a path or an OpenStackAuthCache) keeps the auth token and
+    service catalog on disk until the token expires, so new drivers don't
+    authenticate again.
     """
     name = 'Rackspace Monitoring'
     connectionCls = RackspaceMonitoringConnection
 
     def __init__(self, *args, **kwargs):
+        self.ex_refetch = kwargs.pop('ex_refetch', True)
+        ex_rate_limit = kwargs.pop('ex_rate_limit', False)
         self._ex_force_base_url = kwargs.pop('ex_force_base_url', None)
         self._ex_force_auth_url = kwargs.pop('ex_force_auth_url', None)
         self._ex_force_auth_version = kwargs.pop('ex_force_auth_version', None)
+        self._ex_auth_cache = kwargs.pop('ex_auth_cache', None)
         super(RackspaceMonitoringDriver, self).__init__(*args, **kwargs)
 
         self.connection._populate_hosts_and_request_paths()
@@ -176,6 +417,9 @@ class RackspaceMonitoringDriver(MonitoringDriver):
         self.connection._ex_force_base_url = '%s/%s' % (
                 self.connection._ex_force_base_url, tenant_id)
 
+        if ex_rate_limit:
+            self.connection.enable_rate_limiter()
+
     def _ex_connection_class_kwargs(self):
         rv = {}
         if self._ex_force_base_url:
@@ -184,6 +428,8 @@ class RackspaceMonitoringDriver(MonitoringDriver):
             rv['ex_force_auth_url'] = self._ex_force_auth_url
         if self._ex_force_auth_version:
             rv['ex_force_auth_version'] = self._ex_force_auth_version
+        if self._ex_auth_cache:
+            rv['ex_auth_cache'] = self._ex_auth_cache
         return rv
 
     def _get_more(self, last_key, value_dict):
@@ -256,7 +502,24 @@ class RackspaceMonitoringDriver(MonitoringDriver):
 
         return rv
 
-    def _create(self, url, data, coerce):
+    def _refetch(self, kwargs):
+        refetch = kwargs.get('ex_refetch')
+        if refetch is None:
+            return self.ex_refetch
+        return refetch
+
+    def _build(self, to_obj, obj_id, data, base, value_dict=None):
+        """
+        Build an object from what we sent instead of fetching it again.
+
+        @param base: API representation of the object before the write
+        """
+        obj = dict(base)
+        obj.update(data)
+        obj['id'] = obj_id
+        return to_obj(obj, value_dict or {})
+
+    def _create(self, url, data, coerce, kwargs=None, build=None):
         params = {}
 
         for k in data.keys():
@@ -282,11 +545,13 @@ class RackspaceMonitoringDriver(MonitoringDriver):
             if not location:
                 raise LibcloudError('Missing location header')
             obj_ids = self._url_to_obj_ids(location)
+            if build and not self._refetch(kwargs or {}):
+                return build(obj_ids, data)
             return coerce(**obj_ids)
         else:
             raise LibcloudError('Unexpected status code: %s' % (resp.status))
 
-    def _update(self, url, data, kwargs, coerce):
+    def _update(self, url, data, kwargs, coerce, build=None):
         params = {}
 
         for k in data.keys():
@@ -310,6 +575,8 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                 raise LibcloudError('Missing location header')
 
             obj_ids = self._url_to_obj_ids(location)
+            if build and not self._refetch(kwargs):
+                return build(obj_ids, data)
             return coerce(**obj_ids)
         else:
             raise LibcloudError('Unexpected status code: %s' % (resp.status))
@@ -377,20 +644,22 @@ class RackspaceMonitoringDriver(MonitoringDriver):
     def _to_alarm(self, alarm, value_dict):
         return Alarm(id=alarm['id'],
             label=alarm.get('label'),
-            check_type=alarm.get('check_type'),
+            check_type=intern_value(alarm.get('check_type')),
             check_id=alarm.get('check_id'),
             criteria=alarm['criteria'],
             notification_plan_id=alarm['notification_plan_id'],
-            extra=alarm['metadata'],
+            extra=intern_value(alarm['metadata']),
             driver=self, entity_id=value_dict['entity_id'])
 
-    def list_alarms(self, entity, ex_next_marker=None):
+    def list_alarms(self, entity, ex_next_marker=None, ex_prefetch=False,
+                    ex_retain=True):
         value_dict = {'url': '/entities/%s/alarms' % (entity.id),
                       'start_marker': ex_next_marker,
                       'list_item_mapper': self._to_alarm,
                       'entity_id': entity.id}
 
-        return LazyList(get_more=self._get_more, value_dict=value_dict)
+        return LazyList(get_more=self._get_more, value_dict=value_dict,
+                        prefetch=ex_prefetch, retain=ex_retain)
 
     def list_alarm_changelog(self, ex_next_marker=None):
         value_dict = {'url': '/changelogs/alarms',
@@ -414,10 +683,19 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                                                             alarm.id),
                             kwargs=kwargs)
 
+    def _alarm_to_dict(self, alarm):
+        return {'label': alarm.label, 'check_type': alarm.check_type,
+                'check_id': alarm.check_id, 'criteria': alarm.criteria,
+                'notification_plan_id': alarm.notification_plan_id,
+                'metadata': alarm.extra}
+
     def update_alarm(self, alarm, data, **kwargs):
+        build = lambda obj_ids, data: self._build(self._to_alarm,
+            obj_ids['alarm_id'], data, self._alarm_to_dict(alarm),
+            {'entity_id': alarm.entity_id})
         return self._update("/entities/%s/alarms/%s" % (alarm.entity_id,
                                                         alarm.id),
-            data=data, kwargs=kwargs, coerce=self.get_alarm)
+            data=data, kwargs=kwargs, coerce=self.get_alarm, build=build)
 
     def create_alarm(self, entity, **kwargs):
         data = {'who': kwargs.get('who'),
@@ -428,8 +706,12 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                 'metadata': kwargs.get('metadata'),
                 'notification_plan_id': kwargs.get('notification_plan_id')}
 
+        base = {'label': None, 'criteria': None, 'notification_plan_id': None,
+                'metadata': {}}
+        build = lambda obj_ids, data: self._build(self._to_alarm,
+            obj_ids['alarm_id'], data, base, {'entity_id': entity.id})
         return self._create("/entities/%s/alarms" % (entity.id),
-            data=data, coerce=self.get_alarm)
+            data=data, coerce=self.get_alarm, kwargs=kwargs, build=build)
 
     def test_alarm(self, entity, **kwargs):
         data = {'criteria': kwargs.get('criteria'),
@@ -452,8 +734,8 @@ class RackspaceMonitoringDriver(MonitoringDriver):
 
     def _to_notification(self, notification, value_dict):
         return Notification(id=notification['id'], label=notification['label'],
-                            type=notification['type'],
-                            details=notification['details'], driver=self)
+                            type=intern_value(notification['type']),
+                            details=intern_value(notification['details']), driver=self)
 
     def get_notification(self, notification_id):
         resp = self.connection.request("/notifications/%s" % (notification_id))
@@ -464,9 +746,17 @@ class RackspaceMonitoringDriver(MonitoringDriver):
         return self._delete(url="/notifications/%s" % (notification.id),
                             kwargs=kwargs)
 
+    def _notification_to_dict(self, notification):
+        return {'label': notification.label, 'type': notification.type,
+                'details': notification.details}
+
     def update_notification(self, notification, data, **kwargs):
+        build = lambda obj_ids, data: self._build(self._to_notification,
+            obj_ids['notification_id'], data,
+            self._notification_to_dict(notification))
         return self._update('/notifications/%s' % (notification.id),
-            data=data, kwargs=kwargs, coerce=self.get_notification)
+            data=data, kwargs=kwargs, coerce=self.get_notification,
+            build=build)
 
     def create_notification(self, **kwargs):
         data = {'who': kwargs.get('who'),
@@ -475,8 +765,11 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                 'type': kwargs.get('type'),
                 'details': kwargs.get('details')}
 
+        build = lambda obj_ids, data: self._build(self._to_notification,
+            obj_ids['notification_id'], data, {'details': {}})
         return self._create("/notifications", data=data,
-                            coerce=self.get_notification)
+                            coerce=self.get_notification, kwargs=kwargs,
+                            build=build)
 
     def test_existing_notification(self, notification):
         resp = self.connection.request('/notifications/%s/test' % (notification.id),
@@ -521,10 +814,19 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                       'list_item_mapper': self._to_notification_plan}
         return LazyList(get_more=self._get_more, value_dict=value_dict)
 
+    def _notification_plan_to_dict(self, notification_plan):
+        return {'label': notification_plan.label,
+                'critical_state': notification_plan.critical_state,
+                'warning_state': notification_plan.warning_state,
+                'ok_state': notification_plan.ok_state}
+
     def update_notification_plan(self, notification_plan, data, **kwargs):
+        build = lambda obj_ids, data: self._build(self._to_notification_plan,
+            obj_ids['notification_plan_id'], data,
+            self._notification_plan_to_dict(notification_plan))
         return self._update("/notification_plans/%s" % (notification_plan.id),
             data=data, kwargs=kwargs,
-            coerce=self.get_notification_plan)
+            coerce=self.get_notification_plan, build=build)
 
     def create_notification_plan(self, **kwargs):
         data = {'who': kwargs.get('who'),
@@ -534,8 +836,11 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                 'warning_state': kwargs.get('warning_state', []),
                 'ok_state': kwargs.get('ok_state', []),
                 }
+        build = lambda obj_ids, data: self._build(self._to_notification_plan,
+            obj_ids['notification_plan_id'], data, {})
         return self._create("/notification_plans", data=data,
-                            coerce=self.get_notification_plan)
+                            coerce=self.get_notification_plan, kwargs=kwargs,
+                            build=build)
 
     ###########
     ## Checks
@@ -552,23 +857,25 @@ class RackspaceMonitoringDriver(MonitoringDriver):
             'label': obj.get('label'),
             'timeout': obj['timeout'],
             'period': obj['period'],
-            'monitoring_zones': obj['monitoring_zones_poll'],
-            'target_alias': obj.get('target_alias', None),
+            'monitoring_zones': intern_value(obj['monitoring_zones_poll']),
+            'target_alias': intern_value(obj.get('target_alias', None)),
             'target_hostname': obj.get('target_hostname', None),
-            'target_resolver': obj.get('target_resolver', None),
-            'type': obj['type'],
-            'details': obj.get('details', {}),
+            'target_resolver': intern_value(obj.get('target_resolver', None)),
+            'type': intern_value(obj['type']),
+            'details': intern_value(obj.get('details', {})),
             'disabled': value_to_bool(obj.get('disabled', '0')),
             'driver': self,
             'entity_id': value_dict['entity_id'],
-            'extra': obj['metadata']})
+            'extra': intern_value(obj['metadata'])})
 
-    def list_checks(self, entity, ex_next_marker=None):
+    def list_checks(self, entity, ex_next_marker=None, ex_prefetch=False,
+                    ex_retain=True):
         value_dict = {'url': "/entities/%s/checks" % (entity.id),
                       'start_marker': ex_next_marker,
                       'list_item_mapper': self._to_check,
                       'entity_id': entity.id}
-        return LazyList(get_more=self._get_more, value_dict=value_dict)
+        return LazyList(get_more=self._get_more, value_dict=value_dict,
+                        prefetch=ex_prefetch, retain=ex_retain)
 
     def _check_kwarg_to_data(self, kwargs):
         filtered = {}
@@ -610,16 +917,33 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                                        method='POST')
         return resp.object
 
+    def _check_to_dict(self, check):
+        return {'label': check.label, 'timeout': check.timeout,
+                'period': check.period,
+                'monitoring_zones_poll': check.monitoring_zones,
+                'target_alias': check.target_alias,
+                'target_hostname': check.target_hostname,
+                'target_resolver': check.target_resolver,
+                'type': check.type, 'details': check.details,
+                'disabled': check.disabled, 'metadata': check.extra}
+
     def create_check(self, entity, **kwargs):
         data = self._check_kwarg_to_data(kwargs)
+        base = {'timeout': None, 'period': None, 'monitoring_zones_poll': [],
+                'metadata': {}}
+        build = lambda obj_ids, data: self._build(self._to_check,
+            obj_ids['check_id'], data, base, {'entity_id': entity.id})
         return self._create("/entities/%s/checks" % (entity.id),
-            data=data, coerce=self.get_check)
+            data=data, coerce=self.get_check, kwargs=kwargs, build=build)
 
     def update_check(self, check, data, **kwargs):
         data = self._check_kwarg_to_data(kwargs=data)
+        build = lambda obj_ids, data: self._build(self._to_check,
+            obj_ids['check_id'], data, self._check_to_dict(check),
+            {'entity_id': check.entity_id})
         return self._update("/entities/%s/checks/%s" % (check.entity_id,
                                                         check.id),
-            data=data, kwargs=kwargs, coerce=self.get_check)
+            data=data, kwargs=kwargs, coerce=self.get_check, build=build)
 
     def delete_check(self, check, **kwargs):
         return self._delete(url="/entities/%s/checks/%s" %
@@ -639,21 +963,23 @@ class RackspaceMonitoringDriver(MonitoringDriver):
         ipaddrs = entity.get('ip_addresses', {})
         if ipaddrs is not None:
             for key in ipaddrs.keys():
-                ips.append((key, ipaddrs[key]))
+                ips.append((intern_value(key), ipaddrs[key]))
         return Entity(id=entity['id'], label=entity['label'],
-                      extra=entity['metadata'], uri=entity.get('uri'), driver=self,
+                      extra=intern_value(entity['metadata']), uri=entity.get('uri'), driver=self,
                       agent_id=entity.get('agent_id'), ip_addresses=ips)
 
     def delete_entity(self, entity, **kwargs):
         return self._delete(url="/entities/%s" % (entity.id),
                             kwargs=kwargs)
 
-    def list_entities(self, ex_next_marker=None):
+    def list_entities(self, ex_next_marker=None, ex_prefetch=False,
+                      ex_retain=True):
         value_dict = {'url': '/entities',
                       'start_marker': ex_next_marker,
                       'list_item_mapper': self._to_entity}
 
-        return LazyList(get_more=self._get_more, value_dict=value_dict)
+        return LazyList(get_more=self._get_more, value_dict=value_dict,
+                        prefetch=ex_prefetch, retain=ex_retain)
 
     def create_entity(self, **kwargs):
         data = {'who': kwargs.get('who'),
@@ -663,11 +989,21 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                 'metadata': kwargs.get('extra', {}),
                 'agent_id': kwargs.get('agent_id')}
 
-        return self._create("/entities", data=data, coerce=self.get_entity)
+        build = lambda obj_ids, data: self._build(self._to_entity,
+            obj_ids['entity_id'], data, {'label': None, 'metadata': {}})
+        return self._create("/entities", data=data, coerce=self.get_entity,
+                            kwargs=kwargs, build=build)
+
+    def _entity_to_dict(self, entity):
+        return {'label': entity.label, 'agent_id': entity.agent_id,
+                'ip_addresses': dict(entity.ip_addresses), 'uri': entity.uri,
+                'metadata': entity.extra}
 
     def update_entity(self, entity, data, **kwargs):
+        build = lambda obj_ids, data: self._build(self._to_entity,
+            obj_ids['entity_id'], data, self._entity_to_dict(entity))
         return self._update("/entities/%s" % (entity.id),
-            data=data, kwargs=kwargs, coerce=self.get_entity)
+            data=data, kwargs=kwargs, coerce=self.get_entity, build=build)
 
     def usage(self):
         resp = self.connection.request("/usage")
@@ -792,12 +1128,14 @@ class RackspaceMonitoringDriver(MonitoringDriver):
                                        method='GET')
         return resp.object
 
-    def ex_views_overview(self, ex_next_marker=None):
+    def ex_views_overview(self, ex_next_marker=None, ex_prefetch=False,
+                          ex_retain=True):
         value_dict = {'url': '/views/overview',
                       'start_marker': ex_next_marker,
                       'list_item_mapper': self._to_overview_obj}
 
-        return LazyList(get_more=self._get_more, value_dict=value_dict)
+        return LazyList(get_more=self._get_more, value_dict=value_dict,
+                        prefetch=ex_prefetch, retain=ex_retain)
 
     def ex_traceroute(self, monitoring_zone, target, target_resolver='IPv4'):
         data = {'target': target, 'target_resolver': target_resolver}
@@ -15,7 +15,8 @@
 
 __all__ = [
     'to_underscore_separated',
-    'value_to_bool'
+    'value_to_bool',
+    'intern_value'
 ]
 
 import re
@@ -37,3 +38,33 @@ def value_to_bool(string):
         return True
 
     return False
+
+
+# a string is only interned while there's room, so a vocabulary that turns
+# out to be open ended can't grow the table without bound
+MAX_INTERNED = 4096
+_interned = {}
+
+
+def intern_value(value):
+    """
+    One shared copy of a string from a small, closed vocabulary that many
+    objects repeat (check types, monitoring zones, metadata keys...). Lists
+    get their items interned, dicts their keys. Don't pass it labels, ids or
+    anything else every object has its own of.
+    """
+    if isinstance(value, basestring):
+        shared = _interned.get(value)
+        if shared is not None:
+            return shared
+        if len(_interned) >= MAX_INTERNED:
+            return value
+        return _interned.setdefault(value, value)
+
+    if isinstance(value, list):
+        return [intern_value(v) for v in value]
+
+    if isinstance(value, dict):
+        return dict((intern_value(k), v) for k, v in value.items())
+
+    return value
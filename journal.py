@@ -0,0 +1,201 @@
+"""
+journal.py - append-only record of the Rackspace objects a migration has committed
+
+Every entity, check, notification, notification plan and alarm that was created,
+updated or found unchanged is written as one JSON line, together with its
+Rackspace id. A run started with --resume rebuilds those objects from the journal
+instead of listing and diffing them again.
+"""
+import os
+import json
+import threading
+
+import logging
+log = logging.getLogger('maas_migration')
+
+from rackspace_monitoring.base import Entity, Check, Notification, NotificationPlan, Alarm
+
+
+def _entity_to_record(entity):
+    return {'id': entity.id,
+            'label': entity.label,
+            'ip_addresses': dict(entity.ip_addresses),
+            'agent_id': entity.agent_id,
+            'uri': entity.uri,
+            'metadata': entity.extra}
+
+
+def _record_to_entity(record, driver):
+    return Entity(id=record['id'], label=record['label'], ip_addresses=record['ip_addresses'].items(),
+                  agent_id=record['agent_id'], uri=record['uri'], extra=record['metadata'], driver=driver)
+
+
+def _check_to_record(check):
+    return {'id': check.id,
+            'entity_id': check.entity_id,
+            'label': check.label,
+            'type': check.type,
+            'details': check.details,
+            'monitoring_zones': check.monitoring_zones,
+            'target_alias': check.target_alias,
+            'disabled': check.disabled,
+            'metadata': check.extra}
+
+
+def _record_to_check(record, driver):
+    return Check(id=record['id'], entity_id=record['entity_id'], label=record['label'], type=record['type'],
+                 details=record['details'], monitoring_zones=record['monitoring_zones'],
+                 target_alias=record['target_alias'], disabled=record['disabled'], extra=record['metadata'],
+                 timeout=None, period=None, target_hostname=None, target_resolver=None, driver=driver)
+
+
+def _notification_to_record(notification):
+    return {'id': notification.id,
+            'label': notification.label,
+            'type': notification.type,
+            'details': notification.details}
+
+
+def _record_to_notification(record, driver):
+    return Notification(id=record['id'], label=record['label'], type=record['type'],
+                        details=record['details'], driver=driver)
+
+
+def _plan_to_record(plan):
+    return {'id': plan.id,
+            'label': plan.label,
+            'critical_state': plan.critical_state,
+            'warning_state': plan.warning_state,
+            'ok_state': plan.ok_state}
+
+
+def _record_to_plan(record, driver):
+    return NotificationPlan(id=record['id'], label=record['label'], critical_state=record['critical_state'],
+                            warning_state=record['warning_state'], ok_state=record['ok_state'], driver=driver)
+
+
+def _alarm_to_record(alarm):
+    return {'id': alarm.id,
+            'entity_id': alarm.entity_id,
+            'label': alarm.label,
+            'check_id': alarm.check_id,
+            'criteria': alarm.criteria,
+            'notification_plan_id': alarm.notification_plan_id,
+            'metadata': alarm.extra}
+
+
+def _record_to_alarm(record, driver):
+    return Alarm(id=record['id'], entity_id=record['entity_id'], label=record['label'], check_id=record['check_id'],
+                 criteria=record['criteria'], notification_plan_id=record['notification_plan_id'],
+                 extra=record['metadata'], driver=driver)
+
+
+_converters = {
+    'entity': (_entity_to_record, _record_to_entity),
+    'check': (_check_to_record, _record_to_check),
+    'notification': (_notification_to_record, _record_to_notification),
+    'plan': (_plan_to_record, _record_to_plan),
+    'alarm': (_alarm_to_record, _record_to_alarm)
+}
+
+
+def to_record(kind, obj):
+    """
+    JSON-serializable record of a rackspace_monitoring object
+    """
+    return _converters[kind][0](obj)
+
+
+def from_record(kind, record, driver):
+    return _converters[kind][1](record, driver)
+
+
+class Journal(object):
+    """
+    kinds are 'entity', 'check', 'notification', 'plan' and 'alarm'. keys are the
+    Cloudkick side of the mapping (node id, check id, notification type and
+    normalized address, plan label)
+
+    a journal without a path records nothing and never has anything to resume.
+    with retain=False, new records only go to the file (get() still sees the
+    ones loaded for resuming), so a long run doesn't keep them all in memory
+    """
+
+    def __init__(self, path=None, resume=False, retain=True):
+        self.path = path
+        self.resume = resume
+        self.retain = retain
+
+        self._records = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+        if not path:
+            return
+
+        if resume:
+            self._load()
+            log.info('Resuming from %s - %s objects already migrated' % (path, len(self._records)))
+        else:
+            log.info('Starting a new journal in %s' % path)
+
+        self._file = open(path, 'a' if resume else 'w')
+
+        # don't glue the first new record onto a line cut short by a crash
+        if resume and os.path.getsize(path) > 0:
+            f = open(path)
+            f.seek(-1, 2)
+            if f.read(1) != '\n':
+                self._file.write('\n')
+            f.close()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _load(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            return
+
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line cut short by a crash, everything before it is still good
+                continue
+            self._records[(record['kind'], record['key'])] = record
+        f.close()
+
+    def add(self, kind, key, obj, action):
+        """
+        record that obj (a rackspace_monitoring object) is committed upstream
+        """
+        if not self._file:
+            return
+
+        record = to_record(kind, obj)
+        record.update({'kind': kind, 'key': key, 'action': action})
+
+        with self._lock:
+            if self.retain:
+                self._records[(kind, key)] = record
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def get(self, kind, key, driver):
+        """
+        rebuild the rackspace_monitoring object recorded for key, if resuming
+        """
+        if not self.resume:
+            return None
+
+        record = self._records.get((kind, key))
+        if not record:
+            return None
+        return from_record(kind, record, driver)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -8,16 +8,26 @@ SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path = [SCRIPT_DIR, os.path.join(SCRIPT_DIR, "extern")] + sys.path
 
 from optparse import OptionParser
+from collections import defaultdict
 
 from entities import EntityMigrator
 from checks import CheckMigrator
 from notifications import NotificationMigrator
 from alarms import AlarmMigrator
+from journal import Journal
+from preflight import ResultCache
+from request_stats import RequestStats
+from migration_plan import MigrationPlan, PlanningDriver
+from pipeline import NodePipeline
+
+import shards
 
 from tests.runner import run_tests
 
 import utils
 
+import time
+import threading
 import traceback
 import logging
 log = logging.getLogger('maas_migration')
@@ -29,74 +39,324 @@ class Migrator(object):
     rs_api = None
 
     _rs_entities_cache = None
+    _rs_entity_index = None
+    _rs_checks_cache = None  # dict - entity id -> checks, filled by load_rs_snapshot()
+    _rs_alarms_cache = None  # dict - entity id -> alarms, filled by load_rs_snapshot()
 
     migrated_entities = None
+    monitor_checks = None  # dict - cloudkick monitor id -> migrated checks, filled by the check phase
 
-    def __init__(self, ck_api, rs_api, config, options):
+    def __init__(self, ck_api, rs_api, config, options, journal=None, test_cache=None, request_stats=None,
+                 coordinator=None):
         self.config = config
         self.options = options
         self.ck_api = ck_api
         self.rs_api = rs_api
 
+        # records committed objects, so an interrupted run can be resumed
+        self.journal = journal if journal is not None else Journal()
+        # passing check/alarm test results, so unchanged checks aren't tested again
+        self.test_cache = test_cache if test_cache is not None else ResultCache()
+        # latency and counts of every API request, per endpoint and phase
+        self.request_stats = request_stats if request_stats is not None else RequestStats()
+        self.request_stats.install(ck_api, rs_api)
+        # notifications and plans shared with the other shards, None unless sharded
+        self.coordinator = coordinator
+
         self.migrated_entities = []
+        self.monitor_checks = defaultdict(list)
+        # pipelined nodes may all want the entity index first
+        self._index_lock = threading.Lock()
 
     def _print_report(self):
+        log.info('\nRequests')
+        log.info('--------\n')
+        log.info(self.request_stats.format_table())
+        log.info('')
         log.info('DONE')
 
+    def load_rs_snapshot(self):
+        """
+        reads every entity together with its checks and alarms from the overview
+        view, which costs a few pages instead of a list_checks and a list_alarms
+        call per entity
+        """
+        entities = []
+        self._rs_checks_cache = {}
+        self._rs_alarms_cache = {}
+        # stream the pages, fetching the next one while this one is processed
+        for overview in self.rs_api.ex_views_overview(ex_prefetch=True, ex_retain=False):
+            entity = overview['entity']
+            entities.append(entity)
+            self._rs_checks_cache[entity.id] = overview['checks']
+            self._rs_alarms_cache[entity.id] = overview['alarms']
+
+        self._rs_entities_cache = entities
+        self._rs_entity_index = None
+
     def get_rs_entities(self):
-        if not self._rs_entities_cache:
+        if self._rs_entities_cache is None:
             self._rs_entities_cache = self.rs_api.list_entities()
         return self._rs_entities_cache
 
+    def get_rs_checks(self, rs_entity):
+        if self._rs_checks_cache is not None:
+            return self._rs_checks_cache.get(rs_entity.id, [])
+        return self.rs_api.list_checks(rs_entity)
+
+    def get_rs_alarms(self, rs_entity):
+        if self._rs_alarms_cache is not None:
+            return self._rs_alarms_cache.get(rs_entity.id, [])
+        return self.rs_api.list_alarms(rs_entity)
+
+    def get_rs_entity_index(self):
+        """
+        returns a (by_ck_node_id, by_public_ip) tuple of lookup dicts built once from
+        get_rs_entities(). values are (position, entity) so callers can keep the
+        list-order precedence, only the first entity for each key is kept.
+
+        entities already tagged with a ck_node_id are never matched by ip
+        """
+        with self._index_lock:
+            if self._rs_entity_index is None:
+                by_ck_node_id = {}
+                by_public_ip = {}
+                for i, e in enumerate(self.get_rs_entities()):
+                    ck_node_id = e.extra.get('ck_node_id')
+                    if ck_node_id:
+                        by_ck_node_id.setdefault(ck_node_id, (i, e))
+                        continue
+                    for label, ip in e.ip_addresses:
+                        if 'public' in label:
+                            by_public_ip.setdefault(ip, (i, e))
+                self._rs_entity_index = (by_ck_node_id, by_public_ip)
+            return self._rs_entity_index
+
     def migrate(self):
+        # when resuming, most objects come out of the journal. the rest are
+        # looked up one entity at a time, and so are they when streaming
+        if not self.journal.resume and not self.options.stream:
+            self.request_stats.set_phase('snapshot')
+            self.load_rs_snapshot()
+
+        if self.options.pipeline:
+            self.request_stats.set_phase('pipeline')
+            NodePipeline(self).migrate()
+            self._print_report()
+            return
+
+        self.request_stats.set_phase('entities')
         e = EntityMigrator(self)
         e.migrate()
+        self.request_stats.set_phase('checks')
         c = CheckMigrator(self)
         c.migrate()
+        self.request_stats.set_phase('notifications')
         n = NotificationMigrator(self)
         n.migrate()
+        self.request_stats.set_phase('alarms')
         a = AlarmMigrator(self)
         a.migrate()
         self._print_report()
 
 
+def _delete(obj, name, progress, attempts=5):
+    """
+    delete a RS object, retrying with backoff while the API answers with a conflict
+    """
+    for attempt in range(attempts):
+        try:
+            deleted = obj.delete()
+        except Exception as ex:
+            log.info('failed deleting %s %s: %s' % (name, obj.id, ex))
+            return False
+
+        if deleted:
+            log.info('deleted %s: %s' % (name, obj.id))
+            progress.add()
+            return True
+
+        time.sleep(0.5 * 2 ** attempt)
+
+    log.info('failed deleting %s %s: conflict' % (name, obj.id))
+    return False
+
+
+def _purge_entity(overview, progress):
+    """
+    alarms before checks before the entity itself
+    """
+    for a in overview['alarms']:
+        _delete(a, 'alarm', progress)
+    for c in overview['checks']:
+        _delete(c, 'check', progress)
+    _delete(overview['entity'], 'entity', progress)
+
+
+def _drain(queue):
+    for _, ex in queue.results():
+        if ex:
+            log.error('purge failed: %s' % ex)
+
+
 def _clean(args, options, config, rs, ck):
     do_clean = utils.get_input('Do you want to purge all Rackspace cloud monitoring data?', options=['y', 'n'], default='n') == 'y'
     if not do_clean:
         log.info('exiting...')
         sys.exit(0)
 
-    for e in rs.list_entities():
-        for a in rs.list_alarms(e):
-            a.delete()
-            log.info('deleted alarm: %s' % a.id)
-        for c in rs.list_checks(e):
-            c.delete()
-            log.info('deleted check: %s' % c.id)
-        try:
-            e.delete()
-            log.info('deleted entity: %s' % e.id)
-        except Exception as ex:
-            log.info('failed deleting entity %s: %s' % (e.id, ex))
+    progress = utils.Progress('deleted objects')
 
-    for n in rs.list_notifications():
-        n.delete()
-        log.info('deleted notification: %s' % n.id)
+    # every entity with its checks and alarms in a few requests, each entity is
+    # purged by a single worker so its children always go first
+    queue = utils.WorkQueue(options.concurrency)
+    for overview in rs.ex_views_overview(ex_prefetch=True, ex_retain=False):
+        queue.add(_purge_entity, overview, progress)
+    _drain(queue)
+
+    # plans are only free once the alarms using them are gone, and notifications
+    # once the plans using them are
     for p in rs.list_notification_plans():
-        try:
-            p.delete()
-            log.info('deleted notification plan: %s' % p.id)
-        except Exception as ex:
-            log.info('failed deleting notification plan %s: %s' % (p.id, ex))
+        queue.add(_delete, p, 'notification plan', progress)
+    _drain(queue)
+
+    for n in rs.list_notifications():
+        queue.add(_delete, n, 'notification', progress)
+    _drain(queue)
+
+    progress.done()
+
+
+def _check_journal(path, options):
+    """
+    don't start a new journal over the one an earlier run left behind, unless
+    asked to with --fresh
+    """
+    if options.resume or options.fresh or not path:
+        return
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        log.error('%s has records from an earlier run - add --resume to carry on from them, or --fresh to '
+                  'start a new journal' % path)
+        sys.exit(1)
 
 
 def _migrate(args, options, config, rs, ck):
-    m = Migrator(ck, rs, config, options)
+    if options.stream:
+        options.pipeline = True
+    if options.pipeline and not options.auto:
+        log.error('--pipeline migrates many nodes at once, nothing can be reviewed - add --auto')
+        sys.exit(1)
+
+    _check_journal(options.journal, options)
+
+    coordinator = None
+    if options.shard:
+        ck.node_filter = shards.node_filter(options.shard)
+        coordinator = shards.Coordinator(options.shard_state)
+        log.info('Migrating shard %s/%s of the Cloudkick nodes' % options.shard)
+
+    journal = Journal(options.journal, resume=options.resume, retain=not options.stream)
+    test_cache = ResultCache(options.test_cache)
+    m = Migrator(ck, rs, config, options, journal=journal, test_cache=test_cache, coordinator=coordinator)
+    try:
+        m.migrate()
+    finally:
+        journal.close()
+        test_cache.save()
+        if options.request_stats:
+            m.request_stats.save(options.request_stats)
+
+
+def _migrate_shards(args, options, config):
+    """
+    run the migration as options.workers shard processes
+    """
+    if not options.auto or not (options.pipeline or options.stream or options.no_test):
+        log.error('--workers runs shards nobody can answer prompts for - add --auto, and --pipeline or --no-test')
+        sys.exit(1)
+
+    missing = [name for name in ['cloudkick_oauth_key', 'cloudkick_oauth_secret', 'rackspace_username',
+                                 'rackspace_apikey'] if not config.get(name)]
+    if missing:
+        log.error('--workers runs shards nobody can enter credentials for - set %s in the config file' %
+                  ', '.join(missing))
+        sys.exit(1)
+
+    for i in range(options.workers):
+        _check_journal(shards.shard_path(options.journal, (i, options.workers)), options)
+
+    # authenticate and sync the Cloudkick snapshot once, the shards only read
+    # the auth cache and snapshot
+    utils.setup_rs(config['rackspace_username'], config['rackspace_apikey'], auth_cache=options.auth_cache)
+    if options.ck_snapshot:
+        utils.setup_ck(config['cloudkick_oauth_key'], config['cloudkick_oauth_secret'], snapshot=options.ck_snapshot)
+
+    coordinator = shards.Coordinator(options.shard_state)
+    if not options.resume:
+        coordinator.reset()
+
+    failed = shards.run_workers(os.path.realpath(__file__), sys.argv[1:], options.workers)
+    if failed:
+        log.error('%s of %s shards failed, run them again with --shard i/%s --resume' %
+                  (len(failed), options.workers, options.workers))
+        sys.exit(1)
+    log.info('All %s shards done' % options.workers)
+
+
+def _plan(args, options, config, rs, ck):
+    """
+    work out every change a migration would make and write it to a plan file
+    """
+    path = args[1] if len(args) > 1 else 'migration_plan.json'
+
+    # the plan file is what gets reviewed, and checks can't be tested against
+    # entities that don't exist yet
+    options.auto = True
+    options.no_test = True
+
+    plan = MigrationPlan()
+    m = Migrator(ck, PlanningDriver(rs, plan), config, options, journal=plan)
     m.migrate()
+    plan.save(path)
+
+    for (kind, action), count in sorted(plan.summary().items()):
+        log.info('%s %s: %s' % (action, kind, count))
+    log.info('Wrote %s - run "migrate.py apply %s" to execute it' % (path, path))
+
+
+def _apply(args, options, config, rs, ck):
+    if len(args) < 2:
+        log.error('usage: migrate.py apply <planfile>')
+        sys.exit(1)
+
+    plan = MigrationPlan.load(args[1])
+    if not plan.changes:
+        log.info('Nothing to do')
+        return
+    _check_journal(options.journal, options)
+
+    if not options.auto and utils.get_input('Apply %s changes?' % len(plan.changes), options=['y', 'n'], default='n') != 'y':
+        log.info('exiting...')
+        sys.exit(0)
+
+    journal = Journal(options.journal, resume=options.resume)
+    try:
+        failed = plan.apply(rs, journal, options.concurrency)
+    finally:
+        journal.close()
+
+    if failed:
+        log.error('%s changes failed, run "migrate.py plan" again to retry them' % failed)
 
 
 def _setup(options, args):
 
+    # every shard keeps its own files
+    if options.shard:
+        for name in ['output', 'journal', 'test_cache', 'request_stats']:
+            if getattr(options, name):
+                setattr(options, name, shards.shard_path(getattr(options, name), options.shard))
+
     # setup, read config, init APIs
     utils.setup_logging('DEBUG', output=options.output)
 
@@ -105,8 +365,15 @@ def _setup(options, args):
     else:
         config = utils.get_config(options.config) if options.config else {}
         utils.setup_ssl()
-        ck = utils.setup_ck(config.get('cloudkick_oauth_key'), config.get('cloudkick_oauth_secret'))
-        rs = utils.setup_rs(config.get('rackspace_username'), config.get('rackspace_apikey'))
+
+        if args[0] == 'migrate' and options.workers > 1 and not options.shard:
+            _migrate_shards(args, options, config)
+            return
+
+        # shards read the snapshot, syncing it is up to whoever starts them
+        ck = utils.setup_ck(config.get('cloudkick_oauth_key'), config.get('cloudkick_oauth_secret'),
+                            snapshot=options.ck_snapshot, sync=not options.shard)
+        rs = utils.setup_rs(config.get('rackspace_username'), config.get('rackspace_apikey'), auth_cache=options.auth_cache)
 
         # do work
         if args[0] == 'shell':
@@ -120,26 +387,55 @@ def _setup(options, args):
             _clean(args, options, config, rs, ck)
         elif args[0] == 'migrate':
             _migrate(args, options, config, rs, ck)
+        elif args[0] == 'plan':
+            _plan(args, options, config, rs, ck)
+        elif args[0] == 'apply':
+            _apply(args, options, config, rs, ck)
         else:
             parser.print_usage()
 
 if __name__ == "__main__":
-    usage = 'usage: %prog [options] migrate/clean/shell'
+    usage = 'usage: %prog [options] migrate/plan [planfile]/apply <planfile>/clean/shell'
     parser = OptionParser(usage=usage)
     parser.add_option("-c", "--config", dest="config", help="path to config file", metavar="FILE")
     parser.add_option("-o", "--output", dest="output", help="path to logfile", metavar="FILE")
+    parser.add_option("--auth-cache", dest="auth_cache", metavar="FILE", help="reuse the Rackspace auth token stored in FILE until it expires (e.g. ~/.maas_auth_cache.json)")
+    parser.add_option("--ck-snapshot", dest="ck_snapshot", metavar="FILE", help="keep a copy of the Cloudkick account in FILE and only re-read what changed since the last run")
     parser.add_option("-a", "--auto", action="store_true", dest="auto", default=False, help="don't prompt for anything")
+    parser.add_option("-b", "--batch", action="store_true", dest="batch", default=False, help="review changes in groups of the same kind and shape instead of one by one")
     parser.add_option("--no-test", action="store_true", dest="no_test", default=False, help="Do *NOT* test checks and alarms before they are created")
+    parser.add_option("--test-concurrency", type="int", dest="test_concurrency", default=4, metavar="N", help="run up to N check/alarm tests at once (default: 4)")
+    parser.add_option("--test-cache", dest="test_cache", default="migration_test_cache.json", metavar="FILE", help="path to the cache of passing check/alarm tests (default: migration_test_cache.json)")
+    parser.add_option("-j", "--journal", dest="journal", default="migration_journal.jsonl", metavar="FILE", help="path to the migration journal (default: migration_journal.jsonl)")
+    parser.add_option("--resume", action="store_true", dest="resume", default=False, help="skip everything already recorded in the journal by a previous run")
+    parser.add_option("--fresh", action="store_true", dest="fresh", default=False, help="start a new journal, even if the file has records from an earlier run")
+    parser.add_option("--concurrency", type="int", dest="concurrency", default=1, metavar="N", help="save entities, checks and alarms with N worker threads (default: 1)")
+    parser.add_option("--pipeline", action="store_true", dest="pipeline", default=False, help="migrate every node through entity, checks and alarms on its own instead of phase by phase (needs --auto)")
+    parser.add_option("--stream", action="store_true", dest="stream", default=False, help="like --pipeline, but forget every node once it's migrated, so memory doesn't grow with the account")
+    parser.add_option("--request-stats", dest="request_stats", metavar="FILE", help="write per endpoint and per phase API request stats to FILE as JSON")
+    parser.add_option("--shard", dest="shard", metavar="i/N", help="only migrate the Cloudkick nodes in shard i of N")
+    parser.add_option("--workers", type="int", dest="workers", default=1, metavar="N", help="migrate in N shard processes at once (needs --auto, and --pipeline or --no-test)")
+    parser.add_option("--shard-state", dest="shard_state", default="migration_shards.json", metavar="FILE", help="notifications and plans shared between shards, on a filesystem every shard can reach (default: migration_shards.json)")
 
     (options, args) = parser.parse_args()
-    if not args or args[0] not in ['shell', 'clean', 'migrate', 'test']:
+    if not args or args[0] not in ['shell', 'clean', 'migrate', 'plan', 'apply', 'test']:
         parser.print_help()
         sys.exit()
+    if options.shard:
+        if args[0] != 'migrate':
+            parser.error('--shard only works with migrate')
+        try:
+            options.shard = shards.parse_shard(options.shard)
+        except ValueError as e:
+            parser.error(str(e))
 
     try:
         _setup(options, args)
     except Exception as e:
         type, value, tb = sys.exc_info()
         traceback.print_exc()
+        # shard workers have nobody at the keyboard
+        if not sys.stdin.isatty():
+            sys.exit(1)
         import pdb
         pdb.post_mortem(tb)
@@ -0,0 +1,301 @@
+"""
+migration_plan.py - compute a migration without writing anything, execute it later
+
+`migrate.py plan` runs the usual migration phases against a PlanningDriver,
+which records every create and update request instead of sending it. Objects
+that don't exist yet get a placeholder id ("pending:N") that later requests
+refer to. The migration's journal calls tell the plan what each request is
+(kind, Cloudkick key, Created/Updated) and which objects are unchanged.
+
+`migrate.py apply <planfile>` sends the recorded requests kind by kind
+(entities, checks, notifications, plans, alarms) with --concurrency workers,
+swapping placeholders for the ids the API hands back.
+"""
+import re
+import copy
+import json
+import time
+import httplib
+import threading
+from copy import deepcopy
+
+import logging
+log = logging.getLogger('maas_migration')
+
+import utils
+from journal import _converters
+
+PLAN_VERSION = 1
+
+# the order changes are applied in, every kind only refers to kinds before it
+KINDS = ['entity', 'check', 'notification', 'plan', 'alarm']
+
+# obj_ids key of a kind's own id in a location url
+_id_keys = {
+    'entity': 'entity_id',
+    'check': 'check_id',
+    'notification': 'notification_id',
+    'plan': 'notification_plan_id',
+    'alarm': 'alarm_id'
+}
+
+_pending = re.compile(r'^pending:\d+$')
+
+
+class PlanError(Exception):
+    pass
+
+
+def _resolve(value, ids):
+    """
+    replace placeholder ids in value (a url path, or JSON-able data) with real ones
+    """
+    if isinstance(value, dict):
+        return dict((k, _resolve(v, ids)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_resolve(v, ids) for v in value]
+    if isinstance(value, basestring) and _pending.match(value):
+        if value not in ids:
+            raise PlanError('depends on %s, which was not created' % value)
+        return ids[value]
+    return value
+
+
+def _resolve_url(url, ids):
+    return '/'.join(_resolve(chunk, ids) for chunk in url.split('/'))
+
+
+class _PlannedResponse(object):
+
+    def __init__(self, status, location):
+        self.status = status
+        self.headers = {'location': location}
+
+
+class _RecordingConnection(object):
+    """
+    Answers the driver's writes the way the API would, with a location
+    header, recording them in the plan instead of sending them. Nothing else
+    can go through it.
+    """
+
+    def __init__(self, plan):
+        self._plan = plan
+
+    def request(self, action, params=None, data='', headers=None, method='GET', raw=False):
+        if method not in ['POST', 'PUT']:
+            raise PlanError('%s %s can not be planned' % (method, action))
+
+        obj_id = self._plan.record(method, action, data)
+        # _url_to_obj_ids skips the version and tenant id of a location url
+        if method == 'POST':
+            return _PlannedResponse(httplib.CREATED, '/v/t%s/%s' % (action, obj_id))
+        return _PlannedResponse(httplib.NO_CONTENT, '/v/t%s' % action)
+
+
+class PlanningDriver(object):
+    """
+    Stands in for the rackspace_monitoring driver while planning. Reads go to
+    the real driver. The create_* and update_* methods the migration uses go
+    to a copy of it whose connection records the requests, and the returned
+    objects are built from what would have been sent. Any other write is
+    refused.
+    """
+
+    def __init__(self, driver, plan):
+        self._driver = driver
+        self._plan = plan
+
+        self._writer = copy.copy(driver)
+        self._writer.connection = _RecordingConnection(plan)
+        self._writer.ex_refetch = False
+
+    def __getattr__(self, name):
+        if name.split('_')[0] in ['create', 'update', 'delete']:
+            raise PlanError('%s can not be planned' % name)
+        return getattr(self._driver, name)
+
+    def _is_pending(self, obj):
+        return _pending.match(obj.id or '')
+
+    def list_checks(self, entity, **kwargs):
+        if self._is_pending(entity):
+            return []
+        return self._driver.list_checks(entity, **kwargs)
+
+    def list_alarms(self, entity, **kwargs):
+        if self._is_pending(entity):
+            return []
+        return self._driver.list_alarms(entity, **kwargs)
+
+    # writes
+
+    def create_entity(self, **kwargs):
+        return self._writer.create_entity(**kwargs)
+
+    def update_entity(self, entity, data, **kwargs):
+        return self._writer.update_entity(entity, data, **kwargs)
+
+    def create_check(self, entity, **kwargs):
+        return self._writer.create_check(entity, **kwargs)
+
+    def update_check(self, check, data, **kwargs):
+        return self._writer.update_check(check, data, **kwargs)
+
+    def create_notification(self, **kwargs):
+        return self._writer.create_notification(**kwargs)
+
+    def update_notification(self, notification, data, **kwargs):
+        return self._writer.update_notification(notification, data, **kwargs)
+
+    def create_notification_plan(self, **kwargs):
+        return self._writer.create_notification_plan(**kwargs)
+
+    def update_notification_plan(self, notification_plan, data, **kwargs):
+        return self._writer.update_notification_plan(notification_plan, data, **kwargs)
+
+    def create_alarm(self, entity, **kwargs):
+        return self._writer.create_alarm(entity, **kwargs)
+
+    def update_alarm(self, alarm, data, **kwargs):
+        return self._writer.update_alarm(alarm, data, **kwargs)
+
+
+class MigrationPlan(object):
+    """
+    Every change a migration would make, in the order it would make them.
+
+    While planning, this is also the migration's journal - it never has
+    anything to resume, and add() labels the recorded requests.
+    """
+
+    resume = False
+
+    def __init__(self, changes=None, unchanged=None):
+        self.changes = changes or []
+        self.unchanged = unchanged or []
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._by_id = {}
+
+    @classmethod
+    def load(cls, path):
+        f = open(path)
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+
+        if data.get('version') != PLAN_VERSION:
+            raise PlanError('%s is not a version %s plan' % (path, PLAN_VERSION))
+        return cls(data['changes'], data['unchanged'])
+
+    def save(self, path):
+        # requests no phase claimed (e.g. a save that failed) are not part of the plan
+        changes = [c for c in self.changes if 'kind' in c]
+
+        f = open(path, 'w')
+        json.dump({'version': PLAN_VERSION, 'created_at': int(time.time()),
+                   'changes': changes, 'unchanged': self.unchanged}, f, indent=1)
+        f.close()
+
+    def record(self, method, url, data):
+        """
+        record a request, returns the id of the object it writes
+        """
+        with self._lock:
+            if method == 'POST':
+                self._pending += 1
+                obj_id = 'pending:%s' % self._pending
+            else:
+                obj_id = url.rstrip('/').split('/')[-1]
+
+            change = {'method': method, 'url': url, 'data': deepcopy(data), 'id': obj_id}
+            self.changes.append(change)
+            self._by_id[obj_id] = change
+        return obj_id
+
+    # journal interface, used while planning
+
+    def get(self, kind, key, driver):
+        return None
+
+    def add(self, kind, key, obj, action):
+        record = _converters[kind][0](obj)
+        with self._lock:
+            change = self._by_id.get(obj.id)
+            if change and action in ['Created', 'Updated']:
+                change.update({'kind': kind, 'key': key, 'action': action, 'record': record})
+            else:
+                self.unchanged.append({'kind': kind, 'key': key, 'action': action, 'record': record})
+
+    def close(self):
+        pass
+
+    def summary(self):
+        counts = {}
+        for c in self.changes + self.unchanged:
+            if 'kind' in c:
+                counts[(c['kind'], c['action'])] = counts.get((c['kind'], c['action']), 0) + 1
+        return counts
+
+    # execution
+
+    def _apply_change(self, driver, change, ids):
+        url = _resolve_url(change['url'], ids)
+        data = _resolve(change['data'], ids)
+        # the object's own id is only known once it is written
+        record = dict(change['record'])
+        record.pop('id')
+        record = _resolve(record, ids)
+
+        # only the ids of the written object are needed, the rest is in the record
+        kwargs = {'ex_refetch': False}
+        build = lambda obj_ids, data: obj_ids
+        if change['method'] == 'POST':
+            obj_ids = driver._create(url, data, coerce=None, kwargs=kwargs, build=build)
+            record['id'] = obj_ids[_id_keys[change['kind']]]
+        else:
+            driver._update(url, data, kwargs, coerce=None, build=build)
+            record['id'] = _resolve(change['id'], ids)
+
+        return _converters[change['kind']][1](record, driver)
+
+    def apply(self, driver, journal, concurrency=1):
+        """
+        send every change, returns the number of changes that failed. a change
+        depending on an object that couldn't be created fails too
+        """
+        ids = {}
+        failed = 0
+        progress = utils.Progress('applied changes')
+
+        for entry in self.unchanged:
+            journal.add(entry['kind'], entry['key'], _converters[entry['kind']][1](entry['record'], driver),
+                        entry['action'])
+
+        for kind in KINDS:
+            changes = [c for c in self.changes if c.get('kind') == kind]
+            if not changes:
+                continue
+
+            # everything this kind refers to exists by now
+            queue = utils.WorkQueue(concurrency)
+            for change in changes:
+                queue.add(self._apply_change, driver, change, ids)
+
+            for change, (obj, e) in zip(changes, queue.results()):
+                if e:
+                    log.error('Failed to apply %s %s (%s): %s' % (change['action'], kind, change['key'], e))
+                    failed += 1
+                    continue
+
+                if change['method'] == 'POST':
+                    ids[change['id']] = obj.id
+                journal.add(kind, change['key'], obj, change['action'])
+                log.info('%s %s %s' % (change['action'], kind, obj.id))
+                progress.add()
+
+        progress.done()
+        return failed
@@ -1,7 +1,31 @@
 import pprint
+import utils
 import logging
+import threading
+from contextlib import contextmanager
 from collections import defaultdict
 
+from journal import to_record, from_record
+
+
+def _key(type, address):
+    """
+    notifications are the same if they go to the same place the same way,
+    email addresses are compared case insensitively
+    """
+    type = type.strip().lower()
+    address = address.strip()
+    if type == 'email':
+        address = address.lower()
+    return (type, address)
+
+
+def _key_string(key):
+    """
+    a _key() as one string, what the journal and the shard state are keyed by
+    """
+    return '%s %s' % key
+
 
 class NotificationMigrator(object):
 
@@ -15,20 +39,88 @@ class NotificationMigrator(object):
         self.rs_api = self.migrator.rs_api
 
         self.auto = self.migrator.options.auto
+        self.journal = self.migrator.journal
+        self.concurrency = self.migrator.options.concurrency
+        # set when sharding, see shards.py
+        self.coordinator = self.migrator.coordinator
 
-        self.rs_plans = self.rs_api.list_notification_plans()
-        self.rs_notifications = dict((n.id, n) for n in self.rs_api.list_notifications())
+        self._rs_plans = None
+        self._rs_notifications = None
 
+        # (type, address) -> rackspace notification
         self.migrated_notifications = {}
-        self.monitor_to_notification_map = defaultdict(set)
+        self.monitor_to_notification_map = defaultdict(dict)
+
+        # monitor id -> plan, filled by resolve_plan()
+        self.monitor_plans = {}
+        self._lock = threading.Lock()
+        self._monitor_locks = {}
+
+    @property
+    def rs_notifications(self):
+        """
+        (type, address) -> existing rackspace notification, only listed once a
+        notification is missing from the journal
+        """
+        if self._rs_notifications is None:
+            self._rs_notifications = {}
+            for rs_notification in self.rs_api.list_notifications():
+                address = (rs_notification.details or {}).get('address')
+                if address:
+                    self._rs_notifications.setdefault(_key(rs_notification.type, address), rs_notification)
+        return self._rs_notifications
+
+    @property
+    def rs_plans(self):
+        """
+        label -> existing rackspace notification plan, only listed once a plan
+        is missing from the journal
+        """
+        if self._rs_plans is None:
+            self._rs_plans = {}
+            for rs_plan in self.rs_api.list_notification_plans():
+                self._rs_plans.setdefault(rs_plan.label, rs_plan)
+        return self._rs_plans
+
+    @contextmanager
+    def _shared(self):
+        """
+        when sharding, take in the notifications and plans other shards found
+        or created, and hand ours back once the block is done. shards take
+        turns, so no two create the same one
+        """
+        if not self.coordinator:
+            yield
+            return
+
+        with self.coordinator.shared() as state:
+            for record in state['notifications'].values():
+                notification = from_record('notification', record, self.rs_api)
+                self.rs_notifications[_key(notification.type, notification.details['address'])] = notification
+            for label, record in state['plans'].items():
+                self.rs_plans[label] = from_record('plan', record, self.rs_api)
+
+            try:
+                yield
+            finally:
+                for key, notification in self.rs_notifications.items():
+                    state['notifications'][_key_string(key)] = to_record('notification', notification)
+                for label, plan in self.rs_plans.items():
+                    state['plans'][label] = to_record('plan', plan)
 
     def _get_or_create_notification(self, ck_notification):
         """
         Actually finds/creates a new rackspace notification
         """
+        key = _key(ck_notification.type, ck_notification.address)
+        if key in self.migrated_notifications:
+            return self.migrated_notifications[key]
 
-        if ck_notification.address in self.migrated_notifications:
-            return self.migrated_notifications[ck_notification.address]
+        # migrated by a previous run
+        notification = self.journal.get('notification', _key_string(key), self.rs_api)
+        if notification:
+            self.logger.info('Journaled Notification: %s (%s)' % (notification.details['address'], notification.id))
+            return notification
 
         new_notification = {}
         new_notification['label'] = ck_notification.name
@@ -36,21 +128,16 @@ class NotificationMigrator(object):
         new_notification['details'] = {}
         new_notification['details']['address'] = ck_notification.address
 
-        # find existing notifications
-        created = False
-        notification = None
-        for notification_id, rs_notification in self.rs_notifications.items():
-            if rs_notification.type == new_notification['type'] and rs_notification.details == new_notification['details']:
-                notification = rs_notification
-                break
-
-        # create it if it doesn't exist
-        if not notification:
-            rs_notification = self.rs_api.create_notification(**new_notification)
-            notification = rs_notification
-            created = True
-
-        self.logger.info('%s Notification: %s (%s)' % ('Created' if created else 'Found', notification.details['address'], notification.id))
+        # find existing notifications, create it if it doesn't exist
+        notification = self.rs_notifications.get(key)
+        created = notification is None
+        if created:
+            notification = self.rs_api.create_notification(**new_notification)
+            self.rs_notifications[key] = notification
+
+        action = 'Created' if created else 'Found'
+        self.journal.add('notification', _key_string(key), notification, action)
+        self.logger.info('%s Notification: %s (%s)' % (action, notification.details['address'], notification.id))
         return notification
 
     def _generate_notifications(self, ck_monitor):
@@ -58,70 +145,82 @@ class NotificationMigrator(object):
         Iterates over all notifications in a monitor, finds/creates them, and adds them to a map for later use
         """
         for ck_notification in ck_monitor.get_notifications():
-            rs_notificaiton = self._get_or_create_notification(ck_notification)
-            if rs_notificaiton:
+            rs_notification = self._get_or_create_notification(ck_notification)
+            if rs_notification:
                 # We only need 1 notification per email address
-                self.migrated_notifications[ck_notification.address] = rs_notificaiton
+                key = _key(ck_notification.type, ck_notification.address)
+                self.migrated_notifications[key] = rs_notification
 
                 # Map this notification to the monitor
-                found = False
-                for notificaion in self.monitor_to_notification_map[ck_monitor.id]:
-                    if notificaion.details['address'] == rs_notificaiton.details['address']:
-                        found = True
-                        break
-                if not found:
-                    self.monitor_to_notification_map[ck_monitor.id].add(rs_notificaiton)
+                self.monitor_to_notification_map[ck_monitor.id].setdefault(key, rs_notification)
 
     def _generate_plan(self, ck_monitor):
         """
-        Generates a plan for each monitor
+        Works out the plan for a monitor - returns the plan as it should be,
+        the existing plan (if any) and what needs to happen to it
         """
 
-        notifications = self.monitor_to_notification_map.get(ck_monitor.id, [])
+        notifications = self.monitor_to_notification_map.get(ck_monitor.id, {}).values()
         new_plan = {}
         new_plan['label'] = '%s:%s' % (ck_monitor.name, ck_monitor.id)
         new_plan['critical_state'] = [n.id for n in notifications]
         new_plan['warning_state'] = [n.id for n in notifications]
         new_plan['ok_state'] = [n.id for n in notifications]
 
-        # find already created plan
-        action = ''
-        plan = None
-        for p in self.rs_plans:
-            if p.label == '%s:%s' % (ck_monitor.name, ck_monitor.id):
-                plan = p
-                break
-
-        if plan:
-            if plan.critical_state == new_plan['critical_state'] and \
-               plan.warning_state == new_plan['warning_state'] and \
-               plan.ok_state == new_plan['ok_state']:
-                action = 'Found'
-            else:
-                plan = self.rs_api.update_notification_plan(plan, new_plan)
-                action = 'Updated'
-        else:
-            plan = self.rs_api.create_notification_plan(**new_plan)
-            action = 'Created'
-
-        self.logger.info('%s Plan %s:\n%s' % (action, plan.id, pprint.pformat(new_plan)))
-        return plan
+        # find already created plan, first in the journal of a previous run
+        plan = self.journal.get('plan', new_plan['label'], self.rs_api)
+        if not plan:
+            plan = self.rs_plans.get(new_plan['label'])
+
+        if not plan:
+            return new_plan, None, 'Created'
+
+        if plan.critical_state == new_plan['critical_state'] and \
+           plan.warning_state == new_plan['warning_state'] and \
+           plan.ok_state == new_plan['ok_state']:
+            return new_plan, plan, 'Found'
+        return new_plan, plan, 'Updated'
 
     def _monitors(self):
-        monitors = {}
-        for migrated_entity in self.migrator.migrated_entities:
-            for migrated_check in migrated_entity.migrated_checks:
-                monitors[migrated_check.ck_check.monitor.id] = migrated_check.ck_check.monitor
-        return monitors.values()
+        return [checks[0].ck_check.monitor for checks in self.migrator.monitor_checks.values()]
 
     def _apply_plan(self, monitor, plan):
         """
         Set this plan as an attribute on all relevant migrate_check instances
         """
-        for entity in self.migrator.migrated_entities:
-            for check in entity.migrated_checks:
-                if check.ck_check.monitor.id == monitor.id:
-                    check.rs_notification_plan = plan
+        for check in self.migrator.monitor_checks[monitor.id]:
+            check.rs_notification_plan = plan
+
+    def resolve_plan(self, monitor):
+        """
+        the plan for a monitor - its notifications and the plan itself are
+        found or created the first time it's asked for. safe to call from
+        several threads, each monitor is only worked out once
+        """
+        with self._lock:
+            lock = self._monitor_locks.setdefault(monitor.id, threading.Lock())
+
+        with lock:
+            if monitor.id in self.monitor_plans:
+                return self.monitor_plans[monitor.id]
+
+            with self._shared():
+                # notifications are shared between monitors
+                with self._lock:
+                    self._generate_notifications(monitor)
+                    new_plan, plan, action = self._generate_plan(monitor)
+
+                if action == 'Created':
+                    plan = self.rs_api.create_notification_plan(**new_plan)
+                elif action == 'Updated':
+                    plan = self.rs_api.update_notification_plan(plan, new_plan)
+                with self._lock:
+                    self.rs_plans[new_plan['label']] = plan
+
+            self.journal.add('plan', new_plan['label'], plan, action)
+            self.logger.info('%s Plan %s: %s' % (action, plan.id, new_plan['label']))
+            self.monitor_plans[monitor.id] = plan
+            return plan
 
     def migrate(self):
         """
@@ -137,9 +236,37 @@ class NotificationMigrator(object):
         self.logger.info('\nNotifications')
         self.logger.info('------\n')
 
-        for monitor in self._monitors():
-            self._generate_notifications(monitor)
-            self.logger.info('')
-            plan = self._generate_plan(monitor)
-            if plan:
+        # when sharding, the whole phase is one turn
+        with self._shared():
+            queue = utils.WorkQueue(self.concurrency)
+            plans = []
+
+            for monitor in self._monitors():
+                self._generate_notifications(monitor)
+                self.logger.info('')
+
+                new_plan, plan, action = self._generate_plan(monitor)
+                if action == 'Created':
+                    queue.add(self.rs_api.create_notification_plan, **new_plan)
+                elif action == 'Updated':
+                    queue.add(self.rs_api.update_notification_plan, plan, new_plan)
+                plans.append((monitor, new_plan, plan, action))
+
+            # every notification exists by now, write the plans together. results
+            # come back in the order they were queued. every plan that went
+            # through is journaled before the first one that failed is raised
+            results = iter(queue.results())
+            error = None
+            for monitor, new_plan, plan, action in plans:
+                if action != 'Found':
+                    plan, e = results.next()
+                    if e:
+                        error = error or e
+                        continue
+                    self.rs_plans[new_plan['label']] = plan
+
+                self.journal.add('plan', new_plan['label'], plan, action)
+                self.logger.info('%s Plan %s:\n%s' % (action, plan.id, pprint.pformat(new_plan)))
                 self._apply_plan(monitor, plan)
+            if error:
+                utils.reraise(error)
@@ -0,0 +1,162 @@
+"""
+pipeline.py - migrate node by node instead of phase by phase
+
+The phased migration finishes every entity before the first check and every
+check before the first alarm, so one slow node holds up the whole account.
+With --pipeline each Cloudkick node goes through entity -> checks ->
+notification plan -> alarms on its own, --concurrency nodes at a time.
+Notifications and plans are shared between nodes, they are worked out once
+per monitor by the first node that needs them (NotificationMigrator.resolve_plan).
+
+Nothing can be reviewed while nodes are in flight, so this needs --auto.
+Failing check and alarm tests skip the check or alarm, as --auto does.
+
+--stream (which implies --pipeline) keeps nothing per node once the node is
+done: nodes are built and their checks read one batch at a time, finished
+entities and checks aren't collected, the journal isn't kept in memory and
+the Rackspace account isn't snapshotted up front - existing entities are
+matched through the entity index, and their checks and alarms listed when
+the node gets to them. What stays is shared: the entity index, the
+notifications and the plans.
+"""
+import logging
+log = logging.getLogger('maas_migration')
+
+from entities import MigratedEntity
+from checks import MigratedCheck
+from checks.checks import UnsupportedCheckType
+from notifications import NotificationMigrator
+from alarms import MigratedAlarm
+
+import utils
+
+
+class NodePipeline(object):
+
+    def __init__(self, migrator):
+        self.migrator = migrator
+        self.ck_api = migrator.ck_api
+        self.rs_api = migrator.rs_api
+        self.journal = migrator.journal
+        self.stats = migrator.request_stats
+
+        self.no_test = migrator.options.no_test
+        self.concurrency = migrator.options.concurrency
+        self.stream = migrator.options.stream
+        self.monitoring_zones = migrator.config.get('monitoring_zones')
+
+        self.notifications = NotificationMigrator(migrator)
+        self.progress = utils.Progress('migrated nodes')
+
+    def _entity(self, ck_node):
+        rs_entity = self.journal.get('entity', ck_node.id, self.rs_api)
+        if rs_entity:
+            return MigratedEntity(self.migrator, ck_node, rs_entity=rs_entity)
+
+        entity = MigratedEntity(self.migrator, ck_node)
+        action, result = entity.save()
+        self.journal.add('entity', ck_node.id, entity.rs_entity, action)
+        log.info('%s entity %s for node %s' % (action, entity.rs_entity.id, ck_node))
+        return entity
+
+    def _check(self, entity, ck_check):
+        """
+        the migrated check, None if it's not supported or its test failed
+        """
+        rs_check = self.journal.get('check', ck_check.id, self.rs_api)
+        try:
+            check = MigratedCheck(entity, ck_check, monitoring_zones=self.monitoring_zones, rs_check=rs_check)
+        except UnsupportedCheckType as e:
+            log.info('Skipping check %s: %s' % (ck_check, e))
+            return None
+        if rs_check:
+            return check
+
+        action, result = check.save(commit=False)
+        if action in ['Created', 'Updated']:
+            if not self.no_test:
+                valid, msg, responses = check.test()
+                if not valid:
+                    log.info('Skipping check %s: %s' % (ck_check, msg))
+                    return None
+            check.save()
+
+        self.journal.add('check', ck_check.id, check.rs_check, action)
+        log.info('%s check %s for %s' % (action, check.rs_check.id, ck_check))
+        return check
+
+    def _alarm(self, check):
+        if self.journal.get('alarm', check.ck_check.id, self.rs_api):
+            return
+
+        alarm = MigratedAlarm.create_from_migrated_check(check)
+        if not alarm:
+            return
+
+        action, result = alarm.save(commit=False)
+        if action in ['Created', 'Updated']:
+            if not self.no_test:
+                valid, msg, results = alarm.test()
+                if not valid:
+                    log.info('Skipping alarm for %s: %s' % (check.ck_check, msg))
+                    return
+            alarm.save()
+
+        self.journal.add('alarm', check.ck_check.id, alarm.rs_alarm, action)
+        log.info('%s alarm %s for %s' % (action, alarm.rs_alarm.id, check.ck_check))
+
+    def migrate_node(self, ck_node):
+        try:
+            self.stats.set_thread_phase('entities')
+            entity = self._entity(ck_node)
+
+            self.stats.set_thread_phase('checks')
+            for ck_check in self.ck_api.list_checks(ck_node):
+                check = self._check(entity, ck_check)
+                if check:
+                    entity.migrated_checks.append(check)
+                    if not self.stream:
+                        self.migrator.monitor_checks[ck_check.monitor.id].append(check)
+
+            for check in entity.migrated_checks:
+                self.stats.set_thread_phase('notifications')
+                check.rs_notification_plan = self.notifications.resolve_plan(check.ck_check.monitor)
+                self.stats.set_thread_phase('alarms')
+                self._alarm(check)
+        finally:
+            self.stats.set_thread_phase(None)
+
+        if not self.stream:
+            self.migrator.migrated_entities.append(entity)
+        self.progress.add()
+
+    def migrate(self):
+        if self.stream:
+            # a batch of nodes at a time, each batch's checks in one request
+            batches = utils.chunks(self.ck_api.iter_nodes(), self.ck_api.check_batch_size)
+        else:
+            batches = [self.ck_api.list_nodes()]
+
+        # entities are matched against the index, build it before the workers
+        # need it
+        if not self.journal.resume:
+            self.migrator.get_rs_entity_index()
+
+        failed = total = 0
+        for nodes in batches:
+            # the checks for every node in a few batched requests
+            self.ck_api.prefetch_checks(nodes)
+
+            queue = utils.WorkQueue(self.concurrency)
+            for ck_node in nodes:
+                queue.add(self.migrate_node, ck_node)
+
+            for ck_node, (_, e) in zip(nodes, queue.results()):
+                if e:
+                    log.error('Failed migrating node %s: %s' % (ck_node, e))
+                    failed += 1
+            total += len(nodes)
+
+        self.progress.done()
+        if failed:
+            log.error('%s of %s nodes failed, run the migration again to retry them' % (failed, total))
@@ -0,0 +1,78 @@
+"""
+preflight.py - content-addressed cache of check and alarm test results
+
+test_check and test_alarm make the monitoring zones run a check live, which
+is slow. Passing results are stored under a hash of what was tested (the check
+payload and its target, or the alarm criteria and the check it runs against),
+so a re-run doesn't test anything that hasn't changed since it last passed.
+"""
+import json
+import hashlib
+import threading
+
+import logging
+log = logging.getLogger('maas_migration')
+
+
+def payload_key(payload):
+    """
+    stable hash of a JSON-able payload, independent of dict ordering
+    """
+    return hashlib.sha1(json.dumps(payload, sort_keys=True)).hexdigest()
+
+
+class ResultCache(object):
+    """
+    key -> test responses, only passing results are stored (a failure may
+    be fixed by the next run)
+
+    a cache without a path only lives as long as the run
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+        self.hits = 0
+        self._results = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._results)
+
+    def _load(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            return
+
+        try:
+            self._results = json.load(f)
+        except ValueError:
+            log.info('Ignoring unreadable test cache %s' % self.path)
+        f.close()
+
+    def get(self, key):
+        with self._lock:
+            results = self._results.get(key)
+            if results is not None:
+                self.hits += 1
+            return results
+
+    def add(self, key, results):
+        with self._lock:
+            self._results[key] = results
+            self._dirty = True
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+
+        with self._lock:
+            f = open(self.path, 'w')
+            json.dump(self._results, f)
+            f.close()
+            self._dirty = False
@@ -0,0 +1,201 @@
+"""
+request_stats.py - where a migration spends its time, request by request
+
+RequestStats hooks into the Cloudkick and Rackspace API connections (their
+request_hook) and keeps a latency histogram for every endpoint and for every
+migration phase. Paths are templated - ids collapse into ":id" - so all
+requests for e.g. an entity's checks add up to one endpoint.
+"""
+import re
+import json
+import time
+import bisect
+import threading
+
+import logging
+log = logging.getLogger('maas_migration')
+
+# histogram bucket upper bounds, in milliseconds. the last bucket is open ended
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+# Rackspace API versions are "v1.0", and the tenant id comes right after them.
+# Cloudkick ("2.0/nodes") and identity ("v2.0/tokens") paths have no tenant
+_tenant_version = re.compile(r'^v\d+(\.\d+)+$')
+_unscoped = frozenset(['tokens', 'tenants', 'users'])
+
+# collections whose next path segment is an object id
+_collections = frozenset([
+    # Rackspace
+    'entities', 'checks', 'alarms', 'notifications', 'notification_plans', 'notification_history',
+    'agents', 'agent_tokens', 'host_info', 'monitoring_zones', 'check_types', 'notification_types',
+    # Cloudkick
+    'nodes', 'node', 'check', 'monitors'])
+
+
+def templated_path(path):
+    """
+    /v1.0/123456/entities/enAB12/checks -> /v1.0/:id/entities/:id/checks
+
+    ids are found by position, not by what they look like: the segment after
+    a Rackspace API version is the tenant, and the segment after a collection
+    name is an object id
+    """
+    path = path.split('?')[0]
+    chunks = []
+    previous = None
+    for chunk in path.split('/'):
+        if chunk and previous is not None:
+            if _tenant_version.match(previous) and chunk not in _unscoped:
+                chunk = ':id'
+            elif previous in _collections:
+                chunk = ':id'
+        chunks.append(chunk)
+        previous = chunk
+    return '/'.join(chunks)
+
+
+class Histogram(object):
+    """
+    request count, bytes, errors and a latency histogram
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, status, size, seconds):
+        self.count += 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.bytes += size
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+    def percentile(self, p):
+        """
+        upper bound (ms) of the bucket the p-th percentile falls in, the
+        largest latency seen for the open ended bucket
+        """
+        if not self.count:
+            return 0.0
+
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i < len(BUCKETS_MS):
+                    return min(BUCKETS_MS[i], self.max_seconds * 1000)
+                break
+        return self.max_seconds * 1000
+
+    def to_dict(self):
+        return {'count': self.count,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'seconds': round(self.seconds, 6),
+                'mean_ms': round(self.seconds * 1000 / self.count, 3) if self.count else 0.0,
+                'p50_ms': self.percentile(50),
+                'p95_ms': self.percentile(95),
+                'max_ms': round(self.max_seconds * 1000, 3),
+                'buckets_ms': dict(zip([str(b) for b in BUCKETS_MS] + ['inf'], self.buckets))}
+
+
+class RequestStats(object):
+    """
+    endpoint stats are keyed by (api, method, templated path), phase stats by
+    phase name. requests made outside of a phase count towards 'setup'
+    """
+
+    def __init__(self):
+        self.phase = 'setup'
+        self.endpoints = {}
+        self.phases = {}
+        self.started_at = time.time()
+
+        self._phase_order = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def set_phase(self, phase):
+        # workers of a phase are done before the next one starts, so requests
+        # are attributed to whatever phase is current when they finish
+        self.phase = phase
+
+    def set_thread_phase(self, phase):
+        """
+        the phase of requests made by this thread, for when several phases run
+        at once (None: back to the current phase)
+        """
+        self._local.phase = phase
+
+    def hook(self, api):
+        """
+        a request_hook for the connections of api ('cloudkick', 'rackspace')
+        """
+        def request_hook(method, path, status, size, seconds):
+            self.record(api, method, path, status, size, seconds)
+        return request_hook
+
+    def install(self, ck_api, rs_api):
+        ck_api.conn.request_hook = self.hook('cloudkick')
+        rs_api.connection.request_hook = self.hook('rackspace')
+
+    def record(self, api, method, path, status, size, seconds):
+        key = (api, method, templated_path(path))
+        phase = getattr(self._local, 'phase', None) or self.phase
+        with self._lock:
+            if key not in self.endpoints:
+                self.endpoints[key] = Histogram()
+            self.endpoints[key].add(status, size, seconds)
+
+            if phase not in self.phases:
+                self.phases[phase] = Histogram()
+                self._phase_order.append(phase)
+            self.phases[phase].add(status, size, seconds)
+
+    def total(self):
+        total = Histogram()
+        for h in self.endpoints.values():
+            total.count += h.count
+            total.errors += h.errors
+            total.bytes += h.bytes
+            total.seconds += h.seconds
+            total.max_seconds = max(total.max_seconds, h.max_seconds)
+            total.buckets = [a + b for a, b in zip(total.buckets, h.buckets)]
+        return total
+
+    def to_dict(self):
+        with self._lock:
+            return {'started_at': int(self.started_at),
+                    'endpoints': [dict(api=api, method=method, path=path, **self.endpoints[(api, method, path)].to_dict())
+                                  for api, method, path in sorted(self.endpoints)],
+                    'phases': [dict(phase=phase, **self.phases[phase].to_dict()) for phase in self._phase_order],
+                    'total': self.total().to_dict()}
+
+    def save(self, path):
+        f = open(path, 'w')
+        json.dump(self.to_dict(), f, indent=1)
+        f.close()
+
+    def format_table(self):
+        row = '%-50s %7s %6s %10s %9s %8s %8s %8s %8s'
+        fmt = lambda name, d: row % (name[:50], d['count'], d['errors'], '%.1f' % (d['bytes'] / 1024.0),
+                                     '%.2f' % d['seconds'], '%.1f' % d['mean_ms'], '%.0f' % d['p50_ms'],
+                                     '%.0f' % d['p95_ms'], '%.0f' % d['max_ms'])
+
+        stats = self.to_dict()
+        lines = [row % ('endpoint', 'count', 'errors', 'KB', 'seconds', 'mean ms', 'p50 ms', 'p95 ms', 'max ms')]
+        for e in stats['endpoints']:
+            lines.append(fmt('%s %s %s' % (e['api'], e['method'], e['path']), e))
+        lines.append('')
+        lines.append(row % ('phase', 'count', 'errors', 'KB', 'seconds', 'mean ms', 'p50 ms', 'p95 ms', 'max ms'))
+        for p in stats['phases']:
+            lines.append(fmt(p['phase'], p))
+        lines.append(fmt('total', stats['total']))
+        return '\n'.join(lines)
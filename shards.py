@@ -0,0 +1,162 @@
+"""
+shards.py - split a migration across processes by Cloudkick node
+
+`migrate.py --shard i/N migrate` only migrates the nodes whose id hashes to
+shard i (0 <= i < N), so N processes (or machines sharing a filesystem) can
+split an account between them. The hash is crc32 of the node id, so a node
+always lands in the same shard.
+
+Nodes don't share anything, notifications and notification plans do. Shards
+find or create those one at a time, behind a lock on the shared state file
+(--shard-state), and record what they found there for the others - so two
+shards never create the same notification or plan.
+
+`--workers N` runs the migration as N shard processes and waits for them.
+Every shard writes its own log, journal, test cache and request stats, named
+after the shard (migration_journal.shard0of4.jsonl).
+"""
+import os
+import sys
+import json
+import zlib
+import fcntl
+import tempfile
+import threading
+import subprocess
+
+from contextlib import contextmanager
+
+import logging
+log = logging.getLogger('maas_migration')
+
+
+def parse_shard(value):
+    """
+    'i/N' -> (i, N), raises ValueError unless 0 <= i < N
+    """
+    try:
+        index, count = [int(v) for v in value.split('/')]
+    except ValueError:
+        raise ValueError('shard must look like i/N, not %r' % value)
+    if not 0 <= index < count:
+        raise ValueError('shard %s/%s: i must be between 0 and %s' % (index, count, count - 1))
+    return index, count
+
+
+def shard_of(node_id, count):
+    if isinstance(node_id, unicode):
+        node_id = node_id.encode('utf-8')
+    return (zlib.crc32(node_id) & 0xffffffff) % count
+
+
+def node_filter(shard):
+    """
+    CloudkickApi.node_filter for the nodes of a shard
+    """
+    index, count = shard
+    return lambda node: shard_of(node.id, count) == index
+
+
+def shard_path(path, shard):
+    """
+    migration_journal.jsonl -> migration_journal.shard0of4.jsonl
+    """
+    root, ext = os.path.splitext(path)
+    return '%s.shard%sof%s%s' % (root, shard[0], shard[1], ext)
+
+
+class Coordinator(object):
+    """
+    notifications and notification plans shared between shards, in a JSON
+    file next to a lock file. shared() holds an exclusive flock for as long
+    as the caller works with the state, then writes it back
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # flock doesn't keep out other threads of the same process
+        self._lock = threading.Lock()
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _read(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            return {}
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+
+    def _write(self, state):
+        # swap in a whole file, a shard dying halfway never leaves half a state
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(state, f)
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+
+    @contextmanager
+    def shared(self):
+        """
+        {'notifications': {key: record}, 'plans': {label: record}}, records
+        as journal.to_record() writes them. written back even if the block
+        fails, whatever was created by then is still shared
+        """
+        with self._lock:
+            lock = open(self.path + '.lock', 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                state = self._read()
+                state.setdefault('notifications', {})
+                state.setdefault('plans', {})
+                try:
+                    yield state
+                finally:
+                    self._write(state)
+            finally:
+                # closing it drops the flock
+                lock.close()
+
+
+def worker_args(argv, index, count):
+    """
+    the command line of shard `index`: argv without --workers
+    """
+    args = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == '--workers':
+            skip = True
+        elif not arg.startswith('--workers='):
+            args.append(arg)
+    return args + ['--shard', '%s/%s' % (index, count)]
+
+
+def run_workers(script, argv, count):
+    """
+    run `script argv` as `count` shard processes at once, returns the shards
+    that failed
+    """
+    # nobody can answer a prompt (or a debugger) in a worker
+    devnull = open(os.devnull)
+    workers = []
+    for index in range(count):
+        args = [sys.executable, script] + worker_args(argv, index, count)
+        log.info('Starting shard %s/%s' % (index, count))
+        workers.append(subprocess.Popen(args, stdin=devnull))
+    devnull.close()
+
+    failed = []
+    for index, worker in enumerate(workers):
+        if worker.wait():
+            log.error('Shard %s/%s failed (exit code %s)' % (index, count, worker.returncode))
+            failed.append(index)
+    return failed
@@ -0,0 +1,121 @@
+import gzip
+import json
+import socket
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+from StringIO import StringIO
+
+import mock
+
+from cloudkick_api.base import Connection
+from cloudkick_api.wrapper import Registry
+
+
+class FakeCloudkickHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+
+        body = json.dumps({'items': [{'id': 'nFAKEID'}]})
+        if 'gzip' in self.headers.get('accept-encoding', ''):
+            buf = StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb')
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+            self.send_response(200)
+            self.send_header('Content-Encoding', 'gzip')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0), FakeCloudkickHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.paths = []
+        t = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        t.daemon = True
+        t.start()
+
+        self.conn = Connection(oauth_key='key', oauth_secret='secret',
+                               api_server='127.0.0.1:%s' % self.server.server_address[1])
+
+    def tearDown(self):
+        self.conn.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keepalive_gzip(self):
+        for i in range(3):
+            self.assertEquals(self.conn.nodes.read(), {'items': [{'id': 'nFAKEID'}]})
+
+        self.assertEquals(self.server.connections, 1)
+        self.assertEquals(self.conn.transport.connections, 1)
+        self.assertTrue(self.server.paths[0].startswith('/2.0/nodes?'))
+        self.assertTrue('oauth_signature=' in self.server.paths[0])
+
+    def test_reconnect(self):
+        self.conn.nodes.read()
+        # the server dropping an idle connection
+        self.conn.transport._local.conn.sock.close()
+        self.assertEquals(self.conn.nodes.read(), {'items': [{'id': 'nFAKEID'}]})
+        self.assertEquals(self.conn.transport.connections, 2)
+
+    def _stale_connection(self):
+        # a kept connection whose response never comes
+        stale = mock.Mock()
+        stale.getresponse.side_effect = socket.timeout('timed out')
+        self.conn.transport._local.conn = stale
+        return stale
+
+    def test_no_resend_after_timeout(self):
+        # the POST may have gone through
+        stale = self._stale_connection()
+        self.assertRaises(socket.timeout, self.conn.transport.request, 'POST', '/2.0/nodes')
+        self.assertEquals(stale.request.call_count, 1)
+        self.assertEquals(self.server.paths, [])
+
+    def test_resend_get_after_timeout(self):
+        stale = self._stale_connection()
+        self.assertEquals(self.conn.transport.request('GET', '/2.0/nodes')[0], 200)
+        self.assertEquals(stale.request.call_count, 1)
+        self.assertEquals(self.server.paths, ['/2.0/nodes'])
+
+
+class RegistryTests(unittest.TestCase):
+
+    def _monitor(self, monitor_id, addresses):
+        receivers = [{'type': {'code': 1}, 'name': address, 'details': {'email_address': address}}
+                     for address in addresses]
+        return {'id': monitor_id, 'name': 'monitor', 'notification_receivers': receivers}
+
+    def test_interning(self):
+        registry = Registry()
+        m1 = registry.monitor(self._monitor('m1', ['a@example.com', 'b@example.com']))
+        self.assertTrue(registry.monitor(self._monitor('m1', [])) is m1)
+
+        m2 = registry.monitor(self._monitor('m2', ['b@example.com']))
+        self.assertTrue(m2.get_notifications()[0] is m1.get_notifications()[1])
+
+        # receivers are parsed once
+        m1.notification_receivers = []
+        self.assertEquals([n.address for n in m1.get_notifications()], ['a@example.com', 'b@example.com'])
@@ -0,0 +1,182 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import utils
+from cloudkick_api.wrapper import CloudkickApi
+from cloudkick_snapshot import CloudkickSnapshot
+
+from tests.utils import MockData
+
+
+class FakeAccount(object):
+    """
+    answers nodes/checks/monitors/changelogs .read() like cloudkick_api.Connection
+    """
+
+    def __init__(self):
+        self.node_items = [self.node('n%s' % i) for i in range(3)]
+        self.change_logs = []
+
+        self.nodes = self._endpoint(self._read_nodes)
+        self.checks = self._endpoint(self._read_checks,
+                                     [self.check('c%s' % i, 'n%s' % i, 'm1') for i in range(3)])
+        self.monitors = self._endpoint(lambda: {'items': self.monitors.items}, [self.monitor('m1', 'default')])
+        self.changelogs = self._endpoint(lambda startdate=None: {'items': self.change_logs})
+
+    @staticmethod
+    def node(node_id):
+        return MockData.get_fake_api_node(node_id)
+
+    @staticmethod
+    def check(check_id, node_id, monitor_id):
+        return {'id': check_id, 'node_id': node_id, 'monitor_id': monitor_id,
+                'type': {'description': 'PING'}, 'details': {}, 'is_enabled': True}
+
+    @staticmethod
+    def monitor(monitor_id, name):
+        return {'id': monitor_id, 'name': name, 'notification_receivers': []}
+
+    def _endpoint(self, read, items=None):
+        endpoint = mock.Mock()
+        endpoint.read.side_effect = read
+        endpoint.items = items
+        return endpoint
+
+    def _read_nodes(self, node_ids=None):
+        nodes = self.node_items
+        if node_ids:
+            nodes = [n for n in nodes if n['id'] in node_ids.split(',')]
+        return {'items': nodes}
+
+    def _read_checks(self, monitor_id=None, node_ids=None, check_ids=None):
+        checks = self.checks.items
+        if monitor_id:
+            checks = [c for c in checks if c['monitor_id'] == monitor_id]
+        if node_ids:
+            checks = [c for c in checks if c['node_id'] in node_ids.split(',')]
+        if check_ids:
+            checks = [c for c in checks if c['id'] in check_ids.split(',')]
+        return {'items': checks}
+
+    def requests(self):
+        return dict((name, getattr(self, name).read.call_count)
+                    for name in ['nodes', 'checks', 'monitors', 'changelogs'])
+
+    def reset(self):
+        for name in ['nodes', 'checks', 'monitors', 'changelogs']:
+            getattr(self, name).read.reset_mock()
+
+
+class CloudkickSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'ck_snapshot.json')
+        self.account = FakeAccount()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _sync(self, now):
+        snapshot = CloudkickSnapshot(self.path)
+        how = snapshot.sync(self.account, now=now)
+        snapshot.save()
+        return how, snapshot
+
+    def test_full_then_incremental(self):
+        how, snapshot = self._sync(1000000)
+        self.assertEquals(how, 'full')
+        self.assertEquals(snapshot.nodes.keys(), ['n0', 'n1', 'n2'])
+        self.assertEquals(snapshot.checks['n1'][0]['id'], 'c1')
+        self.assertEquals(self.account.requests(), {'nodes': 1, 'checks': 1, 'monitors': 1, 'changelogs': 0})
+
+        # nothing changed, nothing but the change logs is read
+        self.account.reset()
+        how, snapshot = self._sync(1003600)
+        self.assertEquals(how, 'incremental')
+        self.assertEquals(snapshot.nodes.keys(), ['n0', 'n1', 'n2'])
+        self.assertEquals(self.account.requests(), {'nodes': 0, 'checks': 0, 'monitors': 0, 'changelogs': 1})
+
+    def test_incremental_changes(self):
+        self._sync(1000000)
+
+        # n1 renamed, n2 deleted, n3 added with a check, c0 changed
+        self.account.node_items[1]['name'] = 'renamed'
+        del self.account.node_items[2]
+        self.account.node_items.append(self.account.node('n3'))
+        self.account.checks.items[0]['details'] = {'changed': True}
+        self.account.checks.items[2:] = [self.account.check('c3', 'n3', 'm1')]
+        self.account.change_logs = [
+            {'object_type': 'node', 'object_id': 'n1'},
+            {'object_type': 'node', 'object_id': 'n2'},
+            {'object_type': 'node', 'object_id': 'n3'},
+            {'object_type': 'check', 'object_id': 'c0'},
+            {'object_type': 'check', 'object_id': 'c3'},
+            {'object_type': 'tag', 'object_id': 't1'}]
+
+        self.account.reset()
+        how, snapshot = self._sync(1003600)
+        self.assertEquals(how, 'incremental')
+        self.assertEquals(snapshot.nodes.keys(), ['n0', 'n1', 'n3'])
+        self.assertEquals(snapshot.nodes['n1']['name'], 'renamed')
+        self.assertEquals([c['id'] for c in snapshot.checks['n3']], ['c3'])
+        self.assertEquals(snapshot.checks['n0'][0]['details'], {'changed': True})
+        self.assertFalse('n2' in snapshot.checks)
+        # c3 came with its node, only c0 is read on its own
+        self.assertEquals(self.account.requests(), {'nodes': 1, 'checks': 2, 'monitors': 0, 'changelogs': 1})
+
+    def test_monitor_change(self):
+        self._sync(1000000)
+
+        self.account.monitors.items.append(self.account.monitor('m2', 'new'))
+        self.account.checks.items.append(self.account.check('c9', 'n2', 'm2'))
+        self.account.change_logs = [{'type': {'description': 'Monitor'}, 'object': {'id': 'm2'}}]
+
+        how, snapshot = self._sync(1003600)
+        self.assertEquals(snapshot.monitors.keys(), ['m1', 'm2'])
+        self.assertEquals([c['id'] for c in snapshot.checks['n2']], ['c2', 'c9'])
+
+    def test_full_sync_when_unsure(self):
+        self._sync(1000000)
+
+        self.account.change_logs = [{'object_type': 'something new', 'object_id': 'x1'}]
+        self.assertEquals(self._sync(1003600)[0], 'full')
+
+        # older than the change logs go back
+        self.account.change_logs = []
+        self.assertEquals(self._sync(1003600 + CloudkickSnapshot.max_age + 1)[0], 'full')
+
+    def test_api_reads_from_snapshot(self):
+        how, snapshot = self._sync(1000000)
+        self.account.reset()
+
+        with mock.patch('cloudkick_api.wrapper.Connection'):
+            ck = CloudkickApi('key', 'secret')
+        ck.use_snapshot(snapshot)
+
+        nodes = ck.list_nodes()
+        self.assertEquals([n.id for n in nodes], ['n0', 'n1', 'n2'])
+        ck.prefetch_checks(nodes)
+        checks = ck.list_checks(nodes[1])
+        self.assertEquals([c.id for c in checks], ['c1'])
+        self.assertEquals(checks[0].monitor.name, 'default')
+        # every check of a monitor shares its Monitor
+        self.assertTrue(ck.list_checks(nodes[0])[0].monitor is checks[0].monitor)
+        self.assertEquals(ck.conn.method_calls, [])
+
+    def test_read_only(self):
+        # shards read the snapshot whoever started them synced
+        with mock.patch('cloudkick_api.wrapper.Connection'):
+            self.assertRaises(SystemExit, utils.setup_ck, 'key', 'secret', snapshot=self.path, sync=False)
+
+            self._sync(1000000)
+            ck = utils.setup_ck('key', 'secret', snapshot=self.path, sync=False)
+
+        self.assertEquals([n.id for n in ck.list_nodes()], ['n0', 'n1', 'n2'])
+        self.assertEquals(ck.conn.method_calls, [])
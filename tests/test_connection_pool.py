@@ -0,0 +1,67 @@
+import socket
+import unittest
+
+import mock
+
+from libcloud.common.base import Connection, ConnectionPool
+from libcloud.utils.py3 import httplib
+
+
+class FakeHTTPConnection(object):
+    """
+    an httplib connection that fails the way it's told to, or answers 200
+    """
+
+    def __init__(self, request_error=None, response_error=None):
+        self.request_error = request_error
+        self.response_error = response_error
+        self.requests = []
+
+    def request(self, method, url, body=None, headers=None):
+        if self.request_error:
+            raise self.request_error
+        self.requests.append((method, url))
+
+    def getresponse(self):
+        if self.response_error:
+            raise self.response_error
+        return mock.Mock(status=200, reason='OK', will_close=False, **{
+            'read.return_value': '', 'getheaders.return_value': [], 'isclosed.return_value': True})
+
+    def close(self):
+        pass
+
+
+class PooledRequestTests(unittest.TestCase):
+
+    def setUp(self):
+        self.fresh = FakeHTTPConnection()
+        self.conn = Connection(host='example.com', port=80, secure=False)
+        self.conn.connection_pool = ConnectionPool()
+        self.conn.conn_classes = (lambda **kwargs: self.fresh, None)
+
+    def _request(self, method, stale):
+        # a connection that sat in the pool since an earlier request
+        self.conn.connection_pool.release(('example.com', 80, 0), stale, mock.Mock(will_close=False))
+        return self.conn._pooled_request(method, '/entities', '', {})
+
+    def test_retries_request_that_never_went_out(self):
+        stale = FakeHTTPConnection(request_error=socket.error(32, 'Broken pipe'))
+        self.assertEqual(self._request('POST', stale).status, 200)
+        self.assertEqual(self.fresh.requests, [('POST', '/entities')])
+
+    def test_retries_connection_closed_while_idle(self):
+        stale = FakeHTTPConnection(response_error=httplib.BadStatusLine("''"))
+        self.assertEqual(self._request('POST', stale).status, 200)
+        self.assertEqual(self.fresh.requests, [('POST', '/entities')])
+
+    def test_doesnt_resend_post_after_timeout(self):
+        stale = FakeHTTPConnection(response_error=socket.timeout('timed out'))
+        self.assertRaises(socket.timeout, self._request, 'POST', stale)
+        self.assertEqual(stale.requests, [('POST', '/entities')])
+        self.assertEqual(self.fresh.requests, [])
+
+    def test_resends_get_after_timeout(self):
+        stale = FakeHTTPConnection(response_error=socket.timeout('timed out'))
+        self.assertEqual(self._request('GET', stale).status, 200)
+        self.assertEqual(self.fresh.requests, [('GET', '/entities')])
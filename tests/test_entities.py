@@ -3,9 +3,10 @@ import mock
 
 from tests.utils import MockData
 
-from cloudkick_api.wrapper import Node
+from cloudkick_api.wrapper import Node, CloudkickApi
 from entities import MigratedEntity
 from entities import EntityMigrator
+from migrate import Migrator
 
 
 class CloudkickNodeTests(unittest.TestCase):
@@ -41,6 +42,39 @@ class CloudkickNodeTests(unittest.TestCase):
                                               'public1_v4': '60.60.60.60'})
 
 
+class CloudkickChecksTests(unittest.TestCase):
+
+    def _check(self, check_id, node_id):
+        return {'id': check_id, 'node_id': node_id, 'monitor_id': 'mFAKE',
+                'type': {'description': 'PING'}, 'details': {}, 'is_enabled': True}
+
+    def setUp(self):
+        self.api = CloudkickApi('key', 'secret')
+        self.api.conn = mock.Mock()
+        self.api.conn.monitors.read.return_value = {'items': [{'id': 'mFAKE', 'name': 'FAKE_MONITOR',
+                                                               'notification_receivers': []}]}
+        self.api.check_batch_size = 2
+        self.nodes = [MockData.get_fake_node('n%s' % i) for i in range(3)]
+
+    def test_prefetch(self):
+        self.api.conn.checks.read.side_effect = [{'items': [self._check('c0', 'n0'), self._check('c1', 'n1'),
+                                                            self._check('c2', 'n1')]},
+                                                 {'items': []},
+                                                 {'items': [self._check('c1', 'n1')]}]
+        self.api.prefetch_checks(self.nodes)
+
+        self.assertEquals([c.id for c in self.api.list_checks(self.nodes[0])], ['c0'])
+        self.assertEquals([c.id for c in self.api.list_checks(self.nodes[1])], ['c1', 'c2'])
+        self.assertEquals(self.api.list_checks(self.nodes[2]), [])
+
+        # not prefetched anymore, read again
+        self.assertEquals(self.api.list_checks(self.nodes[1])[0].monitor.name, 'FAKE_MONITOR')
+
+        self.assertEquals(self.api.conn.checks.read.call_args_list,
+                          [mock.call(node_ids='n0,n1'), mock.call(node_ids='n2'), mock.call(node_ids='n1')])
+        self.assertEquals(self.api.conn.monitors.read.call_count, 1)
+
+
 class MigratedEntityTests(unittest.TestCase):
 
     def test_migrated_entity_new(self):
@@ -75,6 +109,80 @@ class MigratedEntityTests(unittest.TestCase):
         self.assertEquals(result, None)
 
 
+class EntityIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.rs_api = mock.Mock()
+        self.migrator = Migrator(mock.Mock(), self.rs_api, {}, mock.Mock())
+
+        # matches the fake node by public ip only
+        self.ip_entity = MockData.get_fake_entity()
+        self.ip_entity.id = 'enIP'
+        self.ip_entity.extra = {}
+
+        # matches the fake node by ck_node_id
+        self.id_entity = MockData.get_fake_entity()
+        self.id_entity.id = 'enID'
+        self.id_entity.ip_addresses = []
+
+    def test_match_by_ip(self):
+        self.rs_api.list_entities.return_value = [self.ip_entity, self.id_entity]
+        e = MigratedEntity(self.migrator, MockData.get_fake_node('nOTHER'))
+        self.assertEquals(e.rs_entity, self.ip_entity)
+
+    def test_no_match(self):
+        self.rs_api.list_entities.return_value = [self.ip_entity, self.id_entity]
+        node = MockData.get_fake_node('nOTHER')
+        node.ip_addresses = {'public0_v4': '9.9.9.9', 'private0_v4': '50.50.50.50'}
+        e = MigratedEntity(self.migrator, node)
+        self.assertEquals(e.rs_entity, None)
+
+    def test_first_entity_wins(self):
+        self.rs_api.list_entities.return_value = [self.ip_entity, self.id_entity]
+        e = MigratedEntity(self.migrator, MockData.get_fake_node())
+        self.assertEquals(e.rs_entity, self.ip_entity)
+
+        self.migrator = Migrator(mock.Mock(), self.rs_api, {}, mock.Mock())
+        self.rs_api.list_entities.return_value = [self.id_entity, self.ip_entity]
+        e = MigratedEntity(self.migrator, MockData.get_fake_node())
+        self.assertEquals(e.rs_entity, self.id_entity)
+
+    def test_tagged_entity_not_matched_by_ip(self):
+        self.ip_entity.extra = {'ck_node_id': 'nSOMEONEELSE'}
+        self.rs_api.list_entities.return_value = [self.ip_entity]
+        e = MigratedEntity(self.migrator, MockData.get_fake_node())
+        self.assertEquals(e.rs_entity, None)
+        self.assertEquals(self.rs_api.list_entities.call_count, 1)
+
+
+class SnapshotTests(unittest.TestCase):
+
+    def test_snapshot(self):
+        rs_api = mock.Mock()
+        entity = MockData.get_fake_entity()
+        rs_api.ex_views_overview.return_value = [{'entity': entity,
+                                                  'checks': ['check'],
+                                                  'alarms': ['alarm'],
+                                                  'latest_alarm_states': []}]
+
+        migrator = Migrator(mock.Mock(), rs_api, {}, mock.Mock())
+        migrator.load_rs_snapshot()
+
+        e = MigratedEntity(migrator, MockData.get_fake_node())
+        self.assertEquals(e.rs_entity, entity)
+        self.assertEquals(e.get_rs_checks(), ['check'])
+        self.assertEquals(e.get_rs_alarms(), ['alarm'])
+
+        # entities created later on have nothing upstream yet
+        e.rs_entity = mock.Mock(id='enNEW')
+        e._rs_checks_cache = None
+        self.assertEquals(e.get_rs_checks(), [])
+
+        self.assertEquals(rs_api.list_entities.call_count, 0)
+        self.assertEquals(rs_api.list_checks.call_count, 0)
+        self.assertEquals(rs_api.list_alarms.call_count, 0)
+
+
 class EntityMigratorTests(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from tests.utils import MockData
+
+import migrate
+from journal import Journal
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resume(self):
+        journal = Journal(self.path)
+        journal.add('entity', 'nFAKEID', MockData.get_fake_entity(), 'Created')
+        self.assertEquals(journal.get('entity', 'nFAKEID', mock.Mock()), None)
+        journal.close()
+
+        # a line cut short by a crash
+        f = open(self.path, 'a')
+        f.write('{"kind": "check", "key": "c')
+        f.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertEquals(len(journal), 1)
+
+        entity = journal.get('entity', 'nFAKEID', mock.Mock())
+        self.assertEquals(entity.id, 'nFAKEID')
+        self.assertEquals(entity.extra, {'ck_node_id': 'nFAKEID'})
+        self.assertEquals(sorted(entity.ip_addresses), sorted(MockData.get_fake_entity().ip_addresses))
+        self.assertEquals(journal.get('entity', 'nOTHER', mock.Mock()), None)
+
+        journal.add('notification', 'test@example.com', mock.Mock(id='ntFAKE', label='test', type='email',
+                                                                  details={'address': 'test@example.com'}), 'Created')
+        journal.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertEquals(len(journal), 2)
+        self.assertEquals(journal.get('notification', 'test@example.com', mock.Mock()).id, 'ntFAKE')
+        journal.close()
+
+    def test_no_path(self):
+        journal = Journal()
+        journal.add('entity', 'nFAKEID', MockData.get_fake_entity(), 'Created')
+        self.assertEquals(len(journal), 0)
+        self.assertEquals(journal.get('entity', 'nFAKEID', mock.Mock()), None)
+
+    def test_earlier_run(self):
+        options = mock.Mock(resume=False, fresh=False)
+        migrate._check_journal(self.path, options)
+
+        journal = Journal(self.path)
+        journal.add('entity', 'nFAKEID', MockData.get_fake_entity(), 'Created')
+        journal.close()
+
+        # a new run doesn't write over it, unless told to
+        self.assertRaises(SystemExit, migrate._check_journal, self.path, options)
+        migrate._check_journal(self.path, mock.Mock(resume=True, fresh=False))
+        migrate._check_journal(self.path, mock.Mock(resume=False, fresh=True))
+        self.assertEquals(len(Journal(self.path, resume=True)), 1)
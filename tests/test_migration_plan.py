@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from migration_plan import MigrationPlan, PlanError, PlanningDriver
+
+from rackspace_monitoring.drivers.rackspace import RackspaceMonitoringDriver
+
+
+class MigrationPlanTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'plan.json')
+
+        # no connection, nothing may be sent while planning
+        self.driver = RackspaceMonitoringDriver.__new__(RackspaceMonitoringDriver)
+        self.driver.ex_refetch = False
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_plan_and_apply(self):
+        plan = MigrationPlan()
+        driver = PlanningDriver(self.driver, plan)
+
+        entity = driver.create_entity(label='node', ip_addresses={'public0_v4': '1.2.3.4'}, extra={'ck_node_id': 'n1'})
+        self.assertEquals(entity.id, 'pending:1')
+        self.assertEquals(driver.list_checks(entity), [])
+
+        check = driver.create_check(entity, label='ping', type='remote.ping', monitoring_zones=['mzdfw'],
+                                    target_alias='public0_v4', details={})
+        self.assertEquals(check.entity_id, 'pending:1')
+
+        existing = mock.Mock(id='ntEXISTING', label='ops', type='email', details={'address': 'ops@example.com'})
+
+        plan.add('entity', 'n1', entity, 'Created')
+        plan.add('check', 'c1', check, 'Created')
+        plan.add('notification', 'ops@example.com', existing, 'Found')
+        plan.save(self.path)
+
+        plan = MigrationPlan.load(self.path)
+        self.assertEquals(plan.summary(), {('entity', 'Created'): 1, ('check', 'Created'): 1,
+                                           ('notification', 'Found'): 1})
+
+        self.driver._create = mock.Mock(side_effect=[{'entity_id': 'enREAL'},
+                                                     {'entity_id': 'enREAL', 'check_id': 'chREAL'}])
+        journal = mock.Mock()
+        self.assertEquals(plan.apply(self.driver, journal, concurrency=2), 0)
+
+        self.assertEquals(self.driver._create.call_args_list[1][0][0], '/entities/enREAL/checks')
+        added = [(c[0][0], c[0][1], c[0][2].id, c[0][3]) for c in journal.add.call_args_list]
+        self.assertEquals(added, [('notification', 'ops@example.com', 'ntEXISTING', 'Found'),
+                                  ('entity', 'n1', 'enREAL', 'Created'),
+                                  ('check', 'c1', 'chREAL', 'Created')])
+        self.assertEquals(journal.add.call_args_list[2][0][2].entity_id, 'enREAL')
+
+    def test_failed_parent(self):
+        plan = MigrationPlan()
+        driver = PlanningDriver(self.driver, plan)
+        entity = driver.create_entity(label='node')
+        plan.add('entity', 'n1', entity, 'Created')
+        plan.add('check', 'c1', driver.create_check(entity, label='ping', type='remote.ping'), 'Created')
+
+        self.driver._create = mock.Mock(side_effect=Exception('boom'))
+        self.assertEquals(plan.apply(self.driver, mock.Mock()), 2)
+        self.assertEquals(self.driver._create.call_count, 1)
+
+    def test_writes(self):
+        plan = MigrationPlan()
+        driver = PlanningDriver(self.driver, plan)
+
+        entity = mock.Mock(id='enEXISTING', label='node', agent_id=None, ip_addresses=[], uri=None, extra={})
+        updated = driver.update_entity(entity, {'label': 'renamed'})
+        self.assertEquals((updated.id, updated.label), ('enEXISTING', 'renamed'))
+        self.assertEquals(plan.changes[0]['method'], 'PUT')
+        self.assertEquals(plan.changes[0]['url'], '/entities/enEXISTING')
+
+        # writes the migration doesn't plan for are refused, not sent
+        self.assertRaises(PlanError, getattr, driver, 'delete_entity')
+        self.assertRaises(PlanError, getattr, driver, 'create_agent_token')
+        self.assertFalse(hasattr(self.driver, 'connection'))
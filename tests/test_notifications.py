@@ -0,0 +1,117 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import utils
+from journal import Journal
+from notifications import NotificationMigrator
+
+from cloudkick_api.wrapper import Monitor
+
+
+def get_fake_monitor(monitor_id, addresses):
+    receivers = [{'type': {'code': 1}, 'name': address, 'details': {'email_address': address}}
+                 for address in addresses]
+    return Monitor({'id': monitor_id, 'name': 'monitor', 'notification_receivers': receivers})
+
+
+class NotificationMigratorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.rs_api = mock.Mock()
+        self.rs_api.list_notifications.return_value = [
+            mock.Mock(id='ntEXISTING', type='email', details={'address': 'Ops@Example.com'}),
+            mock.Mock(id='ntWEBHOOK', type='webhook', details={'url': 'http://example.com'})]
+        self.rs_api.create_notification.side_effect = lambda **kwargs: mock.Mock(id='nt' + kwargs['label'],
+                                                                                 **kwargs)
+
+        migrator = mock.Mock(rs_api=self.rs_api, journal=Journal(), monitor_checks={}, coordinator=None)
+        migrator.options.concurrency = 2
+        self.migrator = NotificationMigrator(migrator)
+
+    def test_dedup(self):
+        self.migrator._generate_notifications(get_fake_monitor('m1', ['ops@example.com', 'new@example.com']))
+        self.migrator._generate_notifications(get_fake_monitor('m2', ['NEW@example.com ', 'ops@example.com']))
+
+        self.assertEquals(self.rs_api.list_notifications.call_count, 1)
+        self.assertEquals(self.rs_api.create_notification.call_count, 1)
+
+        for monitor_id in ['m1', 'm2']:
+            ids = sorted(n.id for n in self.migrator.monitor_to_notification_map[monitor_id].values())
+            self.assertEquals(ids, ['ntEXISTING', 'ntnew@example.com'])
+
+    def test_plans(self):
+        monitors = [get_fake_monitor('m1', ['ops@example.com']), get_fake_monitor('m2', [])]
+        checks = [mock.Mock(ck_check=mock.Mock(monitor=monitors[0])) for i in range(2)]
+        checks.append(mock.Mock(ck_check=mock.Mock(monitor=monitors[1])))
+        self.migrator.migrator.monitor_checks = {'m1': checks[:2], 'm2': checks[2:]}
+
+        self.rs_api.list_notification_plans.return_value = [mock.Mock(id='npEXISTING', label='monitor:m1',
+                                                                      critical_state=[])]
+        self.rs_api.update_notification_plan.return_value = mock.Mock(id='npUPDATED')
+        self.rs_api.create_notification_plan.return_value = mock.Mock(id='npCREATED')
+
+        self.migrator.migrate()
+
+        self.assertEquals(self.rs_api.list_notification_plans.call_count, 1)
+        self.assertEquals(self.rs_api.update_notification_plan.call_args[0][1]['critical_state'], ['ntEXISTING'])
+        self.assertEquals(self.rs_api.create_notification_plan.call_args[1]['label'], 'monitor:m2')
+        self.assertEquals([c.rs_notification_plan.id for c in checks], ['npUPDATED', 'npUPDATED', 'npCREATED'])
+
+    def test_plans_journaled_before_error(self):
+        monitors = [get_fake_monitor('m1', ['ops@example.com']), get_fake_monitor('m2', [])]
+        self.migrator.migrator.monitor_checks = dict((m.id, [mock.Mock(ck_check=mock.Mock(monitor=m))])
+                                                     for m in monitors)
+        self.migrator.journal = mock.Mock(**{'get.return_value': None})
+        self.rs_api.list_notification_plans.return_value = []
+
+        def create_notification_plan(label, **kwargs):
+            if label == 'monitor:m1':
+                raise ValueError(label)
+            return mock.Mock(id='npCREATED')
+        self.rs_api.create_notification_plan.side_effect = create_notification_plan
+
+        # the plan that failed is raised, after the one that didn't is journaled
+        self.assertRaises(ValueError, self.migrator.migrate)
+        plans = [c[0][1] for c in self.migrator.journal.add.call_args_list if c[0][0] == 'plan']
+        self.assertEquals(plans, ['monitor:m2'])
+
+    def test_resolve_plan_once(self):
+        monitor = get_fake_monitor('m1', ['ops@example.com', 'new@example.com'])
+        self.rs_api.list_notification_plans.return_value = []
+        self.rs_api.create_notification_plan.return_value = mock.Mock(id='npCREATED')
+
+        queue = utils.WorkQueue(4)
+        for i in range(8):
+            queue.add(self.migrator.resolve_plan, monitor)
+
+        self.assertEquals([plan.id for plan, e in queue.results()], ['npCREATED'] * 8)
+        self.assertEquals(self.rs_api.create_notification.call_count, 1)
+        self.assertEquals(self.rs_api.create_notification_plan.call_count, 1)
+        self.assertEquals(sorted(self.rs_api.create_notification_plan.call_args[1]['ok_state']),
+                          ['ntEXISTING', 'ntnew@example.com'])
+
+    def test_journal_key(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'journal.jsonl')
+            self.migrator.journal = Journal(path)
+            self.migrator._generate_notifications(get_fake_monitor('m1', ['New@Example.com']))
+            self.migrator.journal.close()
+
+            # the same address, written differently, comes out of the journal
+            self.rs_api.reset_mock()
+            migrator = mock.Mock(rs_api=self.rs_api, journal=Journal(path, resume=True), monitor_checks={},
+                                 coordinator=None)
+            NotificationMigrator(migrator)._generate_notifications(get_fake_monitor('m2', [' new@example.com']))
+            migrator.journal.close()
+
+            self.assertFalse(self.rs_api.list_notifications.called)
+            self.assertFalse(self.rs_api.create_notification.called)
+        finally:
+            shutil.rmtree(tmpdir)
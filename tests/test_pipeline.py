@@ -0,0 +1,109 @@
+import time
+import unittest
+import threading
+
+import mock
+
+from migrate import Migrator
+from pipeline import NodePipeline
+
+from cloudkick_api.wrapper import Check
+from rackspace_monitoring.base import Entity
+
+from tests.utils import MockData
+from tests.test_notifications import get_fake_monitor
+
+
+class NodePipelineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = [MockData.get_fake_node('n1'), MockData.get_fake_node('n2'), MockData.get_fake_node('n3')]
+        monitor = get_fake_monitor('m1', ['ops@example.com'])
+
+        self.ck_api = mock.Mock()
+        self.ck_api.list_nodes.return_value = self.nodes
+        self.ck_api.list_checks.side_effect = lambda node: [
+            Check(node, {'id': 'c' + node.id, 'type': {'description': 'PING'}, 'details': {}, 'is_enabled': True},
+                  {'id': monitor.id, 'name': monitor.name, 'notification_receivers': monitor.notification_receivers})]
+
+        # Mock's call counts aren't thread-safe, the workers' calls are recorded here
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+        self.rs_api = mock.Mock()
+        self.rs_api.list_notifications.return_value = []
+        self.rs_api.list_notification_plans.return_value = []
+        self.rs_api.create_notification.return_value = mock.Mock(id='ntCREATED', details={'address': 'ops@example.com'})
+        self.rs_api.create_notification_plan.side_effect = self._recorded(
+            'create_notification_plan', lambda **kwargs: mock.Mock(id='npCREATED'))
+        self.rs_api.create_entity.side_effect = self._recorded('create_entity', self._create_entity)
+        self.rs_api.create_check.side_effect = self._recorded('create_check', lambda entity, **kwargs: mock.Mock(
+            id='ch' + entity.id, type=kwargs['type'], extra=dict(kwargs['metadata'])))
+        self.rs_api.create_alarm.side_effect = self._recorded(
+            'create_alarm', lambda entity, **kwargs: mock.Mock(id='al' + entity.id))
+
+        options = mock.Mock(no_test=True, auto=True, batch=False, concurrency=2, pipeline=True,
+                            stream=False)
+        self.migrator = Migrator(self.ck_api, self.rs_api, {}, options)
+        # as if load_rs_snapshot() found an empty account
+        self.migrator._rs_entities_cache = []
+        self.migrator._rs_checks_cache = {}
+        self.migrator._rs_alarms_cache = {}
+
+    def _recorded(self, name, func):
+        def side_effect(*args, **kwargs):
+            with self._calls_lock:
+                self.calls.append((name, args, kwargs))
+            return func(*args, **kwargs)
+        return side_effect
+
+    def _called(self, name):
+        """
+        (args, kwargs) of every call to rs_api.<name>
+        """
+        return [(args, kwargs) for called, args, kwargs in self.calls if called == name]
+
+    def _create_entity(self, **kwargs):
+        if kwargs['label'] == 'broken':
+            raise Exception('create failed')
+        return Entity(id='en' + kwargs['extra']['ck_node_id'], label=kwargs['label'], extra=kwargs['extra'],
+                      ip_addresses=kwargs['ip_addresses'].items(), agent_id=kwargs['agent_id'], driver=self.rs_api)
+
+    def test_migrate(self):
+        self.nodes[1].label = 'broken'
+        NodePipeline(self.migrator).migrate()
+
+        self.ck_api.prefetch_checks.assert_called_once_with(self.nodes)
+        self.assertEquals(sorted(e.rs_entity.id for e in self.migrator.migrated_entities), ['enn1', 'enn3'])
+        self.assertEquals(len(self._called('create_check')), 2)
+
+        # one plan for the monitor, shared by both nodes' alarms
+        self.assertEquals(len(self._called('create_notification_plan')), 1)
+        self.assertEquals(len(self._called('create_alarm')), 2)
+        for args, kwargs in self._called('create_alarm'):
+            self.assertEquals(kwargs['notification_plan_id'], 'npCREATED')
+            self.assertEquals(kwargs['check_id'], 'ch' + args[0].id)
+
+    def test_stream(self):
+        self.migrator.options.stream = True
+        self.ck_api.iter_nodes.return_value = iter(self.nodes)
+        self.ck_api.check_batch_size = 2
+        NodePipeline(self.migrator).migrate()
+
+        # two batches, nothing kept once a node is done
+        self.assertEquals(self.ck_api.prefetch_checks.call_args_list,
+                          [mock.call(self.nodes[:2]), mock.call(self.nodes[2:])])
+        self.assertEquals(len(self._called('create_alarm')), 3)
+        self.assertEquals(self.migrator.migrated_entities, [])
+        self.assertEquals(dict(self.migrator.monitor_checks), {})
+
+    def test_resume_lists_entities_once(self):
+        # nothing was snapshotted, the first nodes to need the index build it
+        self.migrator._rs_entities_cache = None
+        self.migrator.journal.resume = True
+        self.migrator.options.concurrency = 3
+        self.rs_api.list_entities.side_effect = self._recorded('list_entities', lambda: time.sleep(0.05) or [])
+
+        NodePipeline(self.migrator).migrate()
+        self.assertEquals(len(self._called('list_entities')), 1)
+        self.assertEquals(len(self._called('create_entity')), 3)
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from checks.checks import MigratedCheck
+from preflight import ResultCache, payload_key
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test_cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_payload_key(self):
+        self.assertEquals(payload_key({'a': 1, 'b': [1, 2]}), payload_key({'b': [1, 2], 'a': 1}))
+        self.assertNotEquals(payload_key({'a': 1}), payload_key({'a': 2}))
+
+    def test_check_results_cached(self):
+        migrator = mock.Mock(test_cache=ResultCache(self.path))
+        rs_entity = mock.Mock(id='enFAKE', ip_addresses=[('public0_v4', '1.2.3.4')])
+        migrated_entity = mock.Mock(migrator=migrator, rs_entity=rs_entity)
+        migrated_entity.get_rs_checks.return_value = []
+        migrated_entity.rs_api.test_check.return_value = [{'available': True}]
+        ck_check = mock.Mock(id='cFAKE', type='PING', label='ping', disabled=False, details={})
+
+        check = MigratedCheck(migrated_entity, ck_check)
+        self.assertEquals(check.test()[0], True)
+        migrator.test_cache.save()
+
+        # a re-run doesn't test the same check again
+        migrator.test_cache = ResultCache(self.path)
+        check = MigratedCheck(migrated_entity, ck_check)
+        self.assertEquals(check.test()[0], True)
+        self.assertEquals(migrated_entity.rs_api.test_check.call_count, 1)
+        self.assertEquals(migrator.test_cache.hits, 1)
+
+        # ...unless its target changed
+        rs_entity.ip_addresses = [('public0_v4', '5.6.7.8')]
+        check = MigratedCheck(migrated_entity, ck_check)
+        check.test()
+        self.assertEquals(migrated_entity.rs_api.test_check.call_count, 2)
@@ -0,0 +1,98 @@
+import mock
+import unittest
+
+from rackspace_monitoring.drivers.rackspace import (RateLimiter, RackspaceMonitoringConnection,
+                                                    RackspaceMonitoringDriver, RackspaceMonitoringRateLimitError,
+                                                    _parse_window)
+
+
+def get_limits(used=0, limit=3):
+    return {'resource': {},
+            'rate': {'global': {'limit': limit, 'used': used, 'window': '24.0 hours'},
+                     'test_check': {'limit': 1, 'used': 0, 'window': '1.0 minute'}}}
+
+
+class FakeConnection(RackspaceMonitoringConnection):
+    """
+    skips authenticating, everything else is the real connection
+    """
+
+    def _populate_hosts_and_request_paths(self):
+        self.auth_token = 'token'
+        self.service_catalog = mock.Mock()
+        self.service_catalog.get_endpoint.return_value = {'tenantId': '1234'}
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def test_parse_window(self):
+        self.assertEqual(_parse_window('24.0 hours'), 86400)
+        self.assertEqual(_parse_window('1.0 minute'), 60)
+        self.assertEqual(_parse_window(None), 86400)
+
+    @mock.patch('time.sleep')
+    def test_spends_budget_then_waits(self, sleep):
+        limiter = RateLimiter(get_limits(used=1))
+        limiter.acquire('/entities', 'GET')
+        limiter.acquire('/entities', 'POST')
+        self.assertEqual(limiter.remaining(), 0)
+        self.assertFalse(sleep.called)
+
+        # roll the window over instead of waiting a day for it
+        limiter._buckets['global']['reset'] = 0
+        limiter.acquire('/entities', 'GET')
+        self.assertEqual(limiter.remaining(), 2)
+
+    @mock.patch('time.sleep')
+    def test_refreshes_while_waiting(self, sleep):
+        refresh = mock.Mock(return_value=get_limits(used=0))
+        limiter = RateLimiter(get_limits(used=3), refresh=refresh, poll_interval=0)
+        limiter.acquire('/entities', 'GET')
+        sleep.assert_called_once_with(0)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(limiter.remaining(), 2)
+
+    @mock.patch('time.sleep')
+    def test_specific_buckets(self, sleep):
+        limiter = RateLimiter(get_limits())
+        limiter.acquire('/entities/en1/test-check', 'POST')
+        self.assertEqual(limiter.remaining('test_check'), 0)
+        self.assertEqual(limiter.remaining(), 2)
+
+        # a notification test is not a check test
+        limiter.acquire('/notifications/nt1/test', 'POST')
+        self.assertEqual(limiter.remaining('test_check'), 0)
+        self.assertEqual(limiter.remaining(), 1)
+
+
+class ConnectionBackoffTests(unittest.TestCase):
+
+    @mock.patch('time.sleep')
+    @mock.patch('libcloud.common.openstack.OpenStackBaseConnection.request')
+    def test_retries_after_pushback(self, request, sleep):
+        error = RackspaceMonitoringRateLimitError(status=413, message='Over limit', retry_after=None, driver=None)
+        request.side_effect = [error, error, 'ok']
+
+        conn = RackspaceMonitoringConnection('user', 'key')
+        self.assertEqual(conn.request('/entities'), 'ok')
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [2, 4])
+
+    @mock.patch('time.sleep')
+    @mock.patch('libcloud.common.openstack.OpenStackBaseConnection.request')
+    def test_gives_up(self, request, sleep):
+        error = RackspaceMonitoringRateLimitError(status=429, message='Slow down', retry_after=7, driver=None)
+        request.side_effect = error
+
+        conn = RackspaceMonitoringConnection('user', 'key')
+        self.assertRaises(RackspaceMonitoringRateLimitError, conn.request, '/entities')
+        self.assertEqual(request.call_count, conn.rate_limit_retries + 1)
+        self.assertTrue(all(c[0][0] == 7 for c in sleep.call_args_list))
+
+    @mock.patch('libcloud.common.base.Connection.request')
+    @mock.patch.object(RackspaceMonitoringDriver, 'connectionCls', FakeConnection)
+    def test_driver_reads_limits(self, request):
+        request.return_value = mock.Mock(object=get_limits(used=1))
+
+        driver = RackspaceMonitoringDriver('user', 'key', ex_rate_limit=True)
+        self.assertEqual(request.call_args[1]['action'], '/limits')
+        self.assertEqual(driver.connection.rate_limiter.remaining(), 2)
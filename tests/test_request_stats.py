@@ -0,0 +1,121 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import SocketServer
+
+import mock
+
+from libcloud.common.base import Connection
+from cloudkick_api.base import Connection as CloudkickConnection
+
+from request_stats import RequestStats, Histogram, templated_path
+from tests.test_cloudkick_api import FakeCloudkickHandler
+
+
+class RequestStatsTests(unittest.TestCase):
+
+    def test_templated_path(self):
+        self.assertEquals(templated_path('/v1.0/123456/entities/enAB12/checks?marker=chX1'),
+                          '/v1.0/:id/entities/:id/checks')
+        self.assertEquals(templated_path('/2.0/nodes'), '/2.0/nodes')
+        self.assertEquals(templated_path('/v2.0/tokens'), '/v2.0/tokens')
+        self.assertEquals(templated_path('/v1.0/123456/entities/en1/test-check'),
+                          '/v1.0/:id/entities/:id/test-check')
+        # ids without digits in them are still ids
+        self.assertEquals(templated_path('/v1.0/acme/entities/enABCD/alarms/alXYZ'),
+                          '/v1.0/:id/entities/:id/alarms/:id')
+        self.assertEquals(templated_path('/v1.0/acme/views/overview'), '/v1.0/:id/views/overview')
+        self.assertEquals(templated_path('/2.0/node/nAbCd'), '/2.0/node/:id')
+
+    def test_histogram(self):
+        h = Histogram()
+        for ms in [1, 3, 3, 3, 40, 40, 40, 40, 40, 900]:
+            h.add(200, 10, ms / 1000.0)
+        h.add(None, 0, 0.001)
+        h.add(404, 0, 0.001)
+
+        self.assertEquals(h.count, 12)
+        self.assertEquals(h.errors, 2)
+        self.assertEquals(h.bytes, 100)
+        self.assertEquals(h.percentile(50), 5)
+        self.assertEquals(h.percentile(90), 50)
+        self.assertEquals(h.percentile(100), 900)
+
+    def test_record_per_endpoint_and_phase(self):
+        stats = RequestStats()
+        hook = stats.hook('rackspace')
+        hook('GET', '/v1.0/123/views/overview', 200, 100, 0.01)
+        stats.set_phase('entities')
+        hook('POST', '/v1.0/123/entities', 201, 0, 0.02)
+        hook('POST', '/v1.0/123/entities', 400, 50, 0.02)
+        stats.record('cloudkick', 'GET', '/2.0/nodes', 200, 1000, 0.1)
+
+        data = stats.to_dict()
+        endpoints = dict(((e['api'], e['method'], e['path']), e) for e in data['endpoints'])
+        self.assertEquals(endpoints[('rackspace', 'POST', '/v1.0/:id/entities')]['count'], 2)
+        self.assertEquals(endpoints[('rackspace', 'POST', '/v1.0/:id/entities')]['errors'], 1)
+        self.assertEquals([(p['phase'], p['count']) for p in data['phases']], [('setup', 1), ('entities', 3)])
+        self.assertEquals(data['total']['count'], 4)
+        self.assertEquals(data['total']['bytes'], 1150)
+
+        table = stats.format_table()
+        self.assertTrue('rackspace POST /v1.0/:id/entities' in table)
+        self.assertTrue('entities' in table.split('phase')[1])
+
+    def test_save(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            stats = RequestStats()
+            stats.record('rackspace', 'GET', '/v1.0/123/limits', 200, 10, 0.01)
+            path = os.path.join(tmpdir, 'stats.json')
+            stats.save(path)
+            data = json.load(open(path))
+            self.assertEquals(data['endpoints'][0]['path'], '/v1.0/:id/limits')
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class RequestHookTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0), FakeCloudkickHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.paths = []
+        t = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        t.daemon = True
+        t.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_libcloud_connection(self):
+        hook = mock.Mock()
+        conn = Connection(secure=False, host='127.0.0.1', port=self.port)
+        conn.driver = mock.Mock()
+        conn.request_hook = hook
+
+        conn.request('/v1.0/entities/en1', params={'limit': 10})
+
+        method, path, status, size, seconds = hook.call_args[0]
+        self.assertEquals((method, path, status), ('GET', '/v1.0/entities/en1', 200))
+        self.assertEquals(size, len(json.dumps({'items': [{'id': 'nFAKEID'}]})))
+        self.assertTrue(seconds >= 0)
+
+    def test_cloudkick_connection(self):
+        hook = mock.Mock()
+        conn = CloudkickConnection(oauth_key='key', oauth_secret='secret',
+                                   api_server='127.0.0.1:%s' % self.port)
+        conn.request_hook = hook
+
+        conn._request_json('nodes')
+        conn.transport.close()
+
+        method, path, status, size, seconds = hook.call_args[0]
+        self.assertEquals((method, path, status), ('GET', '/2.0/nodes', 200))
+        self.assertTrue(size > 0)
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import shards
+import migrate
+from journal import Journal
+from notifications import NotificationMigrator
+
+from rackspace_monitoring.base import Notification, NotificationPlan
+
+from tests.test_notifications import get_fake_monitor
+
+
+class ShardTests(unittest.TestCase):
+
+    def test_parse_shard(self):
+        self.assertEquals(shards.parse_shard('0/4'), (0, 4))
+        self.assertEquals(shards.parse_shard('3/4'), (3, 4))
+        for value in ['4/4', '-1/4', '1', 'a/b', '1/2/3']:
+            self.assertRaises(ValueError, shards.parse_shard, value)
+
+    def test_node_filter(self):
+        node_ids = ['n%s' % i for i in range(100)]
+        owners = [[shards.node_filter((i, 4))(mock.Mock(id=node_id)) for i in range(4)].count(True)
+                  for node_id in node_ids]
+        # every node is in exactly one shard, and always the same one
+        self.assertEquals(owners, [1] * 100)
+        self.assertEquals(shards.shard_of(u'n42', 4), shards.shard_of('n42', 4))
+
+    def test_shard_path(self):
+        self.assertEquals(shards.shard_path('migration_journal.jsonl', (0, 4)), 'migration_journal.shard0of4.jsonl')
+        self.assertEquals(shards.shard_path('/tmp/log', (3, 4)), '/tmp/log.shard3of4')
+
+    def test_worker_args(self):
+        self.assertEquals(shards.worker_args(['--auto', '--workers', '4', '--pipeline', 'migrate'], 1, 4),
+                          ['--auto', '--pipeline', 'migrate', '--shard', '1/4'])
+        self.assertEquals(shards.worker_args(['--workers=4', 'migrate'], 3, 4), ['migrate', '--shard', '3/4'])
+
+
+class WorkersTests(unittest.TestCase):
+
+    def setUp(self):
+        self.options = mock.Mock(auto=True, pipeline=True, resume=True, workers=4, ck_snapshot='ck.json',
+                                 auth_cache=None)
+        self.config = {'cloudkick_oauth_key': 'key', 'cloudkick_oauth_secret': 'secret',
+                       'rackspace_username': 'user', 'rackspace_apikey': 'apikey'}
+
+    @mock.patch('shards.run_workers')
+    @mock.patch('utils.setup_ck')
+    @mock.patch('utils.setup_rs')
+    def test_missing_credentials(self, setup_rs, setup_ck, run_workers):
+        # shards can't prompt for them, nothing starts
+        del self.config['rackspace_apikey']
+        self.assertRaises(SystemExit, migrate._migrate_shards, ['migrate'], self.options, self.config)
+        self.assertFalse(setup_rs.called or setup_ck.called or run_workers.called)
+
+    @mock.patch('shards.run_workers', return_value=[])
+    @mock.patch('utils.setup_ck')
+    @mock.patch('utils.setup_rs')
+    def test_syncs_once(self, setup_rs, setup_ck, run_workers):
+        migrate._migrate_shards(['migrate'], self.options, self.config)
+        setup_rs.assert_called_once_with('user', 'apikey', auth_cache=None)
+        setup_ck.assert_called_once_with('key', 'secret', snapshot='ck.json')
+        self.assertEquals(run_workers.call_args[0][2], 4)
+
+
+class CoordinatorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.coordinator = shards.Coordinator(os.path.join(self.tmpdir, 'shards.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _shard(self):
+        """
+        a NotificationMigrator with its own (empty) Rackspace account view,
+        like a shard process has
+        """
+        rs_api = mock.Mock()
+        rs_api.list_notifications.return_value = []
+        rs_api.list_notification_plans.return_value = []
+        rs_api.create_notification.side_effect = lambda **kwargs: Notification(
+            id='nt' + kwargs['label'], driver=rs_api, **kwargs)
+        rs_api.create_notification_plan.side_effect = lambda **kwargs: NotificationPlan(
+            id='np' + kwargs['label'], driver=rs_api, **kwargs)
+
+        migrator = mock.Mock(rs_api=rs_api, journal=Journal(), monitor_checks={}, coordinator=self.coordinator)
+        return NotificationMigrator(migrator)
+
+    def test_shards_share_notifications_and_plans(self):
+        first, second = self._shard(), self._shard()
+        monitor = get_fake_monitor('m1', ['ops@example.com'])
+
+        plan = first.resolve_plan(monitor)
+        self.assertEquals(plan.critical_state, ['ntops@example.com'])
+
+        # the second shard finds what the first one created
+        self.assertEquals(second.resolve_plan(monitor).id, plan.id)
+        self.assertEquals(second.rs_api.create_notification.call_count, 0)
+        self.assertEquals(second.rs_api.create_notification_plan.call_count, 0)
+
+        # a new address on another monitor is only created once
+        other = get_fake_monitor('m2', ['ops@example.com', 'new@example.com'])
+        second.resolve_plan(other)
+        self.assertEquals(second.rs_api.create_notification.call_count, 1)
+        first.resolve_plan(other)
+        self.assertEquals(first.rs_api.create_notification.call_count, 1)
+
+    def test_reset(self):
+        self._shard().resolve_plan(get_fake_monitor('m1', ['ops@example.com']))
+        self.coordinator.reset()
+
+        with self.coordinator.shared() as state:
+            self.assertEquals(state, {'notifications': {}, 'plans': {}})
@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+
+import sys
+import time
+import random
+import unittest
+import traceback
+
+import mock
+
+import utils
+from rackspace_monitoring import utils as rs_utils
+
+
+class WorkQueueTests(unittest.TestCase):
+
+    def _job(self, i):
+        time.sleep(random.random() / 100)
+        if i == 3:
+            raise ValueError(i)
+        return i
+
+    def test_results_in_order(self):
+        for concurrency in [1, 4]:
+            queue = utils.WorkQueue(concurrency)
+            for i in range(10):
+                queue.add(self._job, i)
+
+            results = queue.results()
+            self.assertEquals([r for r, _ in results], [0, 1, 2, None, 4, 5, 6, 7, 8, 9])
+            self.assertTrue(isinstance(results[3][1], ValueError))
+            self.assertEquals(len(queue), 0)
+
+    def test_empty(self):
+        self.assertEquals(utils.WorkQueue(4).results(), [])
+
+    def test_runs_at_once_without_concurrency(self):
+        queue = utils.WorkQueue(1)
+        done = []
+        queue.add(done.append, 1)
+        self.assertEquals(done, [1])
+        self.assertEquals(len(queue), 1)
+        self.assertEquals(queue.results(), [(None, None)])
+
+    def test_reraise_keeps_traceback(self):
+        for concurrency in [1, 4]:
+            queue = utils.WorkQueue(concurrency)
+            queue.add(self._job, 3)
+            queue.add(self._job, 4)
+            _, e = queue.results()[0]
+            try:
+                utils.reraise(e)
+            except ValueError:
+                functions = [frame[2] for frame in traceback.extract_tb(sys.exc_info()[2])]
+                self.assertEquals(functions[-1], '_job')
+            else:
+                self.fail('reraise() returned')
+
+
+class ReviewTests(unittest.TestCase):
+
+    def test_diff_shape(self):
+        current = mock.Mock(label='old', details={'url': 'http://example.com', 'follow_redirects': False})
+        changes = {'label': 'new', 'details': {'url': 'http://example.com', 'follow_redirects': True}}
+        self.assertEquals(utils.diff_shape(changes, current), 'details.follow_redirects, label')
+
+    @mock.patch('utils.get_input')
+    def test_batch(self, get_input):
+        review = utils.Review('checks', batch=True)
+        for i in range(5):
+            group = 'create remote.ping' if i % 2 else 'update details.follow_redirects'
+            self.assertFalse(review.propose('Save?', group, i, 'check %s' % i))
+        self.assertFalse(review.propose('Save?', 'create remote.http (test failed)', 5, 'check 5', default='n'))
+
+        get_input.side_effect = ['l', 'y', 'n', 'y']
+        self.assertEquals(review.decide(), [0, 2, 4, 5])
+        self.assertEquals(get_input.call_count, 4)
+        self.assertEquals(get_input.call_args[1]['default'], 'n')
+        self.assertEquals(review.decide(), [])
+
+    @mock.patch('utils.get_input')
+    def test_auto(self, get_input):
+        review = utils.Review('checks', auto=True, batch=True)
+        self.assertTrue(review.propose('Save?', 'create', 0, 'check 0'))
+        self.assertEquals(review.decide(), [])
+        self.assertFalse(get_input.called)
+
+
+class InternValueTests(unittest.TestCase):
+
+    @mock.patch('rackspace_monitoring.utils._interned', {})
+    @mock.patch('rackspace_monitoring.utils.MAX_INTERNED', 2)
+    def test_bounded(self):
+        zones = rs_utils.intern_value([''.join(['mz', 'ord']), ''.join(['mz', 'dfw'])])
+        self.assertTrue(rs_utils.intern_value(''.join(['mz', 'ord'])) is zones[0])
+        self.assertTrue(rs_utils.intern_value({''.join(['mz', 'dfw']): 1}).keys()[0] is zones[1])
+
+        # the table is full, new strings come back as they are
+        label = ''.join(['web', '1'])
+        self.assertTrue(rs_utils.intern_value(label) is label)
+        self.assertEquals(len(rs_utils._interned), 2)
@@ -1,7 +1,12 @@
 import sys
 import os
 import json
+import time
 import getpass
+import threading
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 import logging
 log = logging.getLogger('maas_migration')
@@ -84,9 +89,186 @@ def get_input(msg=None, options=None, default=None, null=False, validator=None,
         return val
 
 
-def setup_rs(rs_username=None, rs_api_key=None):
+def diff_shape(changes, current=None):
+    """
+    the fields an update changes, e.g. 'details.follow_redirects, label'. dict
+    fields are compared key by key against the same attribute of current
+    """
+    fields = []
+    for key, value in changes.items():
+        old = getattr(current, key, None)
+        if isinstance(value, dict) and isinstance(old, dict):
+            fields.extend('%s.%s' % (key, k) for k in set(value) | set(old) if value.get(k) != old.get(k))
+        else:
+            fields.append(key)
+    return ', '.join(sorted(fields))
+
+
+class Review(object):
+    """
+    approves proposed changes - all of them with auto, one prompt per change,
+    or with batch one prompt per group of changes (same kind, action and diff
+    shape) once every change has been proposed
+    """
+
+    def __init__(self, kind, auto=False, batch=False):
+        self.kind = kind
+        self.auto = auto
+        self.batch = batch
+
+        self._groups = OrderedDict()
+        self._proposed = 0
+
+    def propose(self, question, group, item, name, default='y'):
+        """
+        True if item is approved right away. in batch mode the decision is
+        deferred to decide() and this is always False
+        """
+        if self.auto:
+            return True
+        if self.batch:
+            self._groups.setdefault((group, default), []).append((self._proposed, item, name))
+            self._proposed += 1
+            return False
+        return get_input(question, options=['y', 'n'], default=default) == 'y'
+
+    def decide(self):
+        """
+        prompt once per group, returns the approved items in proposal order
+        """
+        approved = []
+        for (group, default), items in self._groups.items():
+            while True:
+                answer = get_input('%s %s: %s - approve? (l to list them)' % (len(items), self.kind, group),
+                                   options=['y', 'n', 'l'], default=default)
+                if answer != 'l':
+                    break
+                for _, _, name in items:
+                    log.info('  %s' % name)
+
+            if answer == 'y':
+                approved.extend((i, item) for i, item, _ in items)
+            log.info('%s %s %s: %s' % ('Approved' if answer == 'y' else 'Skipped', len(items), self.kind, group))
+
+        self._groups = OrderedDict()
+        return [item for _, item in sorted(approved)]
+
+
+def _run_job(job):
+    func, args, kwargs = job
+    try:
+        return func(*args, **kwargs), None
+    except Exception as e:
+        # python 2 forgets where it was raised once we're out of here, keep it
+        # for reraise()
+        e.__traceback__ = sys.exc_info()[2]
+        return None, e
+
+
+def reraise(e):
+    """
+    raise an exception WorkQueue.results() handed back, with the traceback
+    of the job that raised it
+    """
+    raise type(e), e, getattr(e, '__traceback__', None)
+
+
+def chunks(iterable, size):
+    """
+    lists of up to `size` items from iterable, without reading ahead of the
+    chunk being handed out
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class WorkQueue(object):
+    """
+    collects jobs and runs them on a pool of `concurrency` worker threads.
+
+    results() blocks until every queued job is done and returns a (result, exception)
+    tuple per job, in the order the jobs were added, so logs stay deterministic no
+    matter how the threads were scheduled.
+
+    with a concurrency of 1 there's nothing to run a job alongside, it runs as
+    soon as it's added.
+    """
+
+    def __init__(self, concurrency=1):
+        self.concurrency = max(1, int(concurrency or 1))
+        self._jobs = []
+        self._results = []
+
+    def __len__(self):
+        return len(self._jobs) + len(self._results)
+
+    def add(self, func, *args, **kwargs):
+        if self.concurrency == 1:
+            self._results.append(_run_job((func, args, kwargs)))
+        else:
+            self._jobs.append((func, args, kwargs))
+
+    def results(self):
+        if self.concurrency == 1:
+            results, self._results = self._results, []
+            return results
+
+        jobs, self._jobs = self._jobs, []
+        if len(jobs) < 2:
+            return [_run_job(job) for job in jobs]
+
+        pool = ThreadPool(min(self.concurrency, len(jobs)))
+        try:
+            # map_async().get() with a timeout keeps Ctrl-C working on python 2
+            results = pool.map_async(_run_job, jobs).get(sys.maxint)
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+        return results
+
+
+class Progress(object):
+    """
+    thread-safe counter that logs a progress line with the rate at most every
+    `interval` seconds
+    """
+
+    def __init__(self, label, interval=1.0):
+        self.label = label
+        self.interval = interval
+        self.count = 0
+        self._start = self._last = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, n=1):
+        with self._lock:
+            self.count += n
+            now = time.time()
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        self._log(now)
+
+    def done(self):
+        self._log(time.time())
+
+    def _log(self, now):
+        elapsed = max(now - self._start, 0.001)
+        log.info('%s: %s (%.1f/sec)' % (self.label, self.count, self.count / elapsed))
+
+
+def setup_rs(rs_username=None, rs_api_key=None, auth_cache=None):
     """
-    set up rackspace_monitoring, prompt for key/secret if not configured
+    set up rackspace_monitoring, prompt for key/secret if not configured. with
+    auth_cache (a path), the auth token is reused until it expires
     """
     from rackspace_monitoring.providers import get_driver
     from rackspace_monitoring.types import Provider
@@ -97,7 +279,11 @@ def setup_rs(rs_username=None, rs_api_key=None):
         rs_api_key = get_input("Rackspace API Key: ", hidden=True)
 
     try:
-        driver = get_driver(Provider.RACKSPACE)(rs_username, rs_api_key)
+        # build written objects from what we sent instead of fetching them again,
+        # and pace requests against the account's rate limits
+        driver = get_driver(Provider.RACKSPACE)(rs_username, rs_api_key, ex_refetch=False, ex_rate_limit=True,
+                                                ex_auth_cache=auth_cache and os.path.expanduser(auth_cache))
+        log.debug('Rackspace API requests left in this window: %s' % driver.connection.rate_limiter.remaining())
         return driver
     except Exception as e:
         sys.stderr.write('Failed to initialize Rackspace API.\n')
@@ -105,18 +291,31 @@ def setup_rs(rs_username=None, rs_api_key=None):
         sys.exit(1)
 
 
-def setup_ck(ck_oauth_key=None, ck_oauth_secret=None):
+def setup_ck(ck_oauth_key=None, ck_oauth_secret=None, snapshot=None, sync=True):
     """
-    set up cloudkick-py, prompt for key/secret if not configured
+    set up cloudkick-py, prompt for key/secret if not configured. with
+    snapshot (a path), the account is synced into a local snapshot and read
+    from there. with sync=False, the snapshot is only read
     """
     from cloudkick_api.wrapper import CloudkickApi
+    from cloudkick_snapshot import CloudkickSnapshot
 
     if not ck_oauth_key:
         ck_oauth_key = get_input("Cloudkick OAuth Key: ")
     if not ck_oauth_secret:
         ck_oauth_secret = get_input("Cloudkick OAuth Secret: ", hidden=True)
 
-    return CloudkickApi(ck_oauth_key, ck_oauth_secret)
+    ck = CloudkickApi(ck_oauth_key, ck_oauth_secret)
+    if snapshot:
+        ck_snapshot = CloudkickSnapshot(os.path.expanduser(snapshot))
+        if sync:
+            ck_snapshot.sync(ck.conn)
+            ck_snapshot.save()
+        elif ck_snapshot.synced_at is None:
+            log.error('Cloudkick snapshot %s has never been synced, run once without --shard first' % snapshot)
+            sys.exit(1)
+        ck.use_snapshot(ck_snapshot)
+    return ck
 
 
 def get_config(config_file):